@@ -0,0 +1,214 @@
+"""Asyncio front-end.
+
+    async with AsyncDownloader(limit=8, output_path='~/Videos') as client:
+        result = await client.download(url, timeout=600)
+        async for event in client.stream(url, quality='audio'):
+            print(event['event'], event)
+
+download_async() and download_stream() do the same on a shared client.
+
+Downloads run on a thread pool of `limit` workers that share one session
+pool (see downloader.py). Jobs beyond the limit wait in the pool's queue as
+plain work items, so one event loop can queue thousands of them without a
+thread each. Events are those of worker mode (see events.py), with the
+job's console output as 'log' events; a stream ends after its 'done' or
+'error' event.
+
+Cancelling the awaiting task, or running past `timeout` seconds (the
+queue does not count), stops the job. A queued job never starts, and a
+running one aborts at its next progress update. Extraction or an ffmpeg
+run that is already under way is not interrupted, and its worker stays
+busy until it returns.
+"""
+
+import asyncio
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic
+
+from yt_dlp.utils import DownloadCancelled
+
+from batch import LineOutput, ThreadRouter
+from downloader import DownloadResult, Downloader
+from events import JobEvents
+
+# Downloads running at once; any more wait in the queue
+DEFAULT_LIMIT = int(os.environ.get('L1GHT_ASYNC_LIMIT', '8'))
+
+TERMINAL_EVENTS = ('done', 'error')
+
+
+class CancellableEvents(JobEvents):
+    """JobEvents whose yt-dlp hooks abort the download once cancel() is called"""
+
+    def __init__(self, emit, job_id=None):
+        super().__init__(emit, job_id)
+        self.cancelled = threading.Event()
+        self.reason = None
+
+    def cancel(self, reason='Cancelled'):
+        self.reason = self.reason or reason
+        self.cancelled.set()
+
+    def check(self):
+        if self.cancelled.is_set():
+            raise DownloadCancelled(self.reason)
+
+    def progress_hook(self, d):
+        self.check()
+        super().progress_hook(d)
+
+    def postprocessor_hook(self, d):
+        self.check()
+        super().postprocessor_hook(d)
+
+
+class AsyncDownloader:
+    """Runs downloads for an event loop on a bounded pool of threads
+
+    `output_path`, `quality` and `options` are the defaults of every
+    download (see downloader.Downloader).
+    """
+
+    def __init__(self, limit=DEFAULT_LIMIT, output_path=None, quality='best', **options):
+        self.limit = limit
+        self.downloader = Downloader(output_path, quality, workers=limit, **options)
+        self.executor = ThreadPoolExecutor(max_workers=limit, thread_name_prefix='download')
+        self.lock = threading.Lock()
+        self.jobs = 0
+        self.consoles = None  # (stdout, stderr) replaced by thread routers
+
+    def route(self, output):
+        """Send this thread's console output to `output`, or back to the console with None"""
+        with self.lock:
+            if self.consoles is None:
+                self.consoles = (sys.stdout, sys.stderr)
+                sys.stdout, sys.stderr = (stream if isinstance(stream, ThreadRouter) else ThreadRouter(stream)
+                                          for stream in self.consoles)
+            routers = (sys.stdout, sys.stderr)
+        for router in routers:
+            if isinstance(router, ThreadRouter):
+                router.route(output)
+
+    def run(self, events, url, quality, output_path, options, started):
+        """Worker thread: one download, reported entirely as events"""
+        started()
+        output = LineOutput(events.log)
+        self.route(output)
+        try:
+            result = self.downloader.download(url, quality, output_path, events=events, **options)
+        finally:
+            output.flush()
+            self.route(None)
+        if result.ok:
+            events.done(result.filepath)
+        else:
+            events.error(events.reason or result.error)
+        return result
+
+    async def download(self, url, quality=None, output_path=None, timeout=None, on_event=None, **options):
+        """Download `url` and return its DownloadResult
+
+        on_event(event) is called on the event loop for each event of the
+        job. A timeout returns a failed result; cancelling the task raises
+        CancelledError as usual.
+        """
+        loop = asyncio.get_running_loop()
+        quality = quality or self.downloader.quality
+        output_path = output_path or self.downloader.output_path
+        with self.lock:
+            self.jobs += 1
+            job_id = str(self.jobs)
+        closed = []  # set once the caller has been given the job's outcome
+
+        def emit(event):
+            if on_event is not None and not closed:
+                loop.call_soon_threadsafe(on_event, event)
+
+        events = CancellableEvents(emit, job_id)
+        started = loop.create_future()
+
+        def mark_started():
+            loop.call_soon_threadsafe(lambda: started.done() or started.set_result(monotonic()))
+
+        job = loop.run_in_executor(self.executor, self.run, events, url, quality, output_path,
+                                   options, mark_started)
+        try:
+            await started
+            return await asyncio.wait_for(asyncio.shield(job), timeout)
+        except asyncio.TimeoutError:
+            reason = f"Timed out after {timeout}s"
+            events.cancel(reason)
+            closed.append(True)
+            if on_event is not None:
+                on_event({'event': 'error', 'id': job_id, 'message': reason,
+                          'elapsed': round(monotonic() - events.started, 3)})
+            return DownloadResult(url, quality, output_path, error=reason)
+        except asyncio.CancelledError:
+            # A queued job is dropped from the queue; a running one stops at
+            # its next progress update
+            events.cancel()
+            closed.append(True)
+            job.cancel()
+            raise
+
+    async def stream(self, url, quality=None, output_path=None, timeout=None, **options):
+        """Download `url`, yielding its events as they happen
+
+        Leaving the loop early cancels the download.
+        """
+        queue = asyncio.Queue()
+        task = asyncio.ensure_future(self.download(url, quality, output_path, timeout,
+                                                   on_event=queue.put_nowait, **options))
+        task.add_done_callback(lambda _: queue.put_nowait(None))
+        try:
+            while True:
+                event = await queue.get()
+                if event is None:
+                    break
+                yield event
+                if event['event'] in TERMINAL_EVENTS:
+                    break
+        finally:
+            if not task.done():
+                task.cancel()
+
+    def close(self):
+        """Wait for running downloads, then release the sessions and the console"""
+        self.executor.shutdown(wait=True)
+        self.downloader.close()
+        with self.lock:
+            if self.consoles is not None:
+                sys.stdout, sys.stderr = self.consoles
+                self.consoles = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
+
+
+_shared_client = None
+_shared_lock = threading.Lock()
+
+
+def shared_client():
+    """Process-wide AsyncDownloader with the default limit"""
+    global _shared_client
+    with _shared_lock:
+        if _shared_client is None:
+            _shared_client = AsyncDownloader()
+        return _shared_client
+
+
+async def download_async(url, quality=None, output_path=None, timeout=None, **options):
+    """Download `url` on the shared client; see AsyncDownloader.download"""
+    return await shared_client().download(url, quality, output_path, timeout, **options)
+
+
+def download_stream(url, quality=None, output_path=None, timeout=None, **options):
+    """Async iterator over the events of downloading `url` on the shared client"""
+    return shared_client().stream(url, quality, output_path, timeout, **options)
@@ -0,0 +1,135 @@
+"""Index of videos that have already been downloaded.
+
+Entries are keyed by extractor, video ID and quality profile and live in an
+indexed SQLite table, so a lookup stays a single B-tree probe with 100k+
+entries instead of a scan of a text file. download_video checks the
+archive with an ID derived from the URL alone, so known videos are skipped
+before any network request.
+
+The import/export format is the one yt-dlp's --download-archive uses: one
+"<extractor> <id>" pair per line.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+from paths import data_path
+
+
+class DownloadArchive:
+    """Persistent set of (extractor, video id, quality) downloads"""
+
+    def __init__(self, path=None):
+        self.path = str(path or data_path('archive.sqlite3'))
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        with self.db:
+            self.db.execute(
+                'CREATE TABLE IF NOT EXISTS archive ('
+                ' extractor TEXT NOT NULL, video_id TEXT NOT NULL, quality TEXT NOT NULL,'
+                ' title TEXT, filepath TEXT, added REAL NOT NULL,'
+                ' PRIMARY KEY (extractor, video_id, quality)) WITHOUT ROWID')
+
+    def __len__(self):
+        with self.lock:
+            return self.db.execute('SELECT COUNT(*) FROM archive').fetchone()[0]
+
+    def lookup(self, extractor, video_id, quality):
+        """(title, filepath) of a recorded download, or None"""
+        with self.lock:
+            return self.db.execute(
+                'SELECT title, filepath FROM archive'
+                ' WHERE extractor = ? AND video_id = ? AND quality = ?',
+                (extractor.lower(), video_id, quality)).fetchone()
+
+    def contains(self, extractor, video_id, quality):
+        """True if the video was downloaded and its file (if known) still exists"""
+        row = self.lookup(extractor, video_id, quality)
+        if row is None:
+            return False
+        filepath = row[1]
+        return not filepath or os.path.exists(filepath)
+
+    def add(self, extractor, video_id, quality, title=None, filepath=None):
+        with self.lock, self.db:
+            self.db.execute(
+                'INSERT OR REPLACE INTO archive VALUES (?, ?, ?, ?, ?, ?)',
+                (extractor.lower(), video_id, quality, title, filepath, time.time()))
+
+    def remove(self, extractor, video_id, quality=None):
+        with self.lock, self.db:
+            if quality is None:
+                cursor = self.db.execute(
+                    'DELETE FROM archive WHERE extractor = ? AND video_id = ?',
+                    (extractor.lower(), video_id))
+            else:
+                cursor = self.db.execute(
+                    'DELETE FROM archive WHERE extractor = ? AND video_id = ? AND quality = ?',
+                    (extractor.lower(), video_id, quality))
+            return cursor.rowcount
+
+    def import_file(self, path, quality):
+        """Add every "<extractor> <id>" line of a yt-dlp archive file"""
+        now = time.time()
+        rows = []
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 2:
+                    rows.append((parts[0].lower(), parts[1], quality, None, None, now))
+
+        with self.lock, self.db:
+            before = self.db.total_changes
+            self.db.executemany('INSERT OR IGNORE INTO archive VALUES (?, ?, ?, ?, ?, ?)', rows)
+            return self.db.total_changes - before
+
+    def export_file(self, path, quality=None):
+        """Write entries (optionally of one quality) as a yt-dlp archive file"""
+        query = 'SELECT DISTINCT extractor, video_id FROM archive'
+        params = ()
+        if quality is not None:
+            query += ' WHERE quality = ?'
+            params = (quality,)
+
+        with self.lock:
+            rows = self.db.execute(query + ' ORDER BY added', params).fetchall()
+        with open(path, 'w', encoding='utf-8') as f:
+            for extractor, video_id in rows:
+                f.write(f"{extractor} {video_id}\n")
+        return len(rows)
+
+    def prune(self, older_than=None, missing_files=False):
+        """Drop entries older than `older_than` seconds and/or whose file is gone"""
+        removed = 0
+        with self.lock, self.db:
+            if older_than is not None:
+                removed += self.db.execute(
+                    'DELETE FROM archive WHERE added < ?', (time.time() - older_than,)).rowcount
+
+            if missing_files:
+                rows = self.db.execute(
+                    'SELECT extractor, video_id, quality, filepath FROM archive'
+                    ' WHERE filepath IS NOT NULL').fetchall()
+                gone = [row[:3] for row in rows if not os.path.exists(row[3])]
+                self.db.executemany(
+                    'DELETE FROM archive WHERE extractor = ? AND video_id = ? AND quality = ?', gone)
+                removed += len(gone)
+        return removed
+
+    def close(self):
+        self.db.close()
+
+
+_shared_archive = None
+_shared_lock = threading.Lock()
+
+
+def shared_archive():
+    """Process-wide DownloadArchive at the default location"""
+    global _shared_archive
+    with _shared_lock:
+        if _shared_archive is None:
+            _shared_archive = DownloadArchive()
+        return _shared_archive
@@ -0,0 +1,196 @@
+"""Streaming audio extraction.
+
+The regular audio path downloads the whole `bestaudio` file and only
+then runs FFmpegExtractAudio over it to re-encode it: two full passes
+over the disk, and the whole transcode happens after the last byte
+arrived. When the chosen audio format is a single HTTP stream in a
+container ffmpeg can read sequentially, stream_transcode() instead pipes
+the bytes into an ffmpeg encoder as they arrive. The transcode overlaps
+the transfer and only the final file is written.
+
+A format that must be fetched in pieces (YouTube throttles single
+requests for a whole file; its extractor sets downloader_options'
+http_chunk_size for that) is requested in ranged chunks of that size, one
+after the other, exactly as yt-dlp's HTTP downloader would.
+
+Everything else (HLS/DASH fragments, an MP4 whose index sits at the end of
+the file, no ffmpeg) goes the regular way, and so does a stream that fails
+half way.
+"""
+
+import os
+import re
+import subprocess
+from time import monotonic
+
+from yt_dlp.postprocessor.ffmpeg import FFmpegPostProcessor
+
+try:
+    from yt_dlp.networking import Request
+except ImportError:  # yt-dlp before 2023.10
+    from urllib.request import Request
+
+AUDIO_QUALITY = '192'
+
+# Target audio format -> (ffmpeg encoder, ffmpeg muxer)
+AUDIO_ENCODERS = {
+    'mp3': ('libmp3lame', 'mp3'),
+    'm4a': ('aac', 'ipod'),
+    'opus': ('libopus', 'opus'),
+    'vorbis': ('libvorbis', 'ogg'),
+    'flac': ('flac', 'flac'),
+}
+
+# Containers ffmpeg can decode from a pipe without seeking
+STREAMABLE_EXTS = ('webm', 'weba', 'ogg', 'opus', 'mp3', 'aac', 'flac', 'wav')
+
+CHUNK_SIZE = 64 * 1024
+
+
+class StreamingUnavailable(Exception):
+    """The audio could not be streamed; use the regular download path"""
+
+
+def ffmpeg_executable(ydl):
+    """Path of the ffmpeg binary yt-dlp would use, or None"""
+    ffmpeg = FFmpegPostProcessor(ydl)
+    return ffmpeg.executable if ffmpeg.available else None
+
+
+def streamable(fmt):
+    """Why the selected format can't be streamed, or None if it can"""
+    if fmt.get('requested_formats'):
+        return "merged formats"
+    if fmt.get('fragments') or fmt.get('protocol') not in ('http', 'https'):
+        return f"{fmt.get('protocol') or 'unknown'} protocol"
+    ext = fmt.get('ext')
+    # YouTube's DASH m4a is fragmented MP4 and fine to read front to back
+    if ext in ('m4a', 'mp4') and str(fmt.get('container', '')).endswith('_dash'):
+        return None
+    if ext not in STREAMABLE_EXTS:
+        return f"{ext} container needs seeking"
+    return None
+
+
+def read_blocks(response, block_size):
+    while True:
+        block = response.read(block_size)
+        if not block:
+            return
+        yield block
+
+
+def iter_stream(ydl, info, status, block_size):
+    """Yield the bytes of the format's URL, in ranged requests if it has a chunk size
+
+    status['total_bytes'] is updated from the responses as they arrive.
+    """
+    headers = info.get('http_headers') or {}
+    chunk_size = ((info.get('downloader_options') or {}).get('http_chunk_size')
+                  or ydl.params.get('http_chunk_size'))
+    if not chunk_size:
+        response = ydl.urlopen(Request(info['url'], headers=headers))
+        length = response.headers.get('Content-Length')
+        if length and length.isdigit():
+            status['total_bytes'] = int(length)
+        yield from read_blocks(response, block_size)
+        return
+
+    start = 0
+    while True:
+        end = start + chunk_size - 1
+        response = ydl.urlopen(Request(info['url'], headers=dict(headers, Range=f'bytes={start}-{end}')))
+        content_range = re.match(r'bytes (\d+)-(\d+)/(\d+|\*)', response.headers.get('Content-Range') or '')
+        if content_range is None:
+            if start:
+                raise StreamingUnavailable("server ignored the range request")
+            # The whole file in one response after all
+            length = response.headers.get('Content-Length')
+            if length and length.isdigit():
+                status['total_bytes'] = int(length)
+            yield from read_blocks(response, block_size)
+            return
+        if int(content_range.group(1)) != start:
+            raise StreamingUnavailable(f"server sent range {content_range.group(1)}-, not {start}-")
+        if content_range.group(3) != '*':
+            status['total_bytes'] = int(content_range.group(3))
+
+        received = 0
+        for block in read_blocks(response, block_size):
+            received += len(block)
+            yield block
+        start += received
+        total = status['total_bytes']
+        if not received or (total and start >= total) or (not total and received < chunk_size):
+            return
+
+
+def stream_transcode(ydl, info, filepath, codec='mp3'):
+    """Download the selected format of `info`, encoded as `codec`, into filepath
+
+    `info` is the processed info dict (format already selected). The
+    ydl's progress hooks see the transfer like a regular download. Raises
+    StreamingUnavailable if nothing usable was written.
+    """
+    executable = ffmpeg_executable(ydl)
+    if not executable:
+        raise StreamingUnavailable("ffmpeg not found")
+    reason = streamable(info)
+    if reason:
+        raise StreamingUnavailable(reason)
+
+    encoder, muxer = AUDIO_ENCODERS[codec]
+    temp_path = filepath + '.part'
+    command = [
+        executable, '-hide_banner', '-nostdin', '-loglevel', 'error', '-y',
+        '-i', 'pipe:0', '-vn', '-c:a', encoder,
+    ]
+    if codec != 'flac':
+        command += ['-b:a', f'{AUDIO_QUALITY}k']
+    command += ['-f', muxer, temp_path]
+    ffmpeg = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    status = {
+        'status': 'downloading', 'filename': filepath, 'tmpfilename': temp_path,
+        'downloaded_bytes': 0, 'total_bytes': info.get('filesize') or info.get('filesize_approx'),
+        'info_dict': info,
+    }
+    started = monotonic()
+
+    def report(**fields):
+        status.update(fields, elapsed=monotonic() - started)
+        # The same hooks yt-dlp's own downloaders call
+        for hook in ydl._progress_hooks:
+            hook(dict(status))
+
+    try:
+        block_size = ydl.params.get('buffersize') or CHUNK_SIZE
+        for block in iter_stream(ydl, info, status, block_size):
+            # A slow encoder blocks this write, which slows the transfer down
+            ffmpeg.stdin.write(block)
+            downloaded = status['downloaded_bytes'] + len(block)
+            elapsed = monotonic() - started
+            speed = downloaded / elapsed if elapsed > 0 else None
+            total = status['total_bytes']
+            report(downloaded_bytes=downloaded, speed=speed,
+                   eta=(total - downloaded) / speed if total and speed else None)
+        ffmpeg.stdin.close()
+        errors = ffmpeg.stderr.read().decode('utf-8', 'replace').strip()
+        if ffmpeg.wait() != 0:
+            raise StreamingUnavailable(f"ffmpeg failed: {errors.splitlines()[-1] if errors else ffmpeg.returncode}")
+    except Exception as e:
+        ffmpeg.kill()
+        ffmpeg.wait()
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        if isinstance(e, StreamingUnavailable):
+            raise
+        if isinstance(e, BrokenPipeError):
+            # ffmpeg gave up on the input; its last error line says why
+            errors = ffmpeg.stderr.read().decode('utf-8', 'replace').strip()
+            raise StreamingUnavailable(f"ffmpeg failed: {errors.splitlines()[-1] if errors else e}") from e
+        raise StreamingUnavailable(str(e)) from e
+
+    os.replace(temp_path, filepath)
+    report(status='finished', total_bytes=status['downloaded_bytes'])
+    return filepath
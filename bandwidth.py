@@ -0,0 +1,254 @@
+"""Shared bandwidth limit for concurrent downloads.
+
+Without coordination one large `best` download takes whatever the link
+gives it and starves the others. BandwidthManager enforces one global cap
+(optionally different per time of day) and splits it fairly between the
+running jobs in proportion to their weight.
+
+Each job draws from its own token bucket. The bucket is drained from a
+yt-dlp progress hook, which runs on the downloading thread right after each
+block is written, so sleeping there holds the transfer back (the socket
+buffer fills up and TCP slows the sender down). Once a second the cap is
+re-divided by max-min fairness. A job that cannot use its whole share (a
+slow server, or extracting/merging) keeps only what it uses, and the rest
+goes to the others. A finished job's share is handed out immediately.
+
+The cap applies to the jobs of one process: a batch, a playlist or the
+GUI's worker.
+"""
+
+import os
+import threading
+import time
+from time import monotonic
+
+from yt_dlp.utils import parse_bytes
+
+# Relative weight of a job's fair share
+PRIORITIES = {'low': 0.5, 'normal': 1.0, 'high': 2.0}
+
+# Default cap (e.g. "5M") and time-of-day schedule (see parse_schedule)
+DEFAULT_RATE = os.environ.get('L1GHT_MAX_RATE')
+DEFAULT_SCHEDULE = os.environ.get('L1GHT_RATE_SCHEDULE')
+
+# How often shares are recomputed from the measured rates (seconds)
+REBALANCE_INTERVAL = 1.0
+# A bucket holds at most this many seconds of its rate, bounding bursts
+BURST_SECONDS = 0.5
+# A job using this much of its share is assumed to want more
+SATURATED = 0.9
+# An unsaturated job keeps this much headroom above what it used
+HEADROOM = 1.25
+# Every job keeps at least this rate so it can show it wants more
+MIN_RATE = 64 * 1024
+# Block size while throttled: small blocks keep the hook, and so the
+# limiter, running often enough to shape the rate smoothly
+THROTTLED_BUFFER = 64 * 1024
+
+
+def parse_rate(text):
+    """Bytes per second from '500K', '2.5M', '1G', or None for 'unlimited'"""
+    if text is None or str(text).strip().lower() in ('', '0', 'none', 'unlimited', 'off'):
+        return None
+    rate = parse_bytes(str(text).strip())
+    if not rate:
+        raise ValueError(f"Invalid rate: {text}")
+    return rate
+
+
+def parse_schedule(text):
+    """Parse 'HH:MM-HH:MM=RATE' windows separated by commas
+
+    e.g. '09:00-18:00=2M,18:00-23:00=10M'. A window may wrap past midnight
+    and RATE may be 'unlimited'. Returns [(start_minute, end_minute, rate)].
+    """
+    windows = []
+    for part in (text or '').split(','):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            span, rate = part.split('=', 1)
+            start, end = (clock.strip().split(':') for clock in span.split('-', 1))
+            windows.append((int(start[0]) * 60 + int(start[1]),
+                            int(end[0]) * 60 + int(end[1]), parse_rate(rate)))
+        except ValueError:
+            raise ValueError(f"Invalid schedule window: {part!r} (expected HH:MM-HH:MM=RATE)")
+    return windows
+
+
+def format_rate(rate):
+    return "unlimited" if rate is None else f"{rate/1024/1024:.2f}MiB/s"
+
+
+class JobShare:
+    """One job's slice of the bandwidth and its token bucket"""
+
+    def __init__(self, name, weight):
+        self.name = name
+        self.weight = weight
+        self.rate = None  # allotted bytes/s, None while unlimited
+        self.tokens = 0.0
+        self.stamp = monotonic()
+        self.started = self.stamp
+        self.bytes = 0
+        self.window_bytes = 0
+        self.achieved = None  # rate measured over the last rebalance interval
+        self.offsets = {}
+
+    @property
+    def average(self):
+        elapsed = monotonic() - self.started
+        return self.bytes / elapsed if elapsed > 0 else 0.0
+
+
+class BandwidthManager:
+    """Global cap (and schedule) shared fairly by weighted jobs"""
+
+    def __init__(self, rate=None, schedule=None):
+        self.rate = parse_rate(rate) if isinstance(rate, str) else rate
+        self.schedule = parse_schedule(schedule) if isinstance(schedule, str) else list(schedule or [])
+        self.jobs = []
+        self.rebalanced = monotonic()
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.rate is not None or bool(self.schedule)
+
+    def configure(self, rate=None, schedule=None):
+        """Replace the cap and/or schedule, e.g. from command-line flags"""
+        with self.lock:
+            if rate is not None:
+                self.rate = parse_rate(rate)
+            if schedule is not None:
+                self.schedule = parse_schedule(schedule)
+            self.rebalance(monotonic())
+
+    def current_cap(self):
+        """Cap in force right now: the matching schedule window, else the default"""
+        now = time.localtime()
+        minute = now.tm_hour * 60 + now.tm_min
+        for start, end, rate in self.schedule:
+            if start <= end and start <= minute < end or start > end and (minute >= start or minute < end):
+                return rate
+        return self.rate
+
+    def register(self, name, weight=1.0):
+        with self.lock:
+            share = JobShare(name, weight)
+            self.jobs.append(share)
+            self.rebalance(monotonic())
+            return share
+
+    def unregister(self, share):
+        """Remove a finished job and hand its share to the others"""
+        with self.lock:
+            if share in self.jobs:
+                self.jobs.remove(share)
+                self.rebalance(monotonic())
+
+    def rebalance(self, now):
+        # Called with the lock held: water-fill the cap by weight, capping
+        # jobs that do not use their share at what they need
+        elapsed = now - self.rebalanced
+        if elapsed >= REBALANCE_INTERVAL / 2:
+            # Jobs joining or leaving rebalance early; a window that short
+            # says nothing about how much a job can use, so keep the last one
+            self.rebalanced = now
+            for share in self.jobs:
+                share.achieved = share.window_bytes / elapsed
+                share.window_bytes = 0
+
+        cap = self.current_cap()
+        if cap is None:
+            for share in self.jobs:
+                share.rate = None
+            return
+
+        def demand(share):
+            if share.rate is None or share.achieved is None or share.achieved >= share.rate * SATURATED:
+                return float('inf')
+            return max(MIN_RATE, share.achieved * HEADROOM)
+
+        remaining = cap
+        pending = list(self.jobs)
+        while pending:
+            weights = sum(share.weight for share in pending)
+            modest = [share for share in pending if demand(share) <= remaining * share.weight / weights]
+            if not modest:
+                for share in pending:
+                    self.allot(share, max(MIN_RATE, remaining * share.weight / weights))
+                break
+            for share in modest:
+                rate = demand(share)
+                self.allot(share, rate)
+                remaining -= rate
+                pending.remove(share)
+
+    def allot(self, share, rate):
+        # Refill at the old rate up to now before switching to the new one
+        now = monotonic()
+        if share.rate is not None:
+            share.tokens = min(share.rate * BURST_SECONDS, share.tokens + (now - share.stamp) * share.rate)
+        share.stamp = now
+        share.rate = rate
+
+    def throttle(self, share, nbytes):
+        """Account nbytes to the job, sleeping if it is over its share"""
+        with self.lock:
+            now = monotonic()
+            if now - self.rebalanced >= REBALANCE_INTERVAL:
+                self.rebalance(now)
+            share.bytes += nbytes
+            share.window_bytes += nbytes
+            if share.rate is None:
+                return 0.0
+            share.tokens = min(share.rate * BURST_SECONDS, share.tokens + (now - share.stamp) * share.rate)
+            share.stamp = now
+            share.tokens -= nbytes
+            wait = -share.tokens / share.rate if share.tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def progress_hook(self, share, ydl=None):
+        """yt-dlp progress hook that throttles the job's transfer
+
+        With `ydl`, its read blocks are kept small so the hook runs often.
+        """
+        if ydl is not None:
+            ydl.params['buffersize'] = THROTTLED_BUFFER
+            ydl.params['noresizebuffer'] = True
+
+        def hook(d):
+            if d['status'] != 'downloading':
+                return
+            filename = d.get('filename')
+            downloaded = d.get('downloaded_bytes') or 0
+            previous = share.offsets.get(filename)
+            share.offsets[filename] = downloaded
+            if previous is not None and downloaded > previous:
+                self.throttle(share, downloaded - previous)
+
+        return hook
+
+    def summary(self, share):
+        """Achieved rate of a job, for the end-of-job report"""
+        with self.lock:
+            rate = share.rate
+        return (f"{format_rate(share.average)} average over {share.bytes/1024/1024:.1f}MiB"
+                f" (weight {share.weight:g}, share at the end {format_rate(rate)})")
+
+
+_shared_bandwidth = None
+_shared_lock = threading.Lock()
+
+
+def shared_bandwidth():
+    """Process-wide BandwidthManager configured from L1GHT_MAX_RATE/L1GHT_RATE_SCHEDULE"""
+    global _shared_bandwidth
+    with _shared_lock:
+        if _shared_bandwidth is None:
+            _shared_bandwidth = BandwidthManager(DEFAULT_RATE, DEFAULT_SCHEDULE)
+        return _shared_bandwidth
@@ -0,0 +1,247 @@
+"""Concurrent batch downloads on a bounded worker pool.
+
+Every URL becomes a BatchJob that runs on a ThreadPoolExecutor. A failing
+job only marks itself as failed; the rest of the batch keeps going and a
+summary is printed at the end. Console output from each job is prefixed
+with its number so concurrent downloads stay readable.
+
+A download may hand its post-processing to a pipeline.PostProcessPool and
+return a Future: the worker is then free for the next URL, and the job
+only counts as finished once the Future is done.
+"""
+
+import io
+import sys
+import threading
+from time import monotonic
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from contextlib import redirect_stderr, redirect_stdout
+
+from pipeline import format_stages
+from progress import format_progress
+
+DEFAULT_WORKERS = 3
+
+
+class BatchJob:
+    """One URL (or playlist entry) in a batch and what happened to it"""
+
+    def __init__(self, number, item, url=None):
+        self.number = number
+        self.item = item
+        self.url = url or item
+        self.status = 'queued'
+        self.error = None
+        self.result = None  # what download(item) returned
+        self.started = None
+        self.finished = None
+        self.stages = {}  # seconds per pipeline stage, if the download reports them
+
+    @property
+    def duration(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or monotonic()) - self.started
+
+
+class ThreadRouter(io.TextIOBase):
+    """sys.stdout stand-in that sends each thread's writes to its own stream"""
+
+    def __init__(self, default):
+        super().__init__()
+        self.default = default
+        self.local = threading.local()
+
+    @property
+    def stream(self):
+        return getattr(self.local, 'stream', None) or self.default
+
+    def route(self, stream):
+        self.local.stream = stream
+
+    def write(self, text):
+        return self.stream.write(text)
+
+    def flush(self):
+        self.stream.flush()
+
+
+class LineOutput(io.TextIOBase):
+    """Line-buffered text stream that hands each complete line to a callback"""
+
+    def __init__(self, handle_line):
+        super().__init__()
+        self.handle_line = handle_line
+        self.buffer_text = ""
+        self.lock = threading.Lock()
+
+    def write(self, text):
+        with self.lock:
+            self.buffer_text += text
+            # yt-dlp rewrites its progress line with carriage returns
+            lines = self.buffer_text.replace('\r', '\n').split('\n')
+            self.buffer_text = lines.pop()
+            for line in lines:
+                if line.strip():
+                    self.handle_line(line)
+        return len(text)
+
+    def flush(self):
+        with self.lock:
+            if self.buffer_text.strip():
+                self.handle_line(self.buffer_text)
+            self.buffer_text = ""
+
+
+def read_urls(urls=(), files=()):
+    """Collect URLs from arguments and files ('-' reads stdin)
+
+    Blank lines and lines starting with '#' are ignored, and repeated URLs
+    are only queued once.
+    """
+    collected = list(urls)
+    for name in files:
+        if name == '-':
+            collected.extend(sys.stdin.read().splitlines())
+        else:
+            with open(name, encoding='utf-8') as f:
+                collected.extend(f.read().splitlines())
+
+    seen = set()
+    result = []
+    for url in collected:
+        url = url.strip()
+        if not url or url.startswith('#') or url in seen:
+            continue
+        seen.add(url)
+        result.append(url)
+    return result
+
+
+def run_batch(items, download, workers=DEFAULT_WORKERS, total=None, describe=None, progress=None):
+    """Run download(item) for every item on a pool of `workers` threads
+
+    items may be any iterable, including a lazy generator: it is only
+    advanced when a worker is free, so downloads start before the whole
+    input has been read. download is expected to raise on failure;
+    describe(item) gives the URL shown in status lines. Returns the list of
+    BatchJob objects in submission order once every job has finished.
+    With a single worker the jobs run inline on the calling thread.
+    download may also return a Future (see pipeline.py); the job is then
+    finished, and its result reported, when the Future completes.
+    With a progress.ProgressAggregator as `progress`, the combined progress
+    of the running jobs is printed as a status line every few seconds.
+    """
+    if total is None and hasattr(items, '__len__'):
+        total = len(items)
+
+    console = sys.stdout
+    lock = threading.Lock()
+    width = len(str(total)) if total else 1
+    jobs = []
+    pending = []  # post-processing still running
+
+    def status(message):
+        with lock:
+            console.write(message + "\n")
+            console.flush()
+
+    def prefixed(label):
+        return LineOutput(lambda line: status(f"{label} {line}"))
+
+    def finish(job, label, output, error=None, result=None):
+        job.finished = monotonic()
+        job.result = result
+        job.status = 'failed' if error is not None else 'done'
+        if error is not None:
+            job.error = str(error) or error.__class__.__name__
+        output.flush()
+        stages = f" ({format_stages(job.stages)})" if job.stages else ""
+        if job.status == 'done':
+            status(f"✅ {label} Finished in {job.duration:.1f}s{stages}: {job.url}")
+        else:
+            status(f"❌ {label} Failed after {job.duration:.1f}s: {job.url} ({job.error})")
+
+    def run(job, output):
+        label = f"[{job.number:>{width}}/{total or '?'}]"
+        if output is None:
+            output = prefixed(label)
+            router.route(output)
+        job.status = 'running'
+        job.started = monotonic()
+        status(f"▶️ {label} Starting {job.url}")
+        try:
+            result = download(job.item)
+        except Exception as e:
+            finish(job, label, output, e)
+            return job
+        finally:
+            router.route(None)
+
+        if not isinstance(result, Future):
+            finish(job, label, output, result=result)
+            return job
+        job.stages = getattr(result, 'timings', None) or {}
+        if not result.done():
+            job.status = 'postprocessing'
+            output.flush()
+            status(f"⚙️ {label} Downloaded in {job.duration:.1f}s, post-processing: {job.url}")
+        with lock:
+            pending.append(result)
+        result.add_done_callback(lambda future: finish(
+            job, label, output, future.exception(), None if future.exception() else future.result()))
+        return job
+
+    # Unrouted threads (e.g. the one walking a lazy playlist) share the
+    # console lock too, so their lines never interleave with the workers'
+    router = ThreadRouter(LineOutput(status))
+
+    def new_job(item):
+        job = BatchJob(len(jobs) + 1, item, describe(item) if describe else None)
+        jobs.append(job)
+        return job
+
+    if workers <= 1:
+        status(f"📋 Downloading {total or 'all'} item(s) one at a time")
+        for item in items:
+            run(new_job(item), console)
+        wait(pending)
+        return jobs
+
+    status(f"📋 Downloading {total or 'all'} item(s) on {workers} worker(s)")
+    if progress is not None:
+        previous_rollup = progress.on_rollup
+        progress.on_rollup = lambda rollup: status(
+            f"📶 [{rollup['jobs']} running] {format_progress(rollup)}")
+    # One slot per worker: the input is only read as fast as jobs complete
+    slots = threading.BoundedSemaphore(workers)
+    with redirect_stdout(router), redirect_stderr(router):
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for item in items:
+                slots.acquire()
+                future = pool.submit(run, new_job(item), None)
+                future.add_done_callback(lambda _: slots.release())
+        wait(pending)
+    router.default.flush()
+    if progress is not None:
+        progress.on_rollup = previous_rollup
+    return jobs
+
+
+def print_summary(jobs, elapsed):
+    """Print the final batch summary"""
+    done = [job for job in jobs if job.status == 'done']
+    failed = [job for job in jobs if job.status == 'failed']
+
+    print("=" * 50)
+    print(f"📊 Batch finished in {elapsed:.1f}s: {len(done)} succeeded, {len(failed)} failed")
+    for job in failed:
+        print(f"  ❌ {job.url}: {job.error}")
+
+    # Stages overlap between jobs, so their sum may exceed the batch's time
+    totals = {}
+    for job in jobs:
+        for name, seconds in job.stages.items():
+            totals[name] = totals.get(name, 0.0) + seconds
+    if totals:
+        print(f"⏱️ Time per stage, summed over jobs: {format_stages(totals)}")
@@ -0,0 +1,678 @@
+"""Offline benchmark suite.
+
+Runs the real download path against a local HTTP server, so results do not
+depend on YouTube or the network:
+
+    MediaServer   serves synthetic media: a progressive MP4, DASH segments
+                  and an HLS playlist, each with a configurable per-request
+                  latency and per-connection bandwidth
+    BenchIE       stub extractor for bench://host:port/<kind>/<id> URLs; it
+                  fetches the video's metadata (formats pointing back at the
+                  server) from the server like a real extractor would
+
+Measured: startup (importing main), extraction latency, single-stream
+throughput per protocol, batch throughput by concurrency, post-processing
+time (merge and audio transcode; these need ffmpeg and are skipped without
+it), and the disk write path: plain unbuffered writes (the default)
+against buffered and preallocated writes, a scratch folder and adaptive
+HTTP chunks, by throughput and by writes reaching the file. Results are
+written as JSON together with a flat `metrics` dict. Pass an earlier
+result as --baseline to see what changed; the exit code is 1 if any metric
+got worse by more than --tolerance.
+
+    python benchmark.py --output bench.json
+    python benchmark.py --quick --baseline bench.json
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager, redirect_stderr, redirect_stdout
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from time import monotonic
+
+import yt_dlp
+from yt_dlp.extractor.common import InfoExtractor
+from yt_dlp.postprocessor.ffmpeg import FFmpegPostProcessor
+from yt_dlp.utils import parse_bytes
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SUITE_VERSION = 1
+BENCHMARKS = ('startup', 'extraction', 'throughput', 'batch', 'postprocess', 'diskio')
+KINDS = ('progressive', 'dash', 'hls')
+
+# One block of filler repeated for every synthetic file
+BLOCK = bytes(range(256)) * 256
+WRITE_SIZE = 16 * 1024
+SEGMENT_SECONDS = 2.0
+
+
+class MediaServer:
+    """Local HTTP server for synthetic media with latency and bandwidth limits
+
+    `latency` (seconds) delays every response, `bandwidth` (bytes/s, None
+    for unlimited) caps every connection. Files in `media_dir` are served
+    under /media/ as they are.
+    """
+
+    def __init__(self, size=8 * 1024 * 1024, segment_size=512 * 1024, latency=0.0,
+                 bandwidth=None, media_dir=None):
+        self.size = size
+        self.segment_size = segment_size
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.media_dir = media_dir
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.httpd = None
+
+    @property
+    def host(self):
+        return f"127.0.0.1:{self.httpd.server_address[1]}"
+
+    def url(self, kind, video_id):
+        """Page URL of a video, for BenchIE"""
+        return f"bench://{self.host}/{kind}/{video_id}"
+
+    def start(self):
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), MediaHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.media = self
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    @property
+    def segments(self):
+        return max(1, -(-self.size // self.segment_size))
+
+    def metadata(self, kind, video_id):
+        """Info dict of a video, as the extractor returns it"""
+        base = f"http://{self.host}"
+        info = {
+            'id': video_id,
+            'title': f"{kind}-{video_id}",
+            'duration': self.segments * SEGMENT_SECONDS,
+        }
+        if kind == 'progressive':
+            info['formats'] = [{
+                'format_id': '18', 'url': f"{base}/progressive/{video_id}.mp4", 'ext': 'mp4',
+                'vcodec': 'avc1.42001E', 'acodec': 'mp4a.40.2', 'height': 360, 'filesize': self.size,
+            }]
+        elif kind == 'dash':
+            info['formats'] = [{
+                'format_id': 'dash-720', 'url': f"{base}/dash/{video_id}/manifest.mpd", 'ext': 'mp4',
+                'protocol': 'http_dash_segments', 'fragment_base_url': f"{base}/dash/{video_id}/",
+                'fragments': [{'path': f"seg{i}.m4s", 'duration': SEGMENT_SECONDS}
+                              for i in range(self.segments)],
+                'vcodec': 'avc1.4d401f', 'acodec': 'mp4a.40.2', 'height': 720,
+                'filesize_approx': self.size,
+            }]
+        elif kind == 'hls':
+            info['formats'] = [{
+                'format_id': 'hls-720', 'url': f"{base}/hls/{video_id}/index.m3u8", 'ext': 'mp4',
+                'protocol': 'm3u8_native', 'vcodec': 'avc1.4d401f', 'acodec': 'mp4a.40.2',
+                'height': 720,
+            }]
+        elif kind == 'merge':
+            info['formats'] = [
+                {'format_id': 'video', 'url': f"{base}/media/video.mp4", 'ext': 'mp4',
+                 'vcodec': 'avc1.42001E', 'acodec': 'none', 'height': 360},
+                {'format_id': 'audio', 'url': f"{base}/media/audio.m4a", 'ext': 'm4a',
+                 'vcodec': 'none', 'acodec': 'mp4a.40.2', 'abr': 128},
+            ]
+        elif kind == 'audio':
+            info['formats'] = [
+                {'format_id': 'audio', 'url': f"{base}/media/audio.m4a", 'ext': 'm4a',
+                 'vcodec': 'none', 'acodec': 'mp4a.40.2', 'abr': 128},
+            ]
+        else:
+            return None
+        return info
+
+    def playlist(self, video_id):
+        lines = ['#EXTM3U', '#EXT-X-VERSION:3', f'#EXT-X-TARGETDURATION:{int(SEGMENT_SECONDS)}',
+                 '#EXT-X-MEDIA-SEQUENCE:0']
+        for i in range(self.segments):
+            lines += [f'#EXTINF:{SEGMENT_SECONDS:.1f},', f'seg{i}.ts']
+        return '\n'.join(lines + ['#EXT-X-ENDLIST', ''])
+
+    def segment_length(self, index):
+        if index >= self.segments:
+            return None
+        return min(self.segment_size, self.size - index * self.segment_size)
+
+
+class MediaHandler(BaseHTTPRequestHandler):
+    """Routes requests of a MediaServer"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        media = self.server.media
+        with media.lock:
+            media.requests += 1
+        if media.latency:
+            time.sleep(media.latency)
+
+        path = self.path.split('?')[0]
+        match = re.fullmatch(r'/meta/(\w+)/(\w+)\.json', path)
+        if match:
+            info = media.metadata(*match.groups())
+            if info is None:
+                return self.send_error(404)
+            return self.send_body(json.dumps(info).encode(), 'application/json')
+
+        match = re.fullmatch(r'/progressive/\w+\.mp4', path)
+        if match:
+            return self.send_filler(media.size, 'video/mp4')
+
+        match = re.fullmatch(r'/(dash|hls)/\w+/seg(\d+)\.(?:m4s|ts)', path)
+        if match:
+            length = media.segment_length(int(match.group(2)))
+            if length is None:
+                return self.send_error(404)
+            return self.send_filler(length, 'video/mp4')
+
+        match = re.fullmatch(r'/hls/(\w+)/index\.m3u8', path)
+        if match:
+            return self.send_body(media.playlist(match.group(1)).encode(), 'application/vnd.apple.mpegurl')
+
+        match = re.fullmatch(r'/media/([\w.]+)', path)
+        if match and media.media_dir and os.path.isfile(os.path.join(media.media_dir, match.group(1))):
+            with open(os.path.join(media.media_dir, match.group(1)), 'rb') as f:
+                data = f.read()
+            return self.send_filler(len(data), 'application/octet-stream', data)
+
+        self.send_error(404)
+
+    def send_body(self, body, content_type):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_filler(self, size, content_type, data=None):
+        """Send `size` bytes (of `data`, or filler), honouring Range and the bandwidth cap"""
+        start, end = 0, size - 1
+        match = re.fullmatch(r'bytes=(\d*)-(\d*)', self.headers.get('Range') or '')
+        if match and match.group(1):
+            start = int(match.group(1))
+            end = min(end, int(match.group(2))) if match.group(2) else end
+            if start >= size:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{size}')
+                self.send_header('Content-Length', '0')
+                return self.end_headers()
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+
+        bandwidth = self.server.media.bandwidth
+        sent = 0
+        began = monotonic()
+        offset = start
+        try:
+            while offset <= end:
+                length = min(WRITE_SIZE, end - offset + 1)
+                if data is not None:
+                    chunk = data[offset:offset + length]
+                else:
+                    position = offset % len(BLOCK)
+                    chunk = (BLOCK[position:] + BLOCK)[:length]
+                self.wfile.write(chunk)
+                offset += length
+                sent += length
+                if bandwidth:
+                    ahead = sent / bandwidth - (monotonic() - began)
+                    if ahead > 0:
+                        time.sleep(ahead)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+class BenchIE(InfoExtractor):
+    """Extractor for MediaServer videos: bench://host:port/<kind>/<id>"""
+
+    _VALID_URL = r'bench://(?P<host>[^/]+)/(?P<kind>\w+)/(?P<id>\w+)'
+
+    def _real_extract(self, url):
+        host, kind, video_id = self._match_valid_url(url).group('host', 'kind', 'id')
+        return self._download_json(f"http://{host}/meta/{kind}/{video_id}.json", video_id)
+
+
+class BenchYoutubeDL(yt_dlp.YoutubeDL):
+    """YoutubeDL that only knows BenchIE
+
+    The synthetic files are not real media, so fixups that would run
+    ffmpeg over them are turned off.
+    """
+
+    def __init__(self, params=None, auto_init=True):
+        params = dict(params or {}, fixup='never')
+        super().__init__(params, auto_init=False)
+        self.add_info_extractor(BenchIE())
+
+
+@contextmanager
+def bench_downloader():
+    """Make main.download_video use BenchYoutubeDL"""
+    original = yt_dlp.YoutubeDL
+    yt_dlp.YoutubeDL = BenchYoutubeDL
+    try:
+        yield
+    finally:
+        yt_dlp.YoutubeDL = original
+
+
+@contextmanager
+def silenced():
+    """Swallow the downloader's console output while timing it"""
+    sink = io.StringIO()
+    with redirect_stdout(sink), redirect_stderr(sink):
+        yield sink
+
+
+def summarize(samples):
+    ordered = sorted(samples)
+    return {
+        'median': statistics.median(ordered),
+        'min': ordered[0],
+        'max': ordered[-1],
+        'p95': ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))],
+        'runs': len(ordered),
+    }
+
+
+def mib_per_s(nbytes, seconds):
+    return nbytes / 1024 / 1024 / seconds if seconds > 0 else None
+
+
+class WriteCounter:
+    """Counts the writes that reach a downloaded file"""
+
+    def __init__(self, stream, counts):
+        self.stream = stream
+        self.counts = counts
+
+    def write(self, data):
+        self.counts.append(len(data))
+        return self.stream.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+def counting_disk_io(**settings):
+    """A DiskIO that records the size of every write to its files in `.counts`"""
+    from diskio import DiskIO
+
+    class CountingDiskIO(DiskIO):
+        def wraps_writes(self):
+            return True
+
+        def wrap(self, stream, filename):
+            return super().wrap(WriteCounter(stream, self.counts), filename)
+
+    disk_io = CountingDiskIO(**settings)
+    disk_io.counts = []
+    return disk_io
+
+
+class BenchSuite:
+    """Runs the benchmarks against one MediaServer and collects the results"""
+
+    def __init__(self, server, workdir, runs=3, concurrency=(1, 2, 4, 8), batch_jobs=8, log=None):
+        self.server = server
+        self.workdir = Path(workdir)
+        self.runs = runs
+        self.concurrency = list(concurrency)
+        self.batch_jobs = batch_jobs
+        self.log = log or (lambda message: None)
+        self.counter = 0
+
+    def video_id(self):
+        # Every download gets its own title, so no run finds an earlier file
+        self.counter += 1
+        return f"v{self.counter}"
+
+    def output_dir(self, name):
+        path = self.workdir / 'out' / name
+        shutil.rmtree(path, ignore_errors=True)
+        path.mkdir(parents=True)
+        return str(path)
+
+    def download(self, url, output_path, quality='best', **options):
+        import main
+        return main.download_video(url, output_path, quality, use_cache=False, use_archive=False,
+                                   use_journal=False, **options)
+
+    def bench_startup(self):
+        """Cold start: importing main in a fresh interpreter"""
+        samples = []
+        for _ in range(self.runs):
+            started = monotonic()
+            subprocess.run([sys.executable, '-c', 'import main'], cwd=SCRIPT_DIR, check=True,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            samples.append(monotonic() - started)
+        return {'import_main_s': summarize(samples)}
+
+    def bench_extraction(self):
+        """extract_info plus format selection for one video"""
+        samples = []
+        with silenced(), BenchYoutubeDL({'quiet': True}) as ydl:
+            for _ in range(max(self.runs, 5)):
+                url = self.server.url('progressive', self.video_id())
+                started = monotonic()
+                ydl.extract_info(url, download=False)
+                samples.append(monotonic() - started)
+        return summarize(samples)
+
+    def bench_throughput(self):
+        """One download per protocol"""
+        results = {}
+        for kind in KINDS:
+            samples = []
+            for _ in range(self.runs):
+                output = self.output_dir(kind)
+                started = monotonic()
+                with silenced():
+                    filepath = self.download(self.server.url(kind, self.video_id()), output)
+                elapsed = monotonic() - started
+                samples.append(mib_per_s(os.path.getsize(filepath), elapsed))
+            results[kind] = {'mib_s': summarize(samples), 'bytes': self.server.size}
+            self.log(f"  {kind}: {results[kind]['mib_s']['median']:.1f}MiB/s")
+        return results
+
+    def bench_batch(self):
+        """The same batch of progressive downloads at each concurrency"""
+        from batch import run_batch
+        results = []
+        for workers in self.concurrency:
+            output = self.output_dir(f"batch-{workers}")
+            urls = [self.server.url('progressive', self.video_id()) for _ in range(self.batch_jobs)]
+            started = monotonic()
+            with silenced():
+                jobs = run_batch(urls, lambda url: self.download(url, output, workers=1), workers)
+            elapsed = monotonic() - started
+            failed = sum(1 for job in jobs if job.status != 'done')
+            results.append({
+                'concurrency': workers, 'jobs': len(jobs), 'failed': failed, 'seconds': elapsed,
+                'mib_s': mib_per_s(self.server.size * (len(jobs) - failed), elapsed),
+            })
+            self.log(f"  {workers} worker(s): {results[-1]['mib_s']:.1f}MiB/s")
+        return results
+
+    def bench_postprocess(self):
+        """Merge of separate video/audio and an audio transcode, with real ffmpeg"""
+        import main
+        from pipeline import PostProcessPool
+
+        ffmpeg = FFmpegPostProcessor(yt_dlp.YoutubeDL({'ffmpeg_location': main.SCRIPT_DIR}))
+        if not ffmpeg.available:
+            return {'skipped': 'ffmpeg not found'}
+
+        # Real media for ffmpeg to work on, served next to the synthetic files
+        media_dir = self.workdir / 'media'
+        media_dir.mkdir(exist_ok=True)
+        duration = str(max(5, int(self.server.segments * SEGMENT_SECONDS)))
+        commands = [
+            ['-f', 'lavfi', '-i', f'testsrc=duration={duration}:size=1280x720:rate=30',
+             '-c:v', 'libx264', '-preset', 'ultrafast', '-pix_fmt', 'yuv420p', str(media_dir / 'video.mp4')],
+            ['-f', 'lavfi', '-i', f'sine=frequency=440:duration={duration}',
+             '-c:a', 'aac', '-b:a', '128k', str(media_dir / 'audio.m4a')],
+        ]
+        for command in commands:
+            made = subprocess.run([ffmpeg.executable, '-hide_banner', '-loglevel', 'error', '-y'] + command,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+            if made.returncode != 0:
+                return {'skipped': f"could not generate test media: {made.stderr.decode(errors='replace').strip()}"}
+        self.server.media_dir = str(media_dir)
+
+        results = {}
+        for name, kind, quality, options in (
+                ('merge', 'merge', 'best', {}),
+                ('transcode', 'audio', 'audio', {'audio_format': 'mp3', 'stream_audio': False})):
+            samples = []
+            for _ in range(self.runs):
+                pool = PostProcessPool(1)
+                try:
+                    with silenced():
+                        result = self.download(self.server.url(kind, self.video_id()),
+                                               self.output_dir(name), quality, postprocess=pool, **options)
+                        if hasattr(result, 'result'):
+                            result.result()
+                finally:
+                    pool.shutdown()
+                samples.append(getattr(result, 'timings', {}).get('postprocess', 0.0))
+            results[f"{name}_s"] = summarize(samples)
+            self.log(f"  {name}: {results[f'{name}_s']['median']:.2f}s")
+        return results
+
+    def bench_diskio(self):
+        """Progressive downloads through each disk write path"""
+        unbuffered = {'write_buffer': 0, 'preallocate': False, 'http_chunk': '', 'scratch_dir': None}
+        tuned = dict(unbuffered, write_buffer=parse_bytes('1M'), preallocate=True)
+        configs = (
+            ('unbuffered', unbuffered),
+            ('tuned', tuned),
+            ('chunk_auto', dict(tuned, http_chunk='auto')),
+            ('scratch', dict(tuned, scratch_dir=str(self.workdir / 'scratch'))),
+        )
+        results = {}
+        for name, settings in configs:
+            disk_io = counting_disk_io(**settings)
+            samples = []
+            for _ in range(self.runs):
+                output = self.output_dir(f"diskio-{name}")
+                started = monotonic()
+                with silenced():
+                    filepath = self.download(self.server.url('progressive', self.video_id()), output,
+                                             disk_io=disk_io)
+                elapsed = monotonic() - started
+                samples.append(mib_per_s(os.path.getsize(filepath), elapsed))
+            results[name] = {'mib_s': summarize(samples), 'writes': len(disk_io.counts) // self.runs,
+                             'bytes': self.server.size}
+            self.log(f"  {name}: {results[name]['mib_s']['median']:.1f}MiB/s,"
+                     f" {results[name]['writes']} writes per file")
+        return results
+
+    def warm_up(self):
+        # The first download pays for lazy imports and yt-dlp's one-time
+        # setup; keep that out of the throughput numbers
+        with silenced():
+            self.download(self.server.url('progressive', self.video_id()), self.output_dir('warm-up'))
+
+    def run(self, only=BENCHMARKS):
+        results = {}
+        with bench_downloader():
+            if set(only) & {'throughput', 'batch', 'postprocess', 'diskio'}:
+                self.warm_up()
+            for name in BENCHMARKS:
+                if name not in only:
+                    continue
+                self.log(f"⏱️ {name}")
+                results[name] = getattr(self, f"bench_{name}")()
+        return results
+
+
+def flatten(results):
+    """Flat {'throughput.dash_mib_s': 12.3, ...} of the medians, for comparisons"""
+    metrics = {}
+    startup = results.get('startup')
+    if startup:
+        metrics['startup.import_main_s'] = startup['import_main_s']['median']
+    extraction = results.get('extraction')
+    if extraction:
+        metrics['extraction.median_s'] = extraction['median']
+        metrics['extraction.p95_s'] = extraction['p95']
+    for kind, result in (results.get('throughput') or {}).items():
+        metrics[f'throughput.{kind}_mib_s'] = result['mib_s']['median']
+    for result in results.get('batch') or []:
+        metrics[f"batch.c{result['concurrency']}_mib_s"] = result['mib_s']
+    for name, result in (results.get('postprocess') or {}).items():
+        if isinstance(result, dict):
+            metrics[f'postprocess.{name}'] = result['median']
+    for name, result in (results.get('diskio') or {}).items():
+        metrics[f'diskio.{name}_mib_s'] = result['mib_s']['median']
+        metrics[f'diskio.{name}_writes'] = result['writes']
+    return metrics
+
+
+def compare(metrics, baseline, tolerance):
+    """Lines describing each change against the baseline, and the regressions"""
+    lines = []
+    regressions = []
+    for name, value in metrics.items():
+        before = baseline.get(name)
+        if value is None or not before:
+            continue
+        change = (value - before) / before
+        # Rates are better higher, times better lower
+        worse = -change if name.endswith('_mib_s') else change
+        marker = "❌" if worse > tolerance else "✅" if worse < -tolerance else "  "
+        lines.append(f"{marker} {name}: {before:.3f} → {value:.3f} ({change:+.1%})")
+        if worse > tolerance:
+            regressions.append(name)
+    return lines, regressions
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=SCRIPT_DIR,
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'commit': commit,
+        'python': platform.python_version(),
+        'yt_dlp': yt_dlp.version.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def benchmark_main(argv):
+    """Entry point: run the suite and write the results as JSON"""
+    parser = argparse.ArgumentParser(
+        prog='benchmark.py',
+        description='Offline benchmarks against a local media server.')
+    parser.add_argument('--only', default=','.join(BENCHMARKS), metavar='LIST',
+                        help=f"benchmarks to run (default: {','.join(BENCHMARKS)})")
+    parser.add_argument('--quick', action='store_true', help='one run each, smaller files')
+    parser.add_argument('--runs', type=int, default=None, help='repetitions per measurement (default: 3)')
+    parser.add_argument('--size', default=None, help='bytes per video, e.g. 8M (default: 8M, 2M with --quick)')
+    parser.add_argument('--segment-size', default='512K', help='DASH/HLS segment size (default: 512K)')
+    parser.add_argument('--latency', type=float, default=20.0, metavar='MS',
+                        help='server latency per request in milliseconds (default: 20)')
+    parser.add_argument('--bandwidth', default='32M', metavar='RATE',
+                        help="server bandwidth per connection, or 'unlimited' (default: 32M)")
+    parser.add_argument('--concurrency', default='1,2,4,8', metavar='LIST',
+                        help='batch worker counts to compare (default: 1,2,4,8)')
+    parser.add_argument('--batch-jobs', type=int, default=8, help='downloads per batch (default: 8)')
+    parser.add_argument('--ffmpeg', metavar='DIR', help='folder with ffmpeg for the post-processing benchmark')
+    parser.add_argument('-o', '--output', metavar='FILE', help='write the JSON results here (default: stdout)')
+    parser.add_argument('--baseline', metavar='FILE', help='earlier results to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.10,
+                        help='relative change that counts as a regression (default: 0.10)')
+    args = parser.parse_args(argv)
+
+    only = [name.strip() for name in args.only.split(',') if name.strip()]
+    unknown = [name for name in only if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(unknown)}")
+    runs = args.runs or (1 if args.quick else 3)
+    size = parse_bytes(args.size or ('2M' if args.quick else '8M'))
+    bandwidth = None if args.bandwidth.lower() in ('0', 'none', 'unlimited') else parse_bytes(args.bandwidth)
+    concurrency = [int(n) for n in args.concurrency.split(',') if n.strip()]
+
+    def log(message):
+        print(message, file=sys.stderr, flush=True)
+
+    workdir = tempfile.mkdtemp(prefix='l1ght-bench-')
+    # Caches, archive and journal of the runs stay in the scratch folder
+    import paths
+    paths.DATA_DIR = Path(workdir) / 'data'
+    import main
+    from bandwidth import shared_bandwidth
+    if args.ffmpeg:
+        main.SCRIPT_DIR = args.ffmpeg
+    shared_bandwidth().configure('unlimited', '')
+
+    config = {
+        'size': size, 'segment_size': parse_bytes(args.segment_size), 'latency_ms': args.latency,
+        'bandwidth': bandwidth, 'runs': runs, 'concurrency': concurrency, 'batch_jobs': args.batch_jobs,
+    }
+    started = monotonic()
+    try:
+        with MediaServer(size, config['segment_size'], args.latency / 1000, bandwidth) as server:
+            suite = BenchSuite(server, workdir, runs, concurrency, args.batch_jobs, log)
+            results = suite.run(only)
+            config['requests'] = server.requests
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'suite': 'l1ght-video-benchmark',
+        'version': SUITE_VERSION,
+        'environment': environment(),
+        'config': config,
+        'elapsed_s': monotonic() - started,
+        'results': results,
+        'metrics': flatten(results),
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+        log(f"📄 Results written to {args.output}")
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f).get('metrics', {})
+        lines, regressions = compare(report['metrics'], baseline, args.tolerance)
+        log(f"📊 Against {args.baseline}:")
+        for line in lines:
+            log(f"  {line}")
+        if regressions:
+            log(f"❌ {len(regressions)} regression(s) beyond {args.tolerance:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(benchmark_main(sys.argv[1:]))
@@ -0,0 +1,144 @@
+"""Time-range clips.
+
+A clip downloads only part of a video: yt-dlp hands each range to ffmpeg,
+which seeks with HTTP range requests, or fetches only the HLS/DASH segments
+that cover the span, instead of the whole file. Cuts are stream copies by
+default, so they land on the nearest keyframe before the start. With
+precise cuts the ends are re-encoded so they fall exactly on the requested
+times.
+
+Ranges are written like yt-dlp's --download-sections: '1:00-1:30',
+'90-120', '1:02:03.5-' (to the end) or '-0:30' (from the start), comma
+separated for several clips of one video.
+"""
+
+import threading
+from contextlib import contextmanager
+
+from yt_dlp.downloader.external import FFmpegFD
+from yt_dlp.postprocessor.ffmpeg import FFmpegPostProcessor
+from yt_dlp.utils import download_range_func
+
+END = float('inf')
+
+
+def parse_time(text):
+    """Seconds from '90', '1:30' or '1:02:03.5'"""
+    seconds = 0.0
+    for part in text.strip().split(':'):
+        seconds = seconds * 60 + float(part)
+    if seconds < 0:
+        raise ValueError(f"negative time: {text}")
+    return seconds
+
+
+def parse_clips(text):
+    """[(start, end), ...] from 'START-END[,START-END...]'; a missing end is END"""
+    clips = []
+    for part in text.split(','):
+        part = part.strip().lstrip('*')
+        if not part:
+            continue
+        start, separator, end = part.partition('-')
+        if not separator:
+            raise ValueError(f"clip '{part}' is not START-END")
+        start = parse_time(start) if start.strip() else 0.0
+        end = parse_time(end) if end.strip() else END
+        if end <= start:
+            raise ValueError(f"clip '{part}' ends before it starts")
+        clips.append((start, end))
+    return clips
+
+
+def clip_options(start=None, end=None, clips=None):
+    """Clips from --start/--end and a clip list, or None for the whole video
+
+    `clips` is a string as parse_clips() takes, or a list of such strings
+    or of (start, end) pairs in seconds.
+    """
+    ranges = []
+    for clip in [clips] if isinstance(clips, str) else clips or []:
+        ranges += parse_clips(clip) if isinstance(clip, str) else [(float(clip[0]), float(clip[1]))]
+    if start is not None or end is not None:
+        ranges.append(parse_clips(f"{start or ''}-{end or ''}")[0])
+    return ranges or None
+
+
+def format_time(seconds):
+    if seconds == END:
+        return 'end'
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(int(minutes), 60)
+    text = f"{minutes}:{seconds:04.1f}" if not hours else f"{hours}:{minutes:02d}:{seconds:04.1f}"
+    return text[:-2] if text.endswith('.0') else text
+
+
+def describe_clips(clips):
+    return ', '.join(f"{format_time(start)}-{format_time(end)}" for start, end in clips)
+
+
+def clip_fraction(clips, duration):
+    """Share of a video of `duration` seconds that the clips cover, or None"""
+    if not duration:
+        return None
+    covered = sum(min(end, duration) - min(start, duration) for start, end in clips)
+    return min(1.0, covered / duration)
+
+
+def ydl_clip_params(clips, precise=False, ffmpeg_location=None):
+    """yt-dlp params that download only `clips`
+
+    Download within ffmpeg_from_location(), or yt-dlp only finds an ffmpeg
+    on PATH to download the ranges with.
+    """
+    params = {
+        'download_ranges': download_range_func(None, [tuple(clip) for clip in clips]),
+        'force_keyframes_at_cuts': precise,
+    }
+    if ffmpeg_location:
+        params['ffmpeg_location'] = ffmpeg_location
+    return params
+
+
+# yt-dlp decides whether ffmpeg can download a range by looking for it on
+# PATH only, ignoring ffmpeg_location. While any ffmpeg_from_location() is
+# active, FFmpegFD.available also accepts the ffmpeg of the YoutubeDL
+# downloading on the calling thread; the original is put back afterwards.
+_local = threading.local()
+_patch_lock = threading.Lock()
+_patch_users = 0
+_available = None
+
+
+def available(cls, path=None):
+    ydl = getattr(_local, 'ydl', None)
+    if path is None and ydl is not None and ydl.params.get('ffmpeg_location'):
+        return FFmpegPostProcessor(ydl).available
+    return _available.__func__(cls, path)
+
+
+@contextmanager
+def ffmpeg_from_location(ydl):
+    """Let range downloads of `ydl` on this thread use the ffmpeg at its ffmpeg_location"""
+    global _available, _patch_users
+    with _patch_lock:
+        original = FFmpegFD.__dict__.get('available')
+        patchable = isinstance(original, classmethod)
+        if patchable:
+            if _patch_users == 0:
+                _available = original
+                FFmpegFD.available = classmethod(available)
+            _patch_users += 1
+    if not patchable:
+        # Another yt-dlp than expected: only an ffmpeg on PATH is found
+        yield
+        return
+    _local.ydl = ydl
+    try:
+        yield
+    finally:
+        _local.ydl = None
+        with _patch_lock:
+            _patch_users -= 1
+            if _patch_users == 0:
+                FFmpegFD.available = _available
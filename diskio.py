@@ -0,0 +1,343 @@
+"""Disk write path tuning.
+
+yt-dlp writes every block it reads straight to the .part file. A block is
+a kilobyte at first and later up to 4MiB, depending on how long the last
+read took. With many concurrent writers on a network share, that means a
+great many small writes, and files that grow piecemeal and fragment.
+DiskIO installs itself on a job's YoutubeDL and changes the write path:
+
+    write buffer   blocks are collected and written in large pieces that
+                   end on WRITE_ALIGNMENT boundaries of the file
+    preallocation  when a format's exact size is known, the file's blocks
+                   are reserved up front; its length does not change, so an
+                   interrupted .part still resumes from its real size
+    HTTP chunks    a plain HTTP download is fetched in range requests of a
+                   fixed size, or with 'auto', of a size that takes
+                   CHUNK_SECONDS at the throughput measured from that host
+    scratch dir    downloads and post-processing happen in a folder on fast
+                   local disk, and the finished files are then moved to the
+                   output folder atomically: a copy is written under a
+                   temporary name next to its destination and renamed
+                   into place
+
+The settings come from L1GHT_WRITE_BUFFER, L1GHT_PREALLOCATE,
+L1GHT_HTTP_CHUNK and L1GHT_SCRATCH_DIR, or from the batch options (see
+shared_disk_io()). All of them are off unless asked for.
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import hashlib
+import os
+import shutil
+import sys
+import threading
+from contextlib import contextmanager, nullcontext
+from urllib.parse import urlparse
+
+from yt_dlp.downloader.common import FileDownloader
+from yt_dlp.utils import parse_bytes
+
+WRITE_ALIGNMENT = 64 * 1024
+CHUNK_SECONDS = 8
+MIN_CHUNK = 1024 * 1024
+MAX_CHUNK = 64 * 1024 * 1024
+FIRST_CHUNK = 10 * 1024 * 1024  # before anything was measured from a host
+
+WRITE_BUFFER = parse_bytes(os.environ.get('L1GHT_WRITE_BUFFER', '0')) or 0
+PREALLOCATE = os.environ.get('L1GHT_PREALLOCATE', '0') == '1'
+HTTP_CHUNK = os.environ.get('L1GHT_HTTP_CHUNK', '')  # '', 'auto' or a size such as 10M
+SCRATCH_DIR = os.environ.get('L1GHT_SCRATCH_DIR') or None
+
+# fcntl(2) on macOS
+F_PREALLOCATE = 42
+F_ALLOCATEALL = 4
+F_PEOFPOSMODE = 3
+
+_libc = None
+
+
+def libc():
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    return _libc
+
+
+class FStore(ctypes.Structure):
+    _fields_ = [('fst_flags', ctypes.c_uint), ('fst_posmode', ctypes.c_int),
+                ('fst_offset', ctypes.c_int64), ('fst_length', ctypes.c_int64),
+                ('fst_bytesalloc', ctypes.c_int64)]
+
+
+def preallocate(stream, size):
+    """Reserve disk blocks for `size` bytes of an open file without changing its length"""
+    try:
+        fd = stream.fileno()
+        if sys.platform.startswith('linux'):
+            fallocate = getattr(libc(), 'fallocate64', None) or libc().fallocate
+            fallocate.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_int64, ctypes.c_int64]
+            return fallocate(fd, 1, 0, size) == 0  # FALLOC_FL_KEEP_SIZE
+        if sys.platform == 'darwin':
+            missing = size - os.fstat(fd).st_size
+            store = FStore(F_ALLOCATEALL, F_PEOFPOSMODE, 0, missing, 0)
+            return missing <= 0 or libc().fcntl(fd, F_PREALLOCATE, ctypes.byref(store)) != -1
+    except (AttributeError, OSError, ValueError, TypeError):
+        pass
+    return False
+
+
+class BufferedStream:
+    """File stand-in that collects writes and passes them on in aligned pieces"""
+
+    def __init__(self, stream, size):
+        self.stream = stream
+        self.size = max(size, WRITE_ALIGNMENT)
+        self.buffer = bytearray()
+        self.position = stream.tell()
+        self.writes = 0
+
+    def write(self, data):
+        self.buffer += data
+        if len(self.buffer) >= self.size:
+            # Up to the last alignment boundary of the file; the rest waits
+            end = (self.position + len(self.buffer)) // WRITE_ALIGNMENT * WRITE_ALIGNMENT
+            self.drain(end - self.position)
+        return len(data)
+
+    def drain(self, length):
+        if length > 0:
+            self.stream.write(memoryview(self.buffer)[:length])
+            del self.buffer[:length]
+            self.position += length
+            self.writes += 1
+
+    def flush(self):
+        self.drain(len(self.buffer))
+        self.stream.flush()
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self.stream.close()
+
+    def tell(self):
+        return self.position + len(self.buffer)
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class ChunkSizer:
+    """Throughput per host, and the HTTP chunk size that follows from it"""
+
+    def __init__(self, seconds=CHUNK_SECONDS):
+        self.seconds = seconds
+        self.rates = {}  # host -> smoothed bytes per second
+        self.lock = threading.Lock()
+
+    def size_for(self, url, limit=None):
+        with self.lock:
+            rate = self.rates.get(urlparse(url).netloc)
+        size = FIRST_CHUNK if rate is None else int(rate * self.seconds)
+        size = max(MIN_CHUNK, min(MAX_CHUNK, size))
+        # An extractor's own chunk size (YouTube's avoids throttling) is a ceiling
+        return min(size, limit) if limit else size
+
+    def progress_hook(self, d):
+        """yt-dlp progress hook: measure each finished plain HTTP download"""
+        info = d.get('info_dict') or {}
+        nbytes = d.get('total_bytes') or d.get('downloaded_bytes')
+        if d['status'] != 'finished' or not d.get('elapsed') or not nbytes or not info.get('url'):
+            return
+        rate = nbytes / d['elapsed']
+        host = urlparse(info['url']).netloc
+        with self.lock:
+            previous = self.rates.get(host)
+            self.rates[host] = rate if previous is None else (previous + rate) / 2
+
+
+def move_into(path, directory):
+    """Move `path` into `directory` so the file only ever appears there complete"""
+    destination = os.path.join(directory, os.path.basename(path))
+    try:
+        os.replace(path, destination)  # atomic on the same filesystem
+        return destination
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    temporary = os.path.join(directory, f".{os.path.basename(path)}.{os.getpid()}.moving")
+    try:
+        shutil.copy2(path, temporary)
+        with open(temporary, 'rb') as f:
+            os.fsync(f.fileno())
+        os.replace(temporary, destination)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+    os.remove(path)
+    return destination
+
+
+class DiskIO:
+    """How downloads write to disk; install() applies it to a YoutubeDL"""
+
+    def __init__(self, write_buffer=WRITE_BUFFER, preallocate=PREALLOCATE, http_chunk=HTTP_CHUNK,
+                 scratch_dir=SCRATCH_DIR):
+        self.write_buffer = write_buffer
+        self.preallocate = preallocate
+        self.http_chunk = http_chunk
+        self.scratch_dir = scratch_dir
+        self.chunks = ChunkSizer()
+        self.local = threading.local()
+
+    def configure(self, write_buffer=None, preallocate=None, http_chunk=None, scratch_dir=None):
+        """Change the settings given; sizes may be strings such as '4M'"""
+        if write_buffer is not None:
+            size = parse_bytes(str(write_buffer))
+            if size is None:
+                raise ValueError(f"invalid write buffer size: {write_buffer}")
+            self.write_buffer = size
+        if preallocate is not None:
+            self.preallocate = preallocate
+        if http_chunk is not None:
+            if http_chunk not in ('', 'auto') and not parse_bytes(http_chunk):
+                raise ValueError(f"invalid HTTP chunk size: {http_chunk}")
+            self.http_chunk = http_chunk
+        if scratch_dir is not None:
+            self.scratch_dir = scratch_dir or None
+
+    def work_dir(self, output_path):
+        """Where a download for `output_path` writes until it is finished"""
+        if not self.scratch_dir:
+            return output_path
+        # The same output folder always maps to the same scratch folder, so
+        # an interrupted download finds its partial files again
+        key = hashlib.sha1(os.path.abspath(output_path).encode('utf-8')).hexdigest()[:12]
+        path = os.path.join(self.scratch_dir, key)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def deliver(self, filepath, output_path):
+        """Move a finished file from the scratch folder to `output_path`"""
+        if not filepath or not self.scratch_dir or os.path.dirname(filepath) == output_path:
+            return filepath
+        if not os.path.exists(filepath):
+            return filepath
+        return move_into(filepath, output_path)
+
+    def chunk_size(self, url, limit=None):
+        if self.http_chunk == 'auto':
+            return self.chunks.size_for(url, limit)
+        return parse_bytes(self.http_chunk)
+
+    def install(self, ydl):
+        """Tune the downloads of `ydl` (for the current job)"""
+        ydl.disk_io = self
+        if self.http_chunk == 'auto':
+            ydl.add_progress_hook(self.chunks.progress_hook)
+        dl = ydl.dl
+
+        def tuned_dl(name, info, *args, **kwargs):
+            # Which file to preallocate, and how large
+            self.local.target = (name, info.get('filesize')) if self.preallocate else None
+            if self.http_chunk:
+                if info.get('protocol') in ('http', 'https') and info.get('url'):
+                    limit = (info.get('downloader_options') or {}).get('http_chunk_size')
+                    ydl.params['http_chunk_size'] = self.chunk_size(info['url'], limit)
+                else:
+                    ydl.params.pop('http_chunk_size', None)
+            try:
+                with tuned_writes() if self.wraps_writes() else nullcontext():
+                    return dl(name, info, *args, **kwargs)
+            finally:
+                self.local.target = None
+
+        ydl.dl = tuned_dl
+
+    def wraps_writes(self):
+        """Whether downloads have to write through wrap()"""
+        return bool(self.write_buffer or self.preallocate)
+
+    def wrap(self, stream, filename):
+        """The stream yt-dlp should write `filename` through"""
+        target = getattr(self.local, 'target', None)
+        if target and target[1] and filename.startswith(target[0]):
+            preallocate(stream, target[1])
+        if self.write_buffer:
+            return BufferedStream(stream, self.write_buffer)
+        return stream
+
+    def summary(self):
+        parts = [f"write buffer {self.write_buffer // 1024}KiB" if self.write_buffer else "unbuffered",
+                 "preallocation" if self.preallocate else "no preallocation"]
+        if self.http_chunk:
+            parts.append(f"HTTP chunks {self.http_chunk}")
+        if self.scratch_dir:
+            parts.append(f"scratch {self.scratch_dir}")
+        return ', '.join(parts)
+
+
+# yt-dlp opens every file it downloads into through FileDownloader.sanitize_open.
+# While a job that asked for a write buffer or preallocation downloads, that
+# method is wrapped so the job's streams go through its DiskIO; downloads of
+# jobs without a DiskIO installed are untouched, and once no such job is
+# downloading the original method is back in place.
+_patch_lock = threading.Lock()
+_patch_users = 0
+_sanitize_open = None
+
+
+def sanitize_open(self, filename, open_mode):
+    stream, filename = _sanitize_open.__get__(self, type(self))(filename, open_mode)
+    disk_io = getattr(self.ydl, 'disk_io', None)
+    if (disk_io is not None and disk_io.wraps_writes() and 'b' in open_mode and open_mode[0] in 'wa'
+            and filename != '-'):
+        stream = disk_io.wrap(stream, filename)
+    return stream, filename
+
+
+@contextmanager
+def tuned_writes():
+    """Route the files yt-dlp opens through the DiskIO of their YoutubeDL"""
+    global _sanitize_open, _patch_users
+    with _patch_lock:
+        original = FileDownloader.__dict__.get('sanitize_open')
+        patchable = hasattr(original, '__get__')
+        if patchable:
+            if _patch_users == 0:
+                _sanitize_open = original
+                FileDownloader.sanitize_open = sanitize_open
+            _patch_users += 1
+    if not patchable:
+        yield
+        return
+    try:
+        yield
+    finally:
+        with _patch_lock:
+            _patch_users -= 1
+            if _patch_users == 0:
+                FileDownloader.sanitize_open = _sanitize_open
+
+
+_shared_disk_io = None
+_shared_lock = threading.Lock()
+
+
+def shared_disk_io():
+    """Process-wide DiskIO settings"""
+    global _shared_disk_io
+    with _shared_lock:
+        if _shared_disk_io is None:
+            _shared_disk_io = DiskIO()
+        return _shared_disk_io
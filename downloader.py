@@ -0,0 +1,137 @@
+"""In-process downloader API.
+
+    with Downloader(output_path='~/Videos') as downloader:
+        result = downloader.download(url, quality='720p')
+        if result.ok:
+            print(result.filepath, result.phases)
+        results = downloader.download_many(urls, workers=4)
+
+A Downloader holds one session.SessionPool, so consecutive downloads reuse
+the same YoutubeDL instances: HTTP keep-alive connections, cookies and
+initialised extractors carry over from call to call. Failures come back as
+results with ok=False and the error message; nothing exits the process.
+download_many() runs on the batch worker pool and overlaps post-processing
+with the next download (see pipeline.py).
+"""
+
+import os
+
+from batch import DEFAULT_WORKERS, run_batch
+from main import DownloadFailed, download_video
+from metrics import JobMetrics
+from pipeline import DEFAULT_PP_WORKERS, PostProcessPool
+from progress import shared_progress
+from session import DEFAULT_MAX_IDLE, SessionPool
+
+
+class DownloadResult:
+    """Outcome of one download"""
+
+    def __init__(self, url, quality, output_path, filepath=None, error=None, metrics=None):
+        self.url = url
+        self.quality = quality
+        self.output_path = output_path
+        self.filepath = filepath
+        self.error = error
+        self.metrics = metrics
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    @property
+    def phases(self):
+        """Seconds spent per phase (extract, download, queued, postprocess)"""
+        return dict(self.metrics.timer.stages) if self.metrics else {}
+
+    @property
+    def bytes(self):
+        return self.metrics.bytes if self.metrics else 0
+
+    def as_dict(self):
+        result = {
+            'url': self.url, 'quality': self.quality, 'output_path': self.output_path,
+            'ok': self.ok, 'filepath': self.filepath, 'error': self.error,
+        }
+        if self.metrics:
+            metrics = self.metrics.as_dict()
+            result.update({key: metrics[key] for key in ('status', 'elapsed', 'phases', 'bytes', 'retries')})
+        return result
+
+    def __repr__(self):
+        if self.ok:
+            return f"DownloadResult({self.url!r}, filepath={self.filepath!r})"
+        return f"DownloadResult({self.url!r}, error={self.error!r})"
+
+
+class Downloader:
+    """Downloads in-process, reusing one YoutubeDL session between calls
+
+    `options` become the defaults of every download (use_cache,
+    use_archive, use_store, use_journal, fragments, priority,
+    audio_format, stream_audio; see main.download_video). Each call may
+    override them.
+    """
+
+    def __init__(self, output_path=None, quality='best', workers=DEFAULT_WORKERS,
+                 postprocess_workers=DEFAULT_PP_WORKERS, **options):
+        self.output_path = os.path.expanduser(output_path) if output_path else None
+        self.quality = quality
+        self.workers = workers
+        self.postprocess_workers = postprocess_workers
+        self.options = options
+        self.sessions = SessionPool(max(DEFAULT_MAX_IDLE, workers))
+
+    def job_options(self, options):
+        merged = dict(self.options)
+        merged.update(options)
+        return merged
+
+    def download(self, url, quality=None, output_path=None, **options):
+        """Download one URL and return its DownloadResult"""
+        quality = quality or self.quality
+        output_path = output_path or self.output_path
+        job_metrics = JobMetrics(url, quality)
+        try:
+            filepath = download_video(url, output_path, quality, sessions=self.sessions,
+                                      job_metrics=job_metrics, **self.job_options(options))
+        except DownloadFailed as e:
+            return DownloadResult(url, quality, output_path, error=str(e) or 'Download failed',
+                                  metrics=job_metrics)
+        return DownloadResult(url, quality, output_path, filepath, metrics=job_metrics)
+
+    def download_many(self, urls, quality=None, output_path=None, workers=None, **options):
+        """Download every URL concurrently; the results are in the order of `urls`"""
+        urls = list(urls)
+        quality = quality or self.quality
+        output_path = output_path or self.output_path
+        options = self.job_options(options)
+        collected = {}
+        pool = PostProcessPool(self.postprocess_workers) if self.postprocess_workers else None
+
+        def start(index):
+            job_metrics = collected[index] = JobMetrics(urls[index], quality)
+            return download_video(urls[index], output_path, quality, workers=1, postprocess=pool,
+                                  sessions=self.sessions, job_metrics=job_metrics, **options)
+
+        try:
+            jobs = run_batch(range(len(urls)), start, workers or self.workers,
+                             describe=lambda index: urls[index], progress=shared_progress())
+        finally:
+            if pool:
+                pool.shutdown()
+        return [DownloadResult(urls[job.item], quality, output_path,
+                               job.result if job.status == 'done' else None,
+                               None if job.status == 'done' else job.error or 'Download failed',
+                               collected.get(job.item))
+                for job in jobs]
+
+    def close(self):
+        """Close the pooled sessions and their connections"""
+        self.sessions.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,117 @@
+"""Machine-readable job events as JSON lines.
+
+Frontends used to scrape human text such as ``[download] 42.0% of
+12.34MiB`` with regular expressions. In event mode every line on stdout is
+instead a JSON object with an ``event`` type and the job ``id``:
+
+    metadata     title, duration, video_id, extractor, thumbnail, uploader
+    phase        phase: extracting | downloading | postprocessing | finished
+    progress     downloaded_bytes, total_bytes, percent, speed, eta, filename
+    postprocess  postprocessor, status (started | finished), filename
+    log          message (any other console output)
+    done         filepath, bytes, elapsed
+    error        message
+
+Sizes are in bytes, speed in bytes per second and eta in seconds; fields
+yt-dlp does not know yet are null. Progress covers all streams of the job,
+with a smoothed speed, and is throttled (see progress.py): a consumer sees
+a few events per second at most, not one per downloaded chunk.
+"""
+
+import json
+import threading
+from time import monotonic
+
+from progress import ProgressAggregator
+
+
+class EventWriter:
+    """Serialises events from any thread onto one text stream"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.lock = threading.Lock()
+
+    def __call__(self, event):
+        line = json.dumps(event, separators=(',', ':'))
+        with self.lock:
+            self.stream.write(line + '\n')
+            self.stream.flush()
+
+
+class JobEvents:
+    """Typed event helpers for one job, plus the yt-dlp hooks that feed them"""
+
+    def __init__(self, emit, job_id=None, progress=None):
+        self.emit = emit
+        self.job_id = job_id
+        self.started = monotonic()
+        self.current_phase = None
+        self.tracker = progress or ProgressAggregator()
+        self.downloaded = 0
+
+    def send(self, event, **fields):
+        self.emit({'event': event, 'id': self.job_id, **fields})
+
+    def log(self, message):
+        self.send('log', message=message)
+
+    def phase(self, name):
+        if name != self.current_phase:
+            self.current_phase = name
+            self.send('phase', phase=name)
+
+    def metadata(self, info):
+        self.send(
+            'metadata',
+            title=info.get('title'),
+            duration=info.get('duration'),
+            video_id=info.get('id'),
+            extractor=info.get('extractor_key') or info.get('ie_key'),
+            thumbnail=info.get('thumbnail'),
+            uploader=info.get('uploader'),
+            playlist=info.get('_type') in ('playlist', 'multi_video'),
+        )
+
+    def progress(self, d):
+        snapshot = self.tracker.update(self, d)
+        if snapshot is None:
+            return
+        self.downloaded = snapshot['downloaded_bytes']
+        self.send(
+            'progress',
+            filename=d.get('filename'),
+            fragment_index=d.get('fragment_index'),
+            fragment_count=d.get('fragment_count'),
+            **snapshot
+        )
+
+    def finish(self):
+        snapshot = self.tracker.finish(self)
+        if snapshot:
+            self.downloaded = snapshot['downloaded_bytes']
+
+    def done(self, filepath=None):
+        self.finish()
+        self.phase('finished')
+        self.send('done', filepath=filepath, bytes=self.downloaded,
+                  elapsed=round(monotonic() - self.started, 3))
+
+    def error(self, message):
+        self.finish()
+        self.send('error', message=message, elapsed=round(monotonic() - self.started, 3))
+
+    def progress_hook(self, d):
+        """yt-dlp progress hook"""
+        if d['status'] == 'downloading':
+            self.phase('downloading')
+            self.progress(d)
+        elif d['status'] == 'finished':
+            self.progress(d)
+
+    def postprocessor_hook(self, d):
+        """yt-dlp postprocessor hook"""
+        if d['status'] in ('started', 'finished'):
+            self.phase('postprocessing')
+            self.send('postprocess', postprocessor=d.get('postprocessor'), status=d['status'],
+                      filename=(d.get('info_dict') or {}).get('filepath'))
@@ -0,0 +1,278 @@
+"""Local format resolution for already-extracted videos.
+
+yt-dlp normally fails a whole download when a format spec matches nothing,
+so retrying with another spec means extracting the page again. The
+FormatResolver below is plugged in as yt-dlp's format selector instead: it
+evaluates the quality chain and the fallbacks against the formats that were
+already fetched, in one pass, and records why each candidate was accepted
+or rejected.
+
+Matching a format does not mean its URL works: a restricted or flaky video
+may list streams that answer 403 or never answer. With `hedge` the
+resolver takes the first few distinct selections of the chain, probes all
+their URLs at once with a one-byte range request, and commits to the most
+preferred one that answers. Probes that have not started are cancelled;
+one already waiting on its server gives up at the deadline at the latest.
+After HEDGE_TIMEOUT seconds it takes the best selection known to work. If
+none is known yet, it takes the best one that has not failed. A dead
+preferred stream therefore costs at most that long.
+
+The decision is made once per video: yt-dlp selects formats again when it
+downloads, and gets the same selection back without a second race.
+"""
+
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from time import monotonic
+from urllib.parse import urljoin
+
+import yt_dlp
+
+try:
+    from yt_dlp.networking import Request
+except ImportError:  # yt-dlp before 2023.10
+    from urllib.request import Request
+
+# Quality options mapping with fallbacks
+QUALITY_FORMATS = {
+    'best': 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/bestvideo+bestaudio/best[ext=mp4]/best',
+    'worst': 'worst[ext=mp4]/worst',
+    '720p': 'bestvideo[height<=720][ext=mp4]+bestaudio[ext=m4a]/bestvideo[height<=720]+bestaudio/best[height<=720][ext=mp4]/best[height<=720]',
+    '480p': 'bestvideo[height<=480][ext=mp4]+bestaudio[ext=m4a]/bestvideo[height<=480]+bestaudio/best[height<=480][ext=mp4]/best[height<=480]',
+    'audio': 'bestaudio[ext=m4a]/bestaudio/best'
+}
+
+# Tried in order once every alternative of the quality chain has failed
+FALLBACK_FORMATS = [
+    'best[ext=mp4]',
+    'best[ext=webm]',
+    'best',
+    'worst'
+]
+
+# Hedged selection: probe the URLs of this many distinct candidates at once,
+# and commit to one within HEDGE_TIMEOUT seconds
+HEDGE_ENABLED = os.environ.get('L1GHT_HEDGE', '') not in ('', '0')
+HEDGE_CANDIDATES = 4
+HEDGE_TIMEOUT = float(os.environ.get('L1GHT_HEDGE_TIMEOUT', '5'))
+
+# Statuses that still prove the stream is there
+LIVE_STATUSES = (416,)
+
+
+def split_format_spec(format_spec):
+    """Split a format spec into its top-level '/' alternatives"""
+    alternatives = []
+    current = ''
+    depth = 0
+    for char in format_spec:
+        if char in '[(':
+            depth += 1
+        elif char in '])':
+            depth -= 1
+
+        if char == '/' and depth == 0:
+            alternatives.append(current)
+            current = ''
+        else:
+            current += char
+    alternatives.append(current)
+    return [alt.strip() for alt in alternatives if alt.strip()]
+
+
+def format_chain(format_spec):
+    """Return every spec to try for a selector, fallbacks last and deduplicated"""
+    chain = []
+    for spec in split_format_spec(format_spec) + FALLBACK_FORMATS:
+        if spec not in chain:
+            chain.append(spec)
+    return chain
+
+
+def describe_format(fmt):
+    """One-line human description of a (possibly merged) format"""
+    parts = [fmt.get('format_id') or '?', fmt.get('ext') or '?',
+             yt_dlp.YoutubeDL.format_resolution(fmt)]
+    vcodec = fmt.get('vcodec')
+    acodec = fmt.get('acodec')
+    if vcodec and vcodec != 'none':
+        parts.append(f"v:{vcodec}")
+    if acodec and acodec != 'none':
+        parts.append(f"a:{acodec}")
+    size = fmt.get('filesize') or fmt.get('filesize_approx')
+    if size:
+        parts.append(f"{size/1024/1024:.1f}MiB")
+    return ' '.join(str(p) for p in parts)
+
+
+def probe_targets(selected):
+    """(url, http_headers) of every stream a selection downloads"""
+    targets = []
+    for fmt in selected:
+        for stream in fmt.get('requested_formats') or [fmt]:
+            url = stream.get('url')
+            fragments = stream.get('fragments')
+            if isinstance(fragments, list) and fragments:
+                # Fragmented DASH: the first fragment stands for the stream
+                url = fragments[0].get('url') or urljoin(stream.get('fragment_base_url') or '',
+                                                         fragments[0].get('path') or '')
+            if url and url.startswith(('http://', 'https://')):
+                targets.append((url, stream.get('http_headers') or {}))
+    return targets
+
+
+def probe(ydl, url, headers, timeout):
+    """Ask for the first byte of `url`; returns (alive, detail)"""
+    started = monotonic()
+    headers = dict(headers, Range='bytes=0-0')
+    try:
+        request = Request(url, headers=headers, extensions={'timeout': timeout})
+    except TypeError:  # urllib's Request has no extensions
+        request = Request(url, headers=headers)
+    try:
+        response = ydl.urlopen(request)
+        status = getattr(response, 'status', None) or response.getcode()
+        response.close()
+    except Exception as e:
+        status = getattr(e, 'status', None) or getattr(e, 'code', None)
+        if status not in LIVE_STATUSES:
+            return False, f"HTTP {status}" if status else e.__class__.__name__
+    return True, f"HTTP {status} in {monotonic() - started:.2f}s"
+
+
+class FormatResolver:
+    """yt-dlp format selector that walks a chain of specs locally
+
+    Install it with ``ydl.format_selector = FormatResolver(ydl, chain)``.
+    yt-dlp calls it with the already-sorted formats of each video; the first
+    spec that matches wins and the decision is kept in ``trace``. With
+    `hedge` the first matching specs race instead (see the module docstring).
+    """
+
+    def __init__(self, ydl, chain, verbose=True, hedge=False, hedge_timeout=None):
+        self.ydl = ydl
+        self.chain = list(chain)
+        self.verbose = verbose
+        self.hedge = hedge
+        self.hedge_timeout = HEDGE_TIMEOUT if hedge_timeout is None else hedge_timeout
+        self.probes = {}  # url -> Future of (alive, detail)
+        self.selectors = {}
+        self.trace = []
+        self.chosen_spec = None
+        self.chosen = []
+        self.decisions = {}  # format IDs of a video -> (position, spec) it resolved to
+
+    def selector(self, spec):
+        if spec not in self.selectors:
+            self.selectors[spec] = self.ydl.build_format_selector(spec)
+        return self.selectors[spec]
+
+    def note(self, message):
+        self.trace.append(message)
+        if self.verbose:
+            self.ydl.to_screen(f"[format] {message}")
+
+    def __call__(self, ctx):
+        self.trace = []
+        self.chosen_spec = None
+        self.chosen = []
+
+        formats = ctx['formats']
+        # yt-dlp passes no video ID; a video's format IDs identify it here
+        video = tuple(fmt.get('format_id') for fmt in formats)
+        if video in self.decisions:
+            i, spec = self.decisions[video]
+            selected = list(self.selector(spec)(ctx))
+            if selected:
+                return self.choose(i, spec, selected)
+        self.note(f"{len(formats)} format(s) available, trying {len(self.chain)} spec(s)")
+
+        candidates = []
+        for i, spec in enumerate(self.chain, 1):
+            try:
+                selected = list(self.selector(spec)(ctx))
+            except SyntaxError as e:
+                self.note(f"✗ {i}. {spec}: invalid spec ({e})")
+                continue
+
+            if not selected:
+                self.note(f"✗ {i}. {spec}: no matching format")
+                continue
+
+            if not self.hedge:
+                self.decisions[video] = (i, spec)
+                return self.choose(i, spec, selected)
+            ids = [fmt.get('format_id') for fmt in selected]
+            if any(ids == [fmt.get('format_id') for fmt in other] for _, _, other in candidates):
+                continue
+            self.note(f"~ {i}. {spec}: {', '.join(describe_format(fmt) for fmt in selected)}")
+            candidates.append((i, spec, selected))
+            if len(candidates) >= HEDGE_CANDIDATES:
+                break
+
+        if candidates:
+            i, spec, selected = self.race(candidates)
+            self.decisions[video] = (i, spec)
+            return self.choose(i, spec, selected)
+        self.note("✗ no spec in the chain matched any format")
+        return iter([])
+
+    def choose(self, i, spec, selected):
+        self.chosen_spec = spec
+        self.chosen = selected
+        for fmt in selected:
+            self.note(f"✓ {i}. {spec}: {describe_format(fmt)}")
+        return iter(selected)
+
+    def race(self, candidates):
+        """Probe every candidate's streams at once and pick the best that answers"""
+        started = monotonic()
+        deadline = started + self.hedge_timeout
+        targets = [probe_targets(selected) for _, _, selected in candidates]
+        new = {url: headers for streams in targets for url, headers in streams
+               if url not in self.probes or self.probes[url].cancelled()}
+        executor = None
+        if new:
+            executor = ThreadPoolExecutor(max_workers=len(new), thread_name_prefix='probe')
+            for url, headers in new.items():
+                self.probes[url] = executor.submit(probe, self.ydl, url, headers, self.hedge_timeout)
+
+        def state(streams):
+            # True: every stream answered, False: one failed, None: still waiting
+            futures = [self.probes[url] for url, _ in streams]
+            if any(f.done() and not f.result()[0] for f in futures):
+                return False
+            return True if all(f.done() for f in futures) else None
+
+        while True:
+            states = [state(streams) for streams in targets]
+            best = next((n for n, alive in enumerate(states) if alive is not False), None)
+            if best is None:
+                self.note("✗ no candidate answered, trying the first anyway")
+                winner = candidates[0]
+                break
+            if states[best]:
+                winner = candidates[best]
+                break
+            if monotonic() >= deadline:
+                # The best one known to work, else the best not known to fail
+                winner = candidates[states.index(True) if True in states else best]
+                self.note(f"⏱️ hedge timeout after {self.hedge_timeout:g}s")
+                break
+            waiting = [self.probes[url] for streams in targets for url, _ in streams
+                       if not self.probes[url].done()]
+            wait(waiting, timeout=deadline - monotonic(), return_when=FIRST_COMPLETED)
+
+        if executor is not None:
+            # Their answers no longer matter: cancel what has not started, and
+            # what has gives up at the deadline (the probes' own timeout)
+            for url in new:
+                self.probes[url].cancel()
+            executor.shutdown(wait=False)
+            details = ', '.join(
+                f"{url.split('?')[0].rsplit('/', 1)[-1] or url}: "
+                + (self.probes[url].result()[1] if self.probes[url].done()
+                   and not self.probes[url].cancelled() else 'abandoned')
+                for url in new)
+            self.note(f"⚡ probed {len(new)} stream(s) in {monotonic() - started:.2f}s ({details})")
+        return winner
@@ -0,0 +1,156 @@
+"""Adaptive fragment concurrency for DASH/HLS downloads.
+
+yt-dlp fetches the fragments of a DASH/HLS stream one at a time unless
+``concurrent_fragment_downloads`` is raised. The right level depends on the
+link: on high-latency connections many fragments must be in flight to fill
+the pipe, while too many gets a client throttled.
+
+FragmentTuner searches for that level as it goes. It measures every
+fragmented download (per-fragment latency and overall throughput) and sets
+the level for the next one. The level doubles while throughput keeps
+improving, settles on the best level once throughput plateaus, and is
+halved after failures or when a higher level turns out slower (throttling).
+
+Throughput is only compared between streams of the same kind (video or
+audio), and in multiples of the stream's bitrate where that is known, so a
+small audio stream or a low-bitrate video does not read as a slowdown.
+yt-dlp reads the option from the shared params dict each time a stream
+starts, so the video and audio streams of one job, and later jobs of the
+same quality profile, pick up the tuned value.
+"""
+
+import threading
+
+# (starting level, maximum level) per quality profile; audio-only streams
+# are small enough that a handful of fragments in flight saturates the link
+FRAGMENT_PROFILES = {
+    'best': (4, 16),
+    '720p': (4, 12),
+    '480p': (3, 8),
+    'worst': (2, 4),
+    'audio': (2, 4),
+}
+
+# A higher level must beat the best throughput seen by this much to count
+GAIN_THRESHOLD = 0.10
+# Falling this far below the best throughput at the same level means throttling
+THROTTLE_THRESHOLD = 0.40
+
+
+class FragmentTuner:
+    """Hill-climbing controller for concurrent_fragment_downloads"""
+
+    def __init__(self, start=4, maximum=16, minimum=1):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.level = max(minimum, min(start, maximum))
+        self.best = {}  # stream key -> (level, best normalized throughput)
+        self.settled = False
+        self.samples = []
+        self.lock = threading.Lock()
+
+    def record(self, level, speed, latency=None, stream='video', bitrate=None):
+        """Feed one finished fragmented download and pick the next level
+
+        `speed` is in bytes/s and `bitrate` (the stream's, if known) too.
+        """
+        with self.lock:
+            self.samples.append({'level': level, 'speed': speed, 'latency': latency, 'stream': stream})
+            key = (stream, 'realtime' if bitrate else 'bytes')
+            value = speed / bitrate if bitrate else speed
+
+            if key not in self.best and self.best:
+                # The search runs on another kind of stream; this one only
+                # gets a baseline to be compared with from now on
+                self.best[key] = (level, value)
+                return self.level
+            best_level, best_value = self.best.get(key, (level, 0.0))
+            if value > best_value * (1 + GAIN_THRESHOLD):
+                # Improvement: keep doubling until throughput plateaus
+                self.best[key] = (level, value)
+                self.level = level if self.settled else min(self.maximum, level * 2)
+                self.settled = self.level == level
+            elif level == best_level:
+                if value < best_value * (1 - THROTTLE_THRESHOLD):
+                    # Same level, much slower: the server is pushing back
+                    self.back_off()
+            else:
+                # Plateau: more parallelism stopped paying off
+                self.settled = True
+                self.level = best_level
+            return self.level
+
+    def failed(self):
+        """Back off after a failed fragmented download"""
+        with self.lock:
+            self.back_off()
+            return self.level
+
+    def back_off(self):
+        # Called with the lock held; restart the search from half the level
+        self.level = max(self.minimum, self.level // 2)
+        self.best = {}
+        self.settled = False
+
+    def progress_hook(self, ydl):
+        """yt-dlp progress hook that measures fragmented downloads of `ydl`
+
+        The tuned level is written back to ydl.params so that the next
+        stream this YoutubeDL starts uses it.
+        """
+        streams = {}
+        ydl.params['concurrent_fragment_downloads'] = self.level
+
+        def hook(d):
+            filename = d.get('filename')
+            if d['status'] == 'downloading' and d.get('fragment_count'):
+                stream = streams.setdefault(filename, {
+                    'level': ydl.params.get('concurrent_fragment_downloads', 1)})
+                stream['fragments'] = d.get('fragment_index') or 0
+                stream['elapsed'] = d.get('elapsed') or 0
+            elif d['status'] == 'finished' and filename in streams:
+                stream = streams.pop(filename)
+                elapsed = d.get('elapsed') or stream.get('elapsed') or 0
+                if elapsed <= 0:
+                    return
+                speed = (d.get('downloaded_bytes') or 0) / elapsed
+                latency = None
+                if stream.get('fragments'):
+                    # With N fragments in flight each one took about N times the average gap
+                    latency = elapsed * stream['level'] / stream['fragments']
+                info = d.get('info_dict') or {}
+                kind = 'audio' if info.get('vcodec') == 'none' else 'video'
+                bitrate = info.get('tbr') * 1000 / 8 if info.get('tbr') else None
+                ydl.params['concurrent_fragment_downloads'] = self.record(
+                    stream['level'], speed, latency, kind, bitrate)
+            elif d['status'] == 'error' and filename in streams:
+                streams.pop(filename)
+                ydl.params['concurrent_fragment_downloads'] = self.failed()
+
+        return hook
+
+    def summary(self):
+        """One-line description of the tuned level for job summaries"""
+        with self.lock:
+            if not self.samples:
+                return f"{self.level} (no fragmented streams measured yet)"
+            latencies = [s['latency'] for s in self.samples if s['latency']]
+            peak = max(s['speed'] for s in self.samples)
+            text = f"{self.level} (peak {peak/1024/1024:.2f}MiB/s over {len(self.samples)} stream(s)"
+            if latencies:
+                text += f", ~{sum(latencies)/len(latencies)*1000:.0f}ms/fragment"
+            text += ", settled)" if self.settled else ", still probing)"
+            return text
+
+
+_tuners = {}
+_tuners_lock = threading.Lock()
+
+
+def tuner_for(quality):
+    """Process-wide tuner for a quality profile, so jobs keep learning"""
+    with _tuners_lock:
+        if quality not in _tuners:
+            start, maximum = FRAGMENT_PROFILES.get(quality, FRAGMENT_PROFILES['best'])
+            _tuners[quality] = FragmentTuner(start, maximum)
+        return _tuners[quality]
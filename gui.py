@@ -7,7 +7,20 @@ import os
 from pathlib import Path
 import subprocess
 import queue
-import re
+import json
+import itertools
+from urllib.request import urlopen
+from io import BytesIO
+
+from journal import shared_journal
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None  # the thumbnail preview needs Pillow
+
+# Pause after the last edit of the URL before its metadata is prefetched
+PREFETCH_DELAY_MS = 600
 
 # Set appearance mode and color theme
 ctk.set_appearance_mode("dark")
@@ -31,6 +44,12 @@ class ModernYouTubeDownloader(ctk.CTk):
         self.quality_var = tk.StringVar(value="best")
         self.is_downloading = False
         self.progress_queue = queue.Queue()
+        self.worker_process = None
+        self.worker_lock = threading.Lock()
+        self.job_ids = itertools.count(1)
+        self.prefetch_after = None
+        self.prefetched_url = None
+        self.thumbnail_image = None
         
         # Configure grid
         self.grid_columnconfigure(0, weight=1)
@@ -44,6 +63,19 @@ class ModernYouTubeDownloader(ctk.CTk):
         # Start checking progress queue
         self.check_progress_queue()
         
+        # Fetch the video info while the user is still choosing options
+        self.url_var.trace_add("write", self.url_changed)
+        
+        # Offer to continue a download that was cut off last time
+        self.restore_interrupted()
+        
+        # Warm up the download worker so the first download skips startup
+        try:
+            self.ensure_worker()
+        except Exception as e:
+            print(f"Could not start download worker: {e}")
+        self.protocol("WM_DELETE_WINDOW", self.on_closing)
+        
     def center_window(self):
         """Center window on screen"""
         self.update_idletasks()
@@ -122,6 +154,9 @@ class ModernYouTubeDownloader(ctk.CTk):
         )
         self.url_entry.grid(row=1, column=0, sticky="ew", padx=25, pady=(0, 20))
         
+        # Thumbnail of the prefetched video; shown once it has loaded
+        self.thumbnail_label = ctk.CTkLabel(url_frame, text="")
+        
         # Quality and Path Section
         options_frame = ctk.CTkFrame(
             main_container,
@@ -143,14 +178,14 @@ class ModernYouTubeDownloader(ctk.CTk):
         quality_label.grid(row=0, column=0, sticky="w", padx=25, pady=(20, 10))
         
         quality_options = ["best", "720p", "480p", "audio"]
-        quality_icons = {
+        self.quality_icons = quality_icons = {
             "best": "🏆 Best Quality",
             "720p": "📺 720p HD",
             "480p": "📱 480p SD",
             "audio": "🎵 Audio Only"
         }
         
-        quality_menu = ctk.CTkOptionMenu(
+        self.quality_menu = quality_menu = ctk.CTkOptionMenu(
             options_frame,
             values=[quality_icons[q] for q in quality_options],
             command=self.quality_changed,
@@ -161,6 +196,7 @@ class ModernYouTubeDownloader(ctk.CTk):
             button_color=("#3a9bff", "#1f538d"),
             button_hover_color=("#5eb3ff", "#2d6bb5")
         )
+        self.quality_labels = dict(quality_icons)
         quality_menu.set(quality_icons["best"])
         quality_menu.grid(row=1, column=0, columnspan=2, sticky="ew", padx=25, pady=(0, 20))
         
@@ -274,20 +310,133 @@ class ModernYouTubeDownloader(ctk.CTk):
         
     def quality_changed(self, choice):
         """Handle quality selection change"""
-        quality_map = {
-            "🏆 Best Quality": "best",
-            "📺 720p HD": "720p",
-            "📱 480p SD": "480p",
-            "🎵 Audio Only": "audio"
-        }
+        quality_map = {label: quality for quality, label in self.quality_labels.items()}
         self.quality_var.set(quality_map.get(choice, "best"))
         
+    def set_quality_labels(self, labels):
+        """Show `labels` ({quality: text}) in the quality menu, keeping the selection"""
+        self.quality_labels = labels
+        self.quality_menu.configure(values=list(labels.values()))
+        self.quality_menu.set(labels.get(self.quality_var.get(), labels["best"]))
+        
+    def url_changed(self, *args):
+        """Prefetch the video info once the URL has stopped changing"""
+        if self.prefetch_after is not None:
+            self.after_cancel(self.prefetch_after)
+            self.prefetch_after = None
+        url = self.url_var.get().strip()
+        if url == self.prefetched_url:
+            return
+        self.prefetched_url = None
+        self.set_quality_labels(dict(self.quality_icons))
+        self.thumbnail_label.grid_remove()
+        if url.startswith(("http://", "https://")) and not self.is_downloading:
+            self.prefetch_after = self.after(PREFETCH_DELAY_MS, self.prefetch, url)
+            
+    def prefetch(self, url):
+        """Ask the worker for the video info of `url` ahead of the download"""
+        self.prefetch_after = None
+        if url != self.url_var.get().strip() or self.is_downloading:
+            return
+        self.prefetched_url = url
+        self.update_status("🔍 Fetching video info...")
+        job = {"cmd": "prefetch", "id": f"p{next(self.job_ids)}", "url": url}
+        threading.Thread(target=self.prefetch_worker, args=(job,), daemon=True).start()
+        
+    def prefetch_worker(self, job):
+        """Send a prefetch to the persistent worker; a failure only costs the head start"""
+        try:
+            self.send_job(job)
+        except Exception as e:
+            print(f"Could not prefetch: {e}")  # Debug output
+        
+    def show_prefetch(self, event):
+        """Fill the form from a prefetch event of the current URL"""
+        if event.get("url") != self.url_var.get().strip() or self.is_downloading:
+            return
+        if event.get("error"):
+            self.prefetched_url = None  # try again on the next edit
+            self.update_status(f"⚠️ Could not fetch video info: {event['error']}")
+            return
+        
+        status = f"📺 {event.get('title') or 'Unknown Title'}"
+        duration = event.get("duration")
+        if duration:
+            mins, secs = divmod(int(duration), 60)
+            status += f"  ⏱️ {mins:02d}:{secs:02d}"
+        self.update_status(status + "  • Ready to download")
+        
+        labels = dict(self.quality_icons)
+        for quality, chosen in (event.get("qualities") or {}).items():
+            if quality not in labels:
+                continue
+            if chosen is None:
+                labels[quality] += "  (unavailable)"
+                continue
+            details = [f"{chosen['height']}p" if chosen.get("height") and quality != "audio" else chosen.get("ext")]
+            if chosen.get("size"):
+                details.append(f"~{chosen['size']/1024/1024:.0f}MiB")
+            labels[quality] += f"  ({', '.join(detail for detail in details if detail)})"
+        self.set_quality_labels(labels)
+        
+        if Image is not None and event.get("thumbnail"):
+            threading.Thread(target=self.fetch_thumbnail, args=(event["url"], event["thumbnail"]),
+                             daemon=True).start()
+            
+    def fetch_thumbnail(self, url, thumbnail_url):
+        """Background thread: download a thumbnail for the UI"""
+        try:
+            with urlopen(thumbnail_url, timeout=10) as response:
+                data = response.read()
+        except Exception as e:
+            print(f"Could not load thumbnail: {e}")  # Debug output
+            return
+        self.progress_queue.put({"event": "thumbnail", "url": url, "data": data})
+        
+    def show_thumbnail(self, event):
+        if event["url"] != self.url_var.get().strip():
+            return
+        try:
+            image = Image.open(BytesIO(event["data"]))
+        except Exception as e:
+            print(f"Could not show thumbnail: {e}")  # Debug output
+            return
+        height = 90
+        width = max(1, int(image.width * height / max(1, image.height)))
+        self.thumbnail_image = ctk.CTkImage(light_image=image, dark_image=image, size=(width, height))
+        self.thumbnail_label.configure(image=self.thumbnail_image)
+        self.thumbnail_label.grid(row=2, column=0, sticky="w", padx=25, pady=(0, 20))
+        
     def browse_folder(self):
         """Open folder browser"""
         folder = filedialog.askdirectory(initialdir=self.download_path.get())
         if folder:
             self.download_path.set(folder)
             
+    def restore_interrupted(self):
+        """Pre-fill the form with the most recent interrupted download"""
+        try:
+            jobs = shared_journal().unfinished()
+        except Exception as e:
+            print(f"Could not read the job journal: {e}")
+            return
+        if not jobs:
+            return
+        
+        job = jobs[-1]
+        self.url_var.set(job["url"])
+        if job["output_path"]:
+            self.download_path.set(job["output_path"])
+        quality = job["quality"] if job["quality"] in self.quality_icons else "best"
+        self.quality_var.set(quality)
+        self.quality_menu.set(self.quality_icons[quality])
+        
+        offset = job["downloaded_bytes"] or 0
+        message = "⏸️ Interrupted download found"
+        if offset:
+            message += f" ({offset/1024/1024:.1f}MiB done)"
+        self.update_status(message + ". Click Download to resume.")
+        
     def update_status(self, message, progress=None):
         """Update status label and progress bar"""
         self.status_label.configure(text=message)
@@ -295,34 +444,53 @@ class ModernYouTubeDownloader(ctk.CTk):
             self.progress_bar.set(progress)
             
     def check_progress_queue(self):
-        """Check for progress updates from download thread"""
+        """Apply job events from the download worker to the UI"""
         try:
             while True:
-                message = self.progress_queue.get_nowait()
+                event = self.progress_queue.get_nowait()
+                kind = event.get("event")
                 
-                if message.startswith("PROGRESS:"):
-                    # Parse progress percentage
-                    try:
-                        percent_str = message.split(":")[1].strip()
-                        percent = float(re.search(r'(\d+\.?\d*)%', percent_str).group(1))
+                if kind == "progress":
+                    percent = event.get("percent")
+                    if percent is not None:
                         self.progress_bar.set(percent / 100)
-                        self.status_label.configure(text=percent_str)
-                    except:
-                        self.status_label.configure(text=message.replace("PROGRESS:", ""))
-                        
-                elif message.startswith("STATUS:"):
-                    status = message.replace("STATUS:", "").strip()
+                    self.status_label.configure(text=self.format_progress(event))
+                    
+                elif kind == "metadata":
+                    status = f"📺 {event.get('title') or 'Unknown Title'}"
+                    duration = event.get("duration")
+                    if duration:
+                        mins, secs = divmod(int(duration), 60)
+                        status += f"  ⏱️ {mins:02d}:{secs:02d}"
                     self.status_label.configure(text=status)
                     
-                elif message == "COMPLETE":
+                elif kind == "phase":
+                    phase_text = {
+                        "extracting": "🔍 Fetching video info...",
+                        "downloading": "⬇️ Downloading...",
+                        "postprocessing": "⚙️ Processing...",
+                    }
+                    if event.get("phase") in phase_text:
+                        self.status_label.configure(text=phase_text[event["phase"]])
+                        
+                elif kind == "postprocess" and event.get("status") == "started":
+                    self.status_label.configure(text=f"⚙️ {event.get('postprocessor')}...")
+                    
+                elif kind == "prefetch":
+                    self.show_prefetch(event)
+                    
+                elif kind == "thumbnail":
+                    self.show_thumbnail(event)
+                    
+                elif kind == "done":
                     self.progress_bar.set(1.0)
                     self.status_label.configure(text="✅ Download completed successfully!")
                     self.download_btn.configure(state="normal", text="⬇️  START DOWNLOAD")
                     self.is_downloading = False
                     messagebox.showinfo("Success", f"Video downloaded successfully!\nSaved to: {self.download_path.get()}")
                     
-                elif message.startswith("ERROR:"):
-                    error = message.replace("ERROR:", "").strip()
+                elif kind == "error":
+                    error = event.get("message") or "Download failed. Please check the URL and try again."
                     self.status_label.configure(text=f"❌ Error: {error}")
                     self.download_btn.configure(state="normal", text="⬇️  START DOWNLOAD")
                     self.is_downloading = False
@@ -334,51 +502,101 @@ class ModernYouTubeDownloader(ctk.CTk):
         # Schedule next check
         self.after(100, self.check_progress_queue)
         
-    def download_worker(self, url, output_path, quality):
-        """Worker thread for downloading video"""
-        try:
+    @staticmethod
+    def format_progress(event):
+        """Status line for a progress event"""
+        parts = []
+        if event.get("percent") is not None:
+            parts.append(f"{event['percent']:.1f}%")
+        if event.get("total_bytes"):
+            parts.append(f"of {event['total_bytes']/1024/1024:.2f}MiB")
+        if event.get("speed"):
+            parts.append(f"at {event['speed']/1024/1024:.2f}MiB/s")
+        if event.get("eta") is not None:
+            mins, secs = divmod(int(event["eta"]), 60)
+            parts.append(f"ETA {mins:02d}:{secs:02d}")
+        return "⬇️ " + " ".join(parts) if parts else "⬇️ Downloading..."
+        
+    def ensure_worker(self):
+        """Start the persistent main.py --serve worker if it is not running"""
+        with self.worker_lock:
+            if self.worker_process and self.worker_process.poll() is None:
+                return self.worker_process
+            
             # Get the script directory
             script_dir = os.path.dirname(os.path.abspath(__file__))
             main_script = os.path.join(script_dir, "main.py")
             
-            # Prepare command
-            cmd = [sys.executable, main_script, url, output_path, quality]
-            
-            # Run download process
-            process = subprocess.Popen(
-                cmd,
+            # One long-lived process keeps yt-dlp imported between downloads
+            self.worker_process = subprocess.Popen(
+                [sys.executable, main_script, "--serve"],
+                stdin=subprocess.PIPE,
                 stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
                 text=True,
-                bufsize=1,
-                universal_newlines=True
+                encoding="utf-8",
+                bufsize=1
+            )
+            
+            reader_thread = threading.Thread(
+                target=self.worker_reader,
+                args=(self.worker_process,),
+                daemon=True
             )
+            reader_thread.start()
+            return self.worker_process
+            
+    def worker_reader(self, process):
+        """Reader thread that queues the worker's JSON events for the UI"""
+        for line in process.stdout:
+            try:
+                event = json.loads(line)
+            except ValueError:
+                print(line.rstrip())  # Debug output
+                continue
             
-            # Read output line by line
-            for line in process.stdout:
-                line = line.strip()
-                if line:
-                    # Parse download progress
-                    if "[download]" in line and "%" in line:
-                        self.progress_queue.put(f"PROGRESS:{line}")
-                    elif "Starting download" in line or "Title:" in line or "Duration:" in line:
-                        self.progress_queue.put(f"STATUS:{line}")
-                    elif "completed successfully" in line:
-                        self.progress_queue.put(f"STATUS:{line}")
-                    else:
-                        print(line)  # Debug output
+            if event.get("event") == "log":
+                print(event.get("message", ""))  # Debug output
+            elif event.get("id") is not None:
+                self.progress_queue.put(event)
+        
+        # The worker exited; fail the running job so the UI does not hang
+        if self.is_downloading:
+            self.progress_queue.put({"event": "error",
+                                     "message": "Download worker stopped unexpectedly. Click Download to resume."})
             
-            # Wait for process to complete
-            process.wait()
+    def send_job(self, job):
+        """Write one JSON line to the persistent worker"""
+        process = self.ensure_worker()
+        with self.worker_lock:
+            process.stdin.write(json.dumps(job) + "\n")
+            process.stdin.flush()
             
-            if process.returncode == 0:
-                self.progress_queue.put("COMPLETE")
-            else:
-                self.progress_queue.put("ERROR:Download failed. Please check the URL and try again.")
+    def download_worker(self, url, output_path, quality):
+        """Send a download job to the persistent worker"""
+        try:
+            # Extracted already if the URL was prefetched
+            self.send_job({
+                "id": str(next(self.job_ids)),
+                "url": url,
+                "output_path": output_path,
+                "quality": quality
+            })
                 
         except Exception as e:
-            self.progress_queue.put(f"ERROR:{str(e)}")
+            self.progress_queue.put({"event": "error", "message": str(e)})
             
+    def on_closing(self):
+        """Stop the download worker and close the window"""
+        process = self.worker_process
+        if process and process.poll() is None:
+            try:
+                process.stdin.write(json.dumps({"cmd": "shutdown"}) + "\n")
+                process.stdin.flush()
+                process.stdin.close()
+            except OSError:
+                pass
+        self.destroy()
+        
     def start_download(self):
         """Start download process"""
         if self.is_downloading:
@@ -0,0 +1,213 @@
+"""Crash-safe journal of download jobs.
+
+Every download is recorded before it starts and its state is updated as it
+moves through the pipeline:
+
+    queued -> extracting -> downloading -> merging -> done   (or failed)
+
+While downloading, the chosen format, the file being written and its byte
+offset are recorded too. If the process is killed, the row stays in an
+unfinished state. yt-dlp leaves the partial ``.part`` file (and the
+``.ytdl`` fragment index of DASH/HLS streams) behind. Resuming the job asks
+for the same format again, so the same partial file is picked up and
+continued from its offset instead of starting from zero.
+
+The journal is a SQLite database in WAL mode: every state change is a
+small committed transaction that survives a crash of the writer.
+"""
+
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+
+from paths import data_path
+
+STATES = ('queued', 'extracting', 'downloading', 'merging', 'done', 'failed')
+UNFINISHED = ('queued', 'extracting', 'downloading', 'merging')
+
+# Byte offsets are written at most this often per job (seconds)
+PROGRESS_INTERVAL = 1.0
+
+
+def pid_alive(pid):
+    """True if a process with this PID is still running"""
+    if not pid:
+        return False
+    if sys.platform == 'win32':
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x100000, False, pid)  # SYNCHRONIZE
+        if not handle:
+            return False
+        try:
+            return kernel32.WaitForSingleObject(handle, 0) == 0x102  # WAIT_TIMEOUT
+        finally:
+            kernel32.CloseHandle(handle)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    try:
+        # A killed process that was not reaped yet is a zombie, not running
+        with open(f'/proc/{pid}/stat') as f:
+            return f.read().rsplit(')', 1)[1].split()[0] != 'Z'
+    except (OSError, IndexError):
+        return True
+
+
+class JobJournal:
+    """Persistent record of download jobs and how far each one got"""
+
+    COLUMNS = ('id', 'url', 'output_path', 'quality', 'options', 'parent', 'state',
+               'format_id', 'filename', 'downloaded_bytes', 'total_bytes', 'filepath',
+               'error', 'pid', 'created', 'updated')
+
+    def __init__(self, path=None):
+        self.path = str(path or data_path('journal.sqlite3'))
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        with self.db:
+            self.db.execute(
+                'CREATE TABLE IF NOT EXISTS jobs ('
+                ' id TEXT PRIMARY KEY, url TEXT NOT NULL, output_path TEXT, quality TEXT,'
+                ' options TEXT, parent TEXT, state TEXT NOT NULL, format_id TEXT,'
+                ' filename TEXT, downloaded_bytes INTEGER, total_bytes INTEGER,'
+                ' filepath TEXT, error TEXT, pid INTEGER, created REAL NOT NULL,'
+                ' updated REAL NOT NULL)')
+            self.db.execute('CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, updated)')
+            self.db.execute('CREATE INDEX IF NOT EXISTS jobs_url ON jobs (url)')
+
+    def row(self, values):
+        job = dict(zip(self.COLUMNS, values))
+        job['options'] = json.loads(job['options'] or '{}')
+        return job
+
+    def add(self, url, output_path=None, quality='best', options=None, parent=None):
+        """Record a new queued job and return its id"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self.lock, self.db:
+            self.db.execute(
+                'INSERT INTO jobs (id, url, output_path, quality, options, parent, state,'
+                ' pid, created, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (job_id, url, output_path, quality, json.dumps(options or {}), parent,
+                 'queued', os.getpid(), now, now))
+        return job_id
+
+    def get(self, job_id):
+        with self.lock:
+            values = self.db.execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self.row(values) if values else None
+
+    def update(self, job_id, state=None, **fields):
+        """Set the state and/or any other columns of a job"""
+        if state is not None:
+            if state not in STATES:
+                raise ValueError(f"Unknown job state: {state}")
+            fields['state'] = state
+        fields['updated'] = time.time()
+        columns = ', '.join(f"{name} = ?" for name in fields)
+        with self.lock, self.db:
+            self.db.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+
+    def claim(self, job_id):
+        """Take over an interrupted job in this process"""
+        self.update(job_id, pid=os.getpid(), error=None)
+
+    def unfinished(self, include_failed=False, top_level=True):
+        """Jobs that did not finish and whose process is gone, oldest first"""
+        states = UNFINISHED + (('failed',) if include_failed else ())
+        query = (f"SELECT {', '.join(self.COLUMNS)} FROM jobs"
+                 f" WHERE state IN ({', '.join('?' * len(states))})")
+        if top_level:
+            query += ' AND parent IS NULL'
+        with self.lock:
+            rows = self.db.execute(query + ' ORDER BY created', states).fetchall()
+        jobs = [self.row(values) for values in rows]
+        # A job still owned by a running process (another batch, the GUI's
+        # worker) is in progress, not interrupted
+        return [job for job in jobs if job['state'] == 'failed' or not pid_alive(job['pid'])]
+
+    def find_interrupted(self, url, quality, output_path):
+        """Most recent interrupted job for the same download, or None"""
+        with self.lock:
+            rows = self.db.execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM jobs WHERE url = ? AND quality IS ?"
+                f" AND output_path IS ? AND state IN ({', '.join('?' * len(UNFINISHED))})"
+                ' ORDER BY created DESC', (url, quality, output_path, *UNFINISHED)).fetchall()
+        for values in rows:
+            job = self.row(values)
+            if not pid_alive(job['pid']):
+                return job
+        return None
+
+    def counts(self):
+        with self.lock:
+            return dict(self.db.execute('SELECT state, COUNT(*) FROM jobs GROUP BY state').fetchall())
+
+    def clear(self, states=('done', 'failed')):
+        """Remove jobs in the given states (finished ones by default)"""
+        with self.lock, self.db:
+            return self.db.execute(
+                f"DELETE FROM jobs WHERE state IN ({', '.join('?' * len(states))})",
+                tuple(states)).rowcount
+
+    def progress_hook(self, job_id, resolver=None):
+        """yt-dlp progress hook that records the byte offset of job_id
+
+        `resolver` (a formats.FormatResolver) supplies the chosen format,
+        so a resumed job can ask for exactly the same one.
+        """
+        last = {'written': 0.0}
+
+        def hook(d):
+            if d['status'] not in ('downloading', 'finished'):
+                return
+            now = time.monotonic()
+            first = last['written'] == 0.0
+            if d['status'] == 'downloading' and not first and now - last['written'] < PROGRESS_INTERVAL:
+                return
+            last['written'] = now
+            fields = {
+                'filename': d.get('filename'),
+                'downloaded_bytes': d.get('downloaded_bytes'),
+                'total_bytes': d.get('total_bytes') or d.get('total_bytes_estimate'),
+            }
+            if first and resolver is not None and resolver.chosen:
+                fields['format_id'] = '+'.join(
+                    fmt.get('format_id') for fmt in resolver.chosen if fmt.get('format_id'))
+            self.update(job_id, 'downloading', **fields)
+
+        return hook
+
+    def postprocessor_hook(self, job_id):
+        """yt-dlp postprocessor hook that marks job_id as merging"""
+        def hook(d):
+            if d['status'] == 'started':
+                self.update(job_id, 'merging')
+
+        return hook
+
+    def close(self):
+        self.db.close()
+
+
+_shared_journal = None
+_shared_lock = threading.Lock()
+
+
+def shared_journal():
+    """Process-wide JobJournal at the default location"""
+    global _shared_journal
+    with _shared_lock:
+        if _shared_journal is None:
+            _shared_journal = JobJournal()
+        return _shared_journal
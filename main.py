@@ -1,16 +1,44 @@
+import argparse
 import os
 import subprocess
 import sys
 import json
+import sqlite3
+from contextlib import nullcontext, redirect_stderr, redirect_stdout
 from pathlib import Path
-from time import sleep
-from yt_dlp.utils import DownloadError
+from time import monotonic, sleep
+from yt_dlp.postprocessor import FFmpegExtractAudioPP
+from yt_dlp.utils import DownloadError, ExtractorError
 import yt_dlp
 
+from archive import shared_archive
+from audiostream import AUDIO_QUALITY, StreamingUnavailable, stream_transcode
+from bandwidth import PRIORITIES, shared_bandwidth
+from clips import clip_options, describe_clips, ffmpeg_from_location, ydl_clip_params
+from diskio import shared_disk_io
+from batch import DEFAULT_WORKERS, LineOutput, print_summary, read_urls, run_batch
+from events import EventWriter, JobEvents
+from formats import HEDGE_ENABLED, QUALITY_FORMATS, FormatResolver, format_chain
+from fragments import tuner_for
+from journal import STATES as JOB_STATES, shared_journal
+from mediastore import destination_for, link_file, media_key, shared_store
+from metacache import fetch_info, lookup_key, shared_cache
+from metrics import JobMetrics, mark_startup, profiled, serve_metrics, shared_metrics
+from pipeline import DEFAULT_PP_WORKERS, PostProcessPool, capture_post_process, run_deferred
+from playlist import download_playlist, entry_url, is_playlist, is_resolved
+from postplan import AUDIO_TARGETS, Plan, audio_selector, parse_audio_formats, plan_audio, plan_video
+from prefetch import Prefetcher
+from progress import format_progress, shared_progress
+from scheduler import ORDERS, InsufficientSpace, Scheduler
+from session import DEFAULT_MAX_IDLE, SessionPool, checkout
+
 # Set UTF-8 encoding for stdout on Windows
 if sys.platform == 'win32':
     sys.stdout.reconfigure(encoding='utf-8')
 
+# Interpreter start and imports, reported as the startup time in metrics
+mark_startup()
+
 # Get the directory where this script is located
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 
@@ -18,6 +46,10 @@ SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 FFMPEG_PATH = os.path.join(SCRIPT_DIR, 'ffmpeg.exe')
 FFPROBE_PATH = os.path.join(SCRIPT_DIR, 'ffprobe.exe')
 
+class DownloadFailed(Exception):
+    """Raised when a download could not be completed"""
+
+
 # Simple ASCII banner that works everywhere
 def print_banner():
     banner = """
@@ -54,42 +86,88 @@ def download_with_progress(url, output_path):
         ydl.download([url])
 
 
-def download_video(url, output_path=None, quality='best'):
-    """Download a video from YouTube with the specified quality"""
+def download_video(url, output_path=None, quality='best', info=None, workers=DEFAULT_WORKERS,
+                   use_cache=True, use_archive=True, fragments='auto', events=None,
+                   use_journal=True, resume=None, parent_job=None, priority='normal',
+                   stream_audio=True, audio_format=None, postprocess=None, sessions=None,
+                   job_metrics=None, hedge=HEDGE_ENABLED, clips=None, precise_cuts=False,
+                   disk_io=None, use_store=True):
+    """Download a video from YouTube with the specified quality
+
+    Playlist and channel URLs download every entry on `workers` threads.
+    Returns the file's path, or with `postprocess` (a PostProcessPool) a
+    Future of it. The other options are described where they are
+    implemented: use_cache in metacache.py, use_archive in archive.py,
+    fragments in fragments.py, events in events.py, use_journal, resume
+    and parent_job in journal.py, priority in bandwidth.py, stream_audio
+    and audio_format in audiostream.py and postplan.py, sessions in
+    session.py, job_metrics in metrics.py, hedge in formats.py, clips and
+    precise_cuts in clips.py, disk_io in diskio.py, use_store in
+    mediastore.py.
+    """
+    if not isinstance(url, str) or not url.strip():
+        raise DownloadFailed("No URL given")
     if not output_path:
         output_path = str(Path.home() / "Videos")
     
     os.makedirs(output_path, exist_ok=True)
+    disk_io = disk_io or shared_disk_io()
+    work_path = disk_io.work_dir(output_path)
+    store = shared_store() if use_store else None
+    if store and not store.enabled:
+        store = None
     
-    # Quality options mapping with fallbacks
-    quality_formats = {
-        'best': 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/bestvideo+bestaudio/best[ext=mp4]/best',
-        'worst': 'worst[ext=mp4]/worst',
-        '720p': 'bestvideo[height<=720][ext=mp4]+bestaudio[ext=m4a]/bestvideo[height<=720]+bestaudio/best[height<=720][ext=mp4]/best[height<=720]',
-        '480p': 'bestvideo[height<=480][ext=mp4]+bestaudio[ext=m4a]/bestvideo[height<=480]+bestaudio/best[height<=480][ext=mp4]/best[height<=480]',
-        'audio': 'bestaudio[ext=m4a]/bestaudio/best'
-    }
+    try:
+        accepted_audio = parse_audio_formats(audio_format)
+    except ValueError as e:
+        raise DownloadFailed(str(e)) from e
+    format_selector = QUALITY_FORMATS.get(quality, 'best[ext=mp4]/best')
+    if quality == 'audio':
+        format_selector = audio_selector(accepted_audio)
+    chain = format_chain(format_selector)
     
-    format_selector = quality_formats.get(quality, 'best[ext=mp4]/best')
+    # Record the job before anything can go wrong, or pick up the one a
+    # killed process left behind together with its partial files
+    journal = shared_journal() if use_journal else None
+    job_id = None
+    if journal:
+        try:
+            job = journal.get(resume) if resume else journal.find_interrupted(url, quality, output_path)
+            if job:
+                job_id = job['id']
+                journal.claim(job_id)
+                if job['format_id']:
+                    # The same format writes to the same .part files
+                    chain = [job['format_id']] + [spec for spec in chain if spec != job['format_id']]
+                if job['downloaded_bytes']:
+                    print(f"♻️ Resuming interrupted download at {job['downloaded_bytes']/1024/1024:.2f}MiB")
+            else:
+                job_id = journal.add(url, output_path, quality, parent=parent_job, options={
+                    'workers': workers, 'use_cache': use_cache, 'use_archive': use_archive,
+                    'fragments': fragments, 'priority': priority, 'stream_audio': stream_audio,
+                    'audio_format': audio_format, 'hedge': hedge, 'clips': clips,
+                    'precise_cuts': precise_cuts, 'use_store': use_store})
+        except sqlite3.Error as e:
+            # The download itself does not need the journal
+            print(f"⚠️ Job journal unavailable, this job is not recorded: {e}")
+            journal = job_id = None
+    
+    # Progress lines are throttled and smoothed by the shared aggregator, which
+    # also rolls up concurrent jobs (see progress.py)
+    progress_key = object()
     
-    # Progress hook to print progress on separate lines (not carriage returns)
     def progress_hook(d):
-        if d['status'] == 'downloading':
-            if 'total_bytes' in d or 'total_bytes_estimate' in d:
-                total = d.get('total_bytes') or d.get('total_bytes_estimate')
-                downloaded = d.get('downloaded_bytes', 0)
-                if total:
-                    percent = (downloaded / total) * 100
-                    speed = d.get('speed', 0)
-                    speed_str = f"{speed/1024/1024:.2f}MiB/s" if speed else "N/A"
-                    # Print on new line so it's captured by the app
-                    print(f"[download] {percent:.1f}% of {total/1024/1024:.2f}MiB at {speed_str}", flush=True)
-        elif d['status'] == 'finished':
+        snapshot = shared_progress().update(progress_key, d)
+        if snapshot is None:
+            return
+        if d['status'] == 'finished':
             print(f"[download] 100% Download complete, now post-processing...", flush=True)
+        else:
+            print(f"[download] {format_progress(snapshot)}", flush=True)
     
     ydl_opts = {
         'format': format_selector,
-        'outtmpl': f'{output_path}/%(title)s.%(ext)s',
+        'outtmpl': f'{work_path}/%(title)s.%(ext)s',
         'merge_output_format': 'mp4' if quality != 'audio' else None,
         'quiet': False,
         'no_warnings': False,
@@ -98,79 +176,818 @@ def download_video(url, output_path=None, quality='best'):
         'ignoreerrors': False,
         'ffmpeg_location': SCRIPT_DIR,  # Point to the directory containing ffmpeg.exe
         'progress_hooks': [progress_hook],  # Add progress hook
+        'noprogress': True,  # yt-dlp's own per-chunk bar; the hook above replaces it
     }
     
-    if quality == 'audio':
-        ydl_opts['format'] = 'bestaudio'
-        ydl_opts['postprocessors'] = [{
-            'key': 'FFmpegExtractAudio',
-            'preferredcodec': 'mp3',
-            'preferredquality': '192',
-        }]
+    if clips:
+        # ffmpeg fetches only the byte ranges or segments of each clip
+        ydl_opts.update(ydl_clip_params(clips, precise_cuts, SCRIPT_DIR))
+        ydl_opts['outtmpl'] = f'{work_path}/%(title)s [%(section_start)s-%(section_end|end)s].%(ext)s'
+    
+    if events:
+        # Structured events replace the text progress lines
+        ydl_opts['progress_hooks'] = [events.progress_hook]
+        ydl_opts['postprocessor_hooks'] = [events.postprocessor_hook]
+    
+    # Extractor and video ID straight from the URL, without any network access
+    url_key = lookup_key(url) if info is None else (info.get('extractor_key'), info.get('id'))
+    if url_key and not all(url_key):
+        url_key = None
+    # A short link or embed is known under the key of the video it points to
+    alias_key = url_key
+    if url_key:
+        url_key = shared_cache().canonical(*url_key)
+    cache_hit = False
+    job_metrics = job_metrics or JobMetrics(url, quality)
+    timer = job_metrics.timer
+    bandwidth = shared_bandwidth()
+    
+    def record(status, error=None):
+        # Once per job; a playlist is counted through its entries instead
+        if job_metrics.status is None:
+            job_metrics.finish(status, error)
+            shared_metrics().record(job_metrics)
+    
+    def in_archive(key):
+        # The archive records whole videos; a clip is never one
+        return bool(use_archive and key and all(key) and not clips
+                    and shared_archive().contains(*key, quality))
     
+    def skip_archived(key):
+        print(f"⏭️ Already downloaded at {quality} quality (in archive), skipping")
+        filepath = shared_archive().lookup(*key, quality)[1]
+        if filepath and os.path.dirname(os.path.abspath(filepath)) != os.path.abspath(output_path):
+            # Downloaded into another folder; here it only needs a name, but
+            # it is not copied across filesystems
+            try:
+                destination = destination_for(filepath, output_path, os.path.basename(filepath))
+                if not os.path.exists(destination):
+                    os.makedirs(output_path, exist_ok=True)
+                    print(f"📦 Placed by {link_file(filepath, destination, copy=False)} from {filepath}")
+                filepath = destination
+            except OSError:
+                print(f"📁 The file is at {filepath}")
+        if journal:
+            journal.update(job_id, 'done', filepath=filepath)
+        record('skipped')
+        return filepath
+    
+    share = None
     try:
         print(f"🎬 Starting download...")
         print(f"📂 Output folder: {output_path}")
         print(f"🎯 Quality: {quality}")
+        if clips:
+            print(f"✂️ Clips: {describe_clips(clips)}")
         print("-" * 50)
         
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            # Get video info first
-            info = ydl.extract_info(url, download=False)
+        if in_archive(url_key):
+            return skip_archived(url_key)
+        
+        if events:
+            events.phase('extracting')
+        if journal:
+            journal.update(job_id, 'extracting')
+        
+        with checkout(ydl_opts, sessions) as lease:
+            ydl = lease.ydl
+            # The quality chain and the fallbacks are all tried locally against
+            # the extracted formats, so a missing format never re-extracts
+            ydl.format_selector = resolver = FormatResolver(ydl, chain, hedge=hedge)
+            if journal:
+                ydl.add_progress_hook(journal.progress_hook(job_id, resolver))
+                ydl.add_postprocessor_hook(journal.postprocessor_hook(job_id))
+            ydl.add_progress_hook(job_metrics.progress_hook)
+            ydl.add_postprocessor_hook(job_metrics.postprocessor_hook)
+            job_metrics.count_retries(ydl)
+            disk_io.install(ydl)
+            
+            tuner = None
+            if fragments == 'auto':
+                tuner = tuner_for(quality)
+                ydl.add_progress_hook(tuner.progress_hook(ydl))
+            else:
+                ydl.params['concurrent_fragment_downloads'] = max(1, int(fragments))
+            
+            # Extract once; the same info dict is handed to the download and
+            # post-processing stages instead of extracting the URL again
+            with timer.stage('extract'):
+                if info is None:
+                    info, hit = fetch_info(ydl, url, use_cache, alias_key)
+                    if hit is not None:
+                        job_metrics.cache = 'hit' if hit else 'miss'
+                    if hit:
+                        cache_hit = True
+                        print("⚡ Using cached metadata")
+            
+            # Unknown from the URL alone (a short link, the generic extractor)
+            video_key = (info.get('extractor_key'), info.get('id'))
+            if not is_playlist(info) and video_key != url_key and in_archive(video_key):
+                return skip_archived(video_key)
+            
+            if events:
+                events.metadata(info)
+            
+            if is_playlist(info):
+                def download_entry(entry):
+                    resolved = entry if is_resolved(entry) else None
+                    # A deferred post-process hands back its Future; run_batch
+                    # waits on it so a failed transcode counts as a failed entry
+                    return download_video(entry_url(entry), output_path, quality, info=resolved, workers=1,
+                                   use_cache=use_cache, use_archive=use_archive, fragments=fragments,
+                                   events=events, use_journal=use_journal, parent_job=job_id,
+                                   priority=priority, stream_audio=stream_audio,
+                                   audio_format=audio_format, postprocess=postprocess,
+                                   sessions=sessions, hedge=hedge, clips=clips,
+                                   precise_cuts=precise_cuts, disk_io=disk_io, use_store=use_store)
+                
+                job_metrics.status = 'playlist'
+                jobs = download_playlist(info, download_entry, workers)
+                failed = sum(1 for job in jobs if job.status != 'done')
+                if failed:
+                    raise DownloadFailed(f"{failed} of {len(jobs)} playlist entries failed")
+                print(f"📁 Files saved to: {output_path}")
+                if journal:
+                    journal.update(job_id, 'done')
+                return None
+            
             title = info.get('title', 'Unknown Title')
             duration = info.get('duration', 0)
             
             print(f"📺 Title: {title}")
             if duration:
-                mins, secs = divmod(duration, 60)
+                mins, secs = divmod(int(duration), 60)
                 print(f"⏱️ Duration: {mins:02d}:{secs:02d}")
             
-            # Download the video
-            ydl.download([url])
+            # Take a weighted share of the bandwidth cap while transferring
+            if bandwidth.enabled:
+                share = bandwidth.register(title, PRIORITIES.get(priority, PRIORITIES['normal']))
+                ydl.add_progress_hook(bandwidth.progress_hook(share, ydl))
+            
+            # With a pool, the merge/transcode of this job is held back and
+            # runs there while this worker moves on to the next download
+            deferred = capture_post_process(ydl, timer, defer=postprocess is not None)
+            
+            with timer.stage('download'):
+                # Plan the cheapest post-processing for the formats that will be
+                # picked: copy streams where the codecs allow, re-encode otherwise
+                selected = plan = None
+                if info.get('_type', 'video') == 'video':
+                    selected = ydl.process_ie_result(info, download=False)
+                    resolver.verbose = False  # the download picks the same formats again
+                    plan = plan_audio(selected, accepted_audio) if quality == 'audio' else plan_video(selected)
+                    print(f"🧮 Post-processing: {plan}")
+                
+                # The same artifact, made the same way, may already be on disk
+                result = store_key = None
+                if store and plan is not None and not clips:
+                    recipe = f"{plan.action}:{plan.target}" + (f":{AUDIO_QUALITY}" if plan.reencodes else "")
+                    store_args = (info.get('extractor_key') or info.get('ie_key'), info.get('id'),
+                                  selected.get('format_id'), recipe)
+                    store_key = media_key(*store_args)
+                    placed = store.place(store_key, output_path)
+                    if placed:
+                        print(f"📦 In the media store, placed by {placed[1]}: nothing to download")
+                        result = dict(selected, filepath=placed[0], requested_downloads=[{'filepath': placed[0]}])
+                
+                if result is None and quality == 'audio':
+                    if plan is None:
+                        plan = Plan('transcode', accepted_audio[0], "source codec unknown before download")
+                    # A re-encode runs while the stream downloads where possible
+                    if plan.reencodes and stream_audio and selected is not None and not clips:
+                        result = download_audio_streaming(ydl, selected, plan.target)
+                    if result is None and plan.action != 'keep':
+                        # Copies the stream when the codec already matches
+                        ydl.add_post_processor(FFmpegExtractAudioPP(
+                            ydl, preferredcodec=plan.target, preferredquality=AUDIO_QUALITY), when='post_process')
+                elif result is None and plan and plan.action == 'merge':
+                    ydl.params['merge_output_format'] = plan.target
+                
+                # Download the video
+                if result is None:
+                    with ffmpeg_from_location(ydl) if clips else nullcontext():
+                        result = ydl.process_ie_result(info, download=True) or info
+            
+            if deferred:
+                lease.hold()  # the post-processing below still needs this YoutubeDL
+        
+        def complete():
+            downloads = result.get('requested_downloads') or [{}]
+            for download in downloads:
+                # From the scratch folder into the output folder, complete
+                download['filepath'] = disk_io.deliver(download.get('filepath'), output_path)
+            filepath = downloads[-1].get('filepath')
+            if store_key:
+                try:
+                    store.put(store_key, filepath, *store_args)
+                except OSError as e:
+                    print(f"⚠️ Could not add the file to the media store: {e}")
+            if clips:
+                for download in downloads:
+                    print(f"✂️ {download.get('filepath')}")
+            if use_archive and result.get('id') and not clips:
+                shared_archive().add(result.get('extractor_key') or result.get('ie_key') or 'generic',
+                                     result.get('id'), quality, title, filepath)
+            if journal:
+                journal.update(job_id, 'done', filepath=filepath)
+            record('done')
             
-        print("\n✅ Download completed successfully!")
-        print(f"📁 Files saved to: {output_path}")
+            print("\n✅ Download completed successfully!")
+            print(f"📁 Files saved to: {output_path}")
+            if postprocess is None:
+                print(f"⏱️ Stages: {timer}")
+            if tuner and tuner.samples:
+                print(f"🧩 Fragment concurrency: {tuner.summary()}")
+            if share:
+                print(f"🚦 Bandwidth: {bandwidth.summary(share)}")
+            return filepath
+        
+        if postprocess is None:
+            return complete()
+        if not deferred:
+            return postprocess.completed(complete(), timer)
+        
+        def post_process():
+            try:
+                run_deferred(deferred)
+                return complete()
+            except Exception as e:
+                print(f'\n❌ Post-processing error: {e}')
+                if journal:
+                    journal.update(job_id, 'failed', error=str(e))
+                record('failed', str(e))
+                raise DownloadFailed(str(e)) from e
+            finally:
+                lease.release()
         
-    except DownloadError as e:
+        print("⚙️ Downloaded, post-processing queued")
+        return postprocess.submit(post_process, timer)
+        
+    except DownloadFailed as e:
+        if journal:
+            journal.update(job_id, 'failed', error=str(e))
+        record('failed', str(e))
+        raise
+    except (DownloadError, ExtractorError) as e:
         error_msg = str(e)
         print(f'\n❌ Download error: {error_msg}')
         
-        # If format not available, try progressive fallbacks
+        # Cached stream URLs may have been revoked early; retry once fresh
+        if cache_hit and "Requested format is not available" not in error_msg:
+            print("🔄 Cached metadata may be stale, extracting again...")
+            shared_cache().invalidate(*url_key)
+            shared_metrics().inc('retries_total', kind='stale_cache')
+            return download_video(url, output_path, quality, workers=workers, use_cache=False,
+                                  use_archive=use_archive, fragments=fragments, events=events,
+                                  use_journal=use_journal, resume=job_id, parent_job=parent_job,
+                                  job_metrics=job_metrics, priority=priority,
+                                  stream_audio=stream_audio, audio_format=audio_format,
+                                  postprocess=postprocess, sessions=sessions, hedge=hedge,
+                                  clips=clips, precise_cuts=precise_cuts, disk_io=disk_io,
+                                  use_store=use_store)
+
         if "Requested format is not available" in error_msg:
-            print("🔄 Retrying with progressive fallback formats...")
-            
-            fallback_formats = [
-                'best[ext=mp4]',
-                'best[ext=webm]', 
-                'best',
-                'worst'
-            ]
-            
-            for i, fallback_format in enumerate(fallback_formats):
-                try:
-                    print(f"  Attempt {i+1}: Trying format '{fallback_format}'...")
-                    fallback_opts = ydl_opts.copy()
-                    fallback_opts['format'] = fallback_format
-                    
-                    with yt_dlp.YoutubeDL(fallback_opts) as ydl:
-                        ydl.download([url])
-                    
-                    print(f"\n✅ Download completed successfully with format '{fallback_format}'!")
-                    print(f"📁 Files saved to: {output_path}")
-                    return
-                    
-                except Exception as fallback_error:
-                    print(f"  ❌ Format '{fallback_format}' failed: {str(fallback_error)[:100]}...")
-                    continue
-            
             print("❌ All fallback formats failed. This video may be restricted or unavailable.")
-        
-        sys.exit(1)
+        if journal:
+            journal.update(job_id, 'failed', error=error_msg)
+        record('failed', error_msg)
+        raise DownloadFailed(error_msg)
     except Exception as e:
         print(f'\n❌ Unexpected error: {e}')
-        sys.exit(1)
+        if journal:
+            journal.update(job_id, 'failed', error=str(e))
+        record('failed', str(e))
+        raise DownloadFailed(str(e)) from e
+    finally:
+        shared_progress().finish(progress_key)
+        if share:
+            bandwidth.unregister(share)
+
+
+def download_audio_streaming(ydl, selected, codec):
+    """Transcode the selected audio format to `codec` while downloading it
+
+    Returns the processed info dict with the output's filepath, or None
+    when the format can't be streamed and the regular download should run.
+    """
+    target = os.path.splitext(ydl.prepare_filename(selected))[0] + '.' + AUDIO_TARGETS[codec][1]
+    
+    if os.path.exists(target):
+        print(f"⏭️ {os.path.basename(target)} already exists")
+    else:
+        try:
+            stream_transcode(ydl, selected, target, codec)
+        except StreamingUnavailable as e:
+            print(f"🎵 Not streaming the transcode ({e}), downloading first")
+            return None
+        print(f"🎵 Transcoded to {codec} while downloading")
+    
+    selected['filepath'] = target
+    selected['requested_downloads'] = [{'filepath': target}]
+    return selected
+
+
+def explain_formats(url, quality='best', hedge=HEDGE_ENABLED):
+    """Print which format each quality spec would pick, without downloading"""
+    if quality == 'audio':
+        format_selector = audio_selector(parse_audio_formats(None))
+    else:
+        format_selector = QUALITY_FORMATS.get(quality, 'best[ext=mp4]/best')
+    
+    with yt_dlp.YoutubeDL({'quiet': True, 'no_warnings': True}) as ydl:
+        resolver = FormatResolver(ydl, format_chain(format_selector), verbose=False, hedge=hedge)
+        ydl.format_selector = resolver
+        info = ydl.extract_info(url, download=False, process=False)
+        ydl.process_ie_result(info, download=False)
+    
+    print(f"🔍 Format selection for '{quality}':")
+    for line in resolver.trace:
+        print(f"  {line}")
+    return resolver
+
+
+def cache_main(argv):
+    """Entry point for --cache: inspect or clear the metadata cache"""
+    command = argv[0] if argv else 'stats'
+    cache = shared_cache()
+    if command == 'clear':
+        cache.clear()
+        print("🧹 Metadata cache cleared")
+    elif command == 'stats':
+        stats = cache.stats()
+        lookups = stats['total_hits'] + stats['total_misses']
+        hit_rate = stats['total_hits'] / lookups * 100 if lookups else 0
+        print(f"🗄️ Metadata cache: {cache.path}")
+        print(f"  Entries: {stats['entries']} ({stats['bytes']/1024/1024:.2f} of {stats['max_bytes']/1024/1024:.0f}MiB)")
+        print(f"  TTL: {stats['ttl']}s")
+        print(f"  Hits: {stats['total_hits']}  Misses: {stats['total_misses']}  Hit rate: {hit_rate:.1f}%")
+    else:
+        print(f"Unknown cache command: {command} (use 'stats' or 'clear')")
+        return 1
+    return 0
+
+
+def store_main(argv):
+    """Entry point for --store: inspect, prune or clear the media store"""
+    command = argv[0] if argv else 'stats'
+    store = shared_store()
+    if command == 'clear':
+        store.clear()
+        print("🧹 Media store cleared")
+    elif command == 'prune':
+        print(f"🧹 Removed {store.prune()} file(s) from the media store")
+    elif command == 'stats':
+        stats = store.stats()
+        print(f"📦 Media store: {store.root}")
+        print(f"  Files: {stats['entries']} ({stats['bytes']/1024**3:.2f} of {stats['max_bytes']/1024**3:.0f}GiB)")
+        print(f"  Kept for: {stats['max_age']/86400:.0f} days since last use")
+    else:
+        print(f"Unknown store command: {command} (use 'stats', 'prune' or 'clear')")
+        return 1
+    return 0
+
+
+def archive_main(argv):
+    """Entry point for --archive: manage the download archive"""
+    parser = argparse.ArgumentParser(
+        prog='main.py --archive',
+        description='Manage the index of already downloaded videos.')
+    commands = parser.add_subparsers(dest='command')
+    commands.add_parser('stats', help='show the number of entries')
+    import_parser = commands.add_parser('import', help='import a yt-dlp --download-archive file')
+    import_parser.add_argument('file')
+    import_parser.add_argument('-q', '--quality', default='best', choices=sorted(QUALITY_FORMATS))
+    export_parser = commands.add_parser('export', help='export as a yt-dlp --download-archive file')
+    export_parser.add_argument('file')
+    export_parser.add_argument('-q', '--quality', default=None, choices=sorted(QUALITY_FORMATS),
+                               help='only export entries of this quality')
+    prune_parser = commands.add_parser('prune', help='remove old or missing entries')
+    prune_parser.add_argument('--older-than', type=float, metavar='DAYS',
+                              help='remove entries added more than DAYS ago')
+    prune_parser.add_argument('--missing', action='store_true',
+                              help='remove entries whose downloaded file no longer exists')
+    args = parser.parse_args(argv)
+
+    archive = shared_archive()
+    if args.command == 'import':
+        added = archive.import_file(args.file, args.quality)
+        print(f"📥 Imported {added} entries from {args.file}")
+    elif args.command == 'export':
+        written = archive.export_file(args.file, args.quality)
+        print(f"📤 Exported {written} entries to {args.file}")
+    elif args.command == 'prune':
+        if args.older_than is None and not args.missing:
+            parser.error('prune needs --older-than and/or --missing')
+        older_than = args.older_than * 86400 if args.older_than is not None else None
+        removed = archive.prune(older_than, args.missing)
+        print(f"🧹 Removed {removed} entries")
+    else:
+        print(f"🗂️ Download archive: {archive.path}")
+        print(f"  Entries: {len(archive)}")
+    return 0
+
+
+def journal_main(argv):
+    """Entry point for --journal: list, resume or clear recorded jobs"""
+    parser = argparse.ArgumentParser(
+        prog='main.py --journal',
+        description='Inspect and resume downloads that were interrupted.')
+    commands = parser.add_subparsers(dest='command')
+    list_parser = commands.add_parser('list', help='show interrupted jobs (default)')
+    list_parser.add_argument('--failed', action='store_true', help='include failed jobs')
+    resume_parser = commands.add_parser('resume', help='resume interrupted jobs from their partial files')
+    resume_parser.add_argument('--failed', action='store_true', help='retry failed jobs too')
+    resume_parser.add_argument('-j', '--jobs', type=int, default=DEFAULT_WORKERS,
+                               help=f'concurrent downloads (default: {DEFAULT_WORKERS})')
+    commands.add_parser('clear', help='forget finished and failed jobs')
+    args = parser.parse_args(argv)
+
+    journal = shared_journal()
+    if args.command == 'clear':
+        removed = journal.clear()
+        print(f"🧹 Removed {removed} finished or failed jobs")
+        return 0
+
+    jobs = journal.unfinished(include_failed=getattr(args, 'failed', False))
+    if args.command == 'resume':
+        if not jobs:
+            print("✅ Nothing to resume")
+            return 0
+        started = monotonic()
+        pool = PostProcessPool()
+        sessions = SessionPool(max(DEFAULT_MAX_IDLE, args.jobs))
+        try:
+            results = run_batch(
+                jobs,
+                lambda job: download_video(job['url'], job['output_path'], job['quality'],
+                                           resume=job['id'], postprocess=pool, sessions=sessions,
+                                           **job['options']),
+                args.jobs, describe=lambda job: job['url'], progress=shared_progress())
+        finally:
+            pool.shutdown()
+            sessions.close()
+        print_summary(results, monotonic() - started)
+        return 0 if all(job.status == 'done' for job in results) else 1
+
+    counts = journal.counts()
+    print(f"📒 Job journal: {journal.path}")
+    print("  " + "  ".join(f"{state}: {counts.get(state, 0)}" for state in JOB_STATES))
+    for job in jobs:
+        offset = f" at {job['downloaded_bytes']/1024/1024:.2f}MiB" if job['downloaded_bytes'] else ""
+        print(f"  ⏸️ [{job['state']}{offset}] {job['url']} ({job['quality']})")
+        if job['error']:
+            print(f"     {job['error']}")
+    if jobs:
+        print("Run 'main.py --journal resume' to continue them.")
+    return 0
+
+
+def batch_main(argv):
+    """Entry point for --batch: download many URLs concurrently"""
+    parser = argparse.ArgumentParser(
+        prog='main.py --batch',
+        description='Download many URLs on a pool of concurrent workers.')
+    parser.add_argument('urls', nargs='*', help='URLs to download')
+    parser.add_argument('-i', '--input', action='append', default=[], metavar='FILE',
+                        help="read URLs from FILE, one per line ('-' for stdin); repeatable")
+    parser.add_argument('-o', '--output', default=None, help='output folder (default: ~/Videos)')
+    parser.add_argument('-q', '--quality', default='best', choices=sorted(QUALITY_FORMATS),
+                        help='quality profile (default: best)')
+    parser.add_argument('-j', '--jobs', type=int, default=DEFAULT_WORKERS,
+                        help=f'concurrent downloads (default: {DEFAULT_WORKERS})')
+    parser.add_argument('--no-cache', dest='use_cache', action='store_false',
+                        help='always extract metadata instead of using the metadata cache')
+    parser.add_argument('--no-archive', dest='use_archive', action='store_false',
+                        help='download again even if the download archive has the video')
+    parser.add_argument('--no-store', dest='use_store', action='store_false',
+                        help='download again even if the media store has the file')
+    parser.add_argument('--fragments', default='auto', metavar='N|auto',
+                        help='DASH/HLS fragments fetched in parallel (default: auto-tuned)')
+    parser.add_argument('--audio-format', default=None, metavar='LIST',
+                        help="with -q audio, accepted formats in order of preference, e.g. 'm4a,opus,mp3';"
+                             " accepted sources are kept or remuxed, others re-encoded to the first"
+                             " (default: $L1GHT_AUDIO_FORMAT or mp3)")
+    parser.add_argument('--no-stream-audio', dest='stream_audio', action='store_false',
+                        help='with -q audio, download the whole file before re-encoding it')
+    parser.add_argument('--hedge', action='store_true', default=HEDGE_ENABLED,
+                        help='probe the best candidate formats in parallel and download the best one'
+                             ' that answers (default: $L1GHT_HEDGE)')
+    parser.add_argument('--start', metavar='TIME', help='download only from TIME on, e.g. 1:30')
+    parser.add_argument('--end', metavar='TIME', help='download only up to TIME')
+    parser.add_argument('--clips', metavar='RANGES',
+                        help="download only these parts, e.g. '1:00-1:30,5:00-5:20', one file each;"
+                             " a URL line may list its own as 'URL *1:00-1:30 *5:00-5:20'")
+    parser.add_argument('--precise-cuts', action='store_true',
+                        help='re-encode clip ends to cut exactly instead of at keyframes')
+    parser.add_argument('--max-rate', metavar='RATE',
+                        help='total bandwidth cap shared fairly by all jobs, e.g. 5M (default: $L1GHT_MAX_RATE)')
+    parser.add_argument('--rate-schedule', metavar='SPEC',
+                        help="caps by time of day, e.g. '09:00-18:00=1M,18:00-23:00=10M'")
+    parser.add_argument('--priority', default='normal', choices=sorted(PRIORITIES),
+                        help='weight of these jobs against others sharing the cap')
+    parser.add_argument('--pp-workers', type=int, default=DEFAULT_PP_WORKERS, metavar='N',
+                        help='merges/transcodes run in parallel with the next downloads'
+                             f' (default: {DEFAULT_PP_WORKERS}, one per CPU core; 0 runs them inline)')
+    parser.add_argument('--pp-backlog', type=int, default=None, metavar='N',
+                        help='jobs waiting for post-processing before downloads pause'
+                             ' (default: twice --pp-workers)')
+    parser.add_argument('--order', default='fifo', choices=ORDERS,
+                        help="run order: as given, shortest job first, or earliest deadline first"
+                             " (a URL line may end with a deadline, e.g. 'URL 18:30'); default: fifo")
+    parser.add_argument('--check-space', action='store_true',
+                        help='estimate sizes first and only start jobs that fit on the output volume'
+                             ' (implied by --order sjf|deadline)')
+    parser.add_argument('--write-buffer', metavar='SIZE',
+                        help='collect downloaded data and write it in pieces of SIZE, e.g. 4M; 0 writes'
+                             ' every block as it arrives (default: $L1GHT_WRITE_BUFFER or 0)')
+    parser.add_argument('--preallocate', action='store_true', default=None,
+                        help='reserve disk space for files of known size up front'
+                             ' (default: on if $L1GHT_PREALLOCATE is 1)')
+    parser.add_argument('--no-preallocate', dest='preallocate', action='store_false',
+                        help='do not reserve disk space up front, even if $L1GHT_PREALLOCATE is 1')
+    parser.add_argument('--http-chunk', metavar='SIZE|auto',
+                        help='fetch plain HTTP downloads in range requests of SIZE, or sized from the'
+                             ' measured throughput with auto (default: $L1GHT_HTTP_CHUNK, one request)')
+    parser.add_argument('--scratch-dir', metavar='DIR',
+                        help='download and post-process in DIR, e.g. on a fast local disk, and move'
+                             ' finished files to the output folder (default: $L1GHT_SCRATCH_DIR)')
+    parser.add_argument('--metrics-json', metavar='FILE',
+                        help='write per-job phase times, bytes and retries as JSON when done')
+    parser.add_argument('--metrics-textfile', metavar='FILE',
+                        help='write totals in the Prometheus text format when done')
+    args = parser.parse_args(argv)
+
+    try:
+        shared_bandwidth().configure(args.max_rate, args.rate_schedule)
+        shared_disk_io().configure(args.write_buffer, args.preallocate, args.http_chunk, args.scratch_dir)
+        parse_audio_formats(args.audio_format)
+        clips = clip_options(args.start, args.end, args.clips)
+    except ValueError as e:
+        parser.error(str(e))
+
+    files = args.input
+    if not args.urls and not files and not sys.stdin.isatty():
+        files = ['-']
+
+    try:
+        planned = Scheduler.parse(read_urls(args.urls, files))
+    except ValueError as e:
+        parser.error(f'invalid deadline or clip: {e}')
+    if not planned:
+        parser.error('no URLs given')
+
+    started = monotonic()
+    pool = PostProcessPool(args.pp_workers, args.pp_backlog) if args.pp_workers > 0 else None
+    # One YoutubeDL per worker, reused for every URL it downloads
+    sessions = SessionPool(max(DEFAULT_MAX_IDLE, args.jobs))
+
+    output_path = args.output or str(Path.home() / "Videos")
+    options = {
+        'workers': 1, 'use_cache': args.use_cache, 'use_archive': args.use_archive,
+        'use_store': args.use_store, 'fragments': args.fragments, 'priority': args.priority,
+        'stream_audio': args.stream_audio, 'audio_format': args.audio_format, 'hedge': args.hedge,
+        'precise_cuts': args.precise_cuts,
+    }
+    # Every URL is journaled as queued before the first one starts, so a
+    # killed batch leaves the ones it never reached for --journal resume
+    journal = shared_journal()
+    for job in planned:
+        job_options = dict(options, clips=job.clips or clips)
+        interrupted = journal.find_interrupted(job.url, args.quality, output_path)
+        if interrupted:
+            journal.claim(interrupted['id'])
+        job.journal_id = interrupted['id'] if interrupted else journal.add(
+            job.url, output_path, args.quality, options=job_options)
+
+    def download(job):
+        return download_video(job.url, output_path, args.quality, info=job.info,
+                              resume=job.journal_id, postprocess=pool, sessions=sessions,
+                              **dict(options, clips=job.clips or clips))
+
+    items, run = planned, download
+    if args.order != 'fifo' or args.check_space:
+        scheduler = Scheduler(output_path, args.quality, args.order,
+                              args.audio_format, args.use_cache, sessions, clips=clips)
+        print("🔎 Estimating download sizes...")
+        planned = scheduler.plan(planned, args.jobs)
+        scheduler.print_plan(planned)
+        items = scheduler.dispatch(planned)
+
+        def run(job):
+            try:
+                return scheduler.run(job, download)
+            except InsufficientSpace as e:
+                journal.update(job.journal_id, 'failed', error=str(e))
+                raise
+    try:
+        jobs = run_batch(items, run, args.jobs, total=len(planned), describe=str,
+                         progress=shared_progress())
+    finally:
+        if pool:
+            pool.shutdown()
+        sessions.close()
+    print_summary(jobs, monotonic() - started)
+    if pool:
+        print(f"⚙️ Post-processing: {pool.summary()}")
+    print(f"🔁 Sessions: {sessions.summary()}")
+    print(f"💾 Disk I/O: {shared_disk_io().summary()}")
+    write_metrics(args.metrics_json, args.metrics_textfile)
+    return 0 if all(job.status == 'done' for job in jobs) else 1
+
+
+def write_metrics(json_path=None, textfile_path=None):
+    """Export the metrics of this run as JSON and/or Prometheus text"""
+    registry = shared_metrics()
+    if json_path:
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(registry.report(), f, indent=2)
+        print(f"📈 Metrics written to {json_path}")
+    if textfile_path:
+        registry.write_prometheus(textfile_path)
+        print(f"📈 Prometheus metrics written to {textfile_path}")
+
+
+def profile_main(argv):
+    """Entry point for --profile: one download under cProfile/tracemalloc"""
+    parser = argparse.ArgumentParser(
+        prog='main.py --profile',
+        description='Download one URL and report where its time and memory went.')
+    parser.add_argument('url')
+    parser.add_argument('output_path', nargs='?', default=None)
+    parser.add_argument('quality', nargs='?', default='best', choices=sorted(QUALITY_FORMATS))
+    parser.add_argument('-m', '--mode', default='cpu', metavar='cpu,memory',
+                        help="what to profile: 'cpu' (cProfile), 'memory' (tracemalloc) or both")
+    parser.add_argument('--save', metavar='FILE', help='also save the cProfile stats (for pstats/snakeviz)')
+    args = parser.parse_args(argv)
+
+    modes = {mode.strip() for mode in args.mode.split(',') if mode.strip()}
+    if not modes or modes - {'cpu', 'memory'}:
+        parser.error(f"unknown profile mode: {args.mode}")
+
+    ok = True
+    with profiled(modes, args.save):
+        try:
+            download_video(args.url, args.output_path, args.quality, use_archive=False)
+        except DownloadFailed:
+            ok = False
+    jobs = shared_metrics().report()['jobs']
+    if jobs:
+        print(f"📈 Job metrics: {json.dumps(jobs[-1])}")
+    return 0 if ok else 1
+
+
+def run_event_job(emit, job_id, url, output_path=None, quality='best', **options):
+    """Run one download and report it entirely as JSON events
+
+    Console output becomes 'log' events and the job ends with exactly one
+    'done' or 'error' event. Returns True if the download succeeded.
+    """
+    events = JobEvents(emit, job_id)
+    output = LineOutput(events.log)
+    try:
+        with redirect_stdout(output), redirect_stderr(output):
+            filepath = download_video(url, output_path, quality, events=events, **options)
+    except DownloadFailed as e:
+        output.flush()
+        events.error(str(e))
+        return False
+    except Exception as e:
+        # The worker outlives a broken job; its frontend still gets an answer
+        output.flush()
+        events.error(f"Unexpected error: {e}")
+        return False
+    output.flush()
+    events.done(filepath)
+    return True
+
+
+def serve(instream=None, outstream=None, metrics_port=None, metrics_textfile=None):
+    """Run as a long-lived worker that reads download jobs as JSON lines
+
+    Each input line is a job such as
+    {"id": "1", "url": "...", "output_path": "...", "quality": "best"}
+    and every output line is an event tagged with the job id (see
+    events.py), ending with exactly one 'done' or 'error' per job. Sending
+    {"cmd": "shutdown"} or closing stdin stops the worker.
+    {"cmd": "prefetch", "id": "p1", "url": "..."} extracts a URL in the
+    background, before its download is requested, and answers with one
+    'prefetch' event: title, duration, thumbnail and the format and
+    estimated size of each quality, or an `error` (see prefetch.py). A
+    download of that URL then skips extraction. With
+    `metrics_port`, Prometheus metrics are served on
+    http://127.0.0.1:<port>/metrics; with `metrics_textfile` they are
+    rewritten to that file after every job.
+    """
+    instream = instream or sys.stdin
+    emit = EventWriter(outstream or sys.stdout)
+    
+    # Jobs run one after another on the same YoutubeDL, kept warm between them
+    sessions = SessionPool(1)
+    prefetcher = Prefetcher(sessions)
+    registry = shared_metrics()
+    if metrics_port:
+        serve_metrics(registry, metrics_port)
+    if metrics_textfile:
+        registry.on_record.append(lambda registry: registry.write_prometheus(metrics_textfile))
+
+    emit({'event': 'ready', 'version': yt_dlp.version.__version__})
+
+    for line in instream:
+        line = line.strip()
+        if not line:
+            continue
+
+        try:
+            job = json.loads(line)
+            if not isinstance(job, dict):
+                raise ValueError('not a JSON object')
+            clips = clip_options(clips=job.get('clips'))
+        except (ValueError, TypeError) as e:
+            emit({'event': 'error', 'id': None, 'message': f'Invalid job: {e}'})
+            continue
+
+        if job.get('cmd') == 'shutdown':
+            break
+
+        url = job.get('url')
+        if not isinstance(url, str) or not url.strip():
+            emit({'event': 'error', 'id': job.get('id'), 'message': 'Invalid job: no url'})
+            continue
+        url = url.strip()
+
+        if job.get('cmd') == 'prefetch':
+            def prefetched(summary, error, job_id=job.get('id'), url=url):
+                if error is not None:
+                    emit({'event': 'prefetch', 'id': job_id, 'url': url, 'error': str(error)})
+                else:
+                    emit({'event': 'prefetch', 'id': job_id, 'url': url, **summary})
+            prefetcher.start(url, prefetched)
+            continue
+
+        run_event_job(emit, job.get('id'), url, job.get('output_path'),
+                      job.get('quality') or 'best',
+                      use_cache=job.get('cache', True), use_archive=job.get('archive', True),
+                      fragments=job.get('fragments', 'auto'), priority=job.get('priority', 'normal'),
+                      stream_audio=job.get('stream_audio', True), audio_format=job.get('audio_format'),
+                      hedge=job.get('hedge', HEDGE_ENABLED), clips=clips,
+                      precise_cuts=job.get('precise_cuts', False), use_store=job.get('store', True),
+                      info=prefetcher.claim(url), sessions=sessions)
+    prefetcher.close()
+    sessions.close()
+
 
 if __name__ == '__main__':
+    # Worker mode speaks JSON on stdout, so it must start before the banner
+    if len(sys.argv) > 1 and sys.argv[1] == '--serve':
+        serve_parser = argparse.ArgumentParser(prog='main.py --serve')
+        serve_parser.add_argument('--metrics-port', type=int, metavar='PORT',
+                                  help='serve Prometheus metrics on http://127.0.0.1:PORT/metrics')
+        serve_parser.add_argument('--metrics-textfile', metavar='FILE',
+                                  help='rewrite Prometheus metrics to FILE after every job')
+        serve_args = serve_parser.parse_args(sys.argv[2:])
+        serve(metrics_port=serve_args.metrics_port, metrics_textfile=serve_args.metrics_textfile)
+        sys.exit(0)
+
+    # '--events json <url> [output_path] [quality]': one download, JSON events only
+    if len(sys.argv) > 1 and sys.argv[1] == '--events':
+        if len(sys.argv) < 4 or not sys.argv[3].strip():
+            print("Usage: main.py --events json <url> [output_path] [quality]", file=sys.stderr)
+            sys.exit(2)
+        if sys.argv[2] != 'json':
+            print(f"Unsupported event format: {sys.argv[2]} (only 'json')")
+            sys.exit(2)
+        args = sys.argv[3:]
+        ok = run_event_job(EventWriter(sys.stdout), '1', args[0], args[1] if len(args) > 1 else None,
+                           args[2] if len(args) > 2 else 'best')
+        sys.exit(0 if ok else 1)
+
+    if len(sys.argv) > 1 and sys.argv[1] == '--cache':
+        sys.exit(cache_main(sys.argv[2:]))
+
+    if len(sys.argv) > 1 and sys.argv[1] == '--store':
+        sys.exit(store_main(sys.argv[2:]))
+    
+    if len(sys.argv) > 1 and sys.argv[1] == '--archive':
+        sys.exit(archive_main(sys.argv[2:]))
+
+    if len(sys.argv) > 1 and sys.argv[1] == '--journal':
+        sys.exit(journal_main(sys.argv[2:]))
+
+    if len(sys.argv) > 1 and sys.argv[1] == '--profile':
+        sys.exit(profile_main(sys.argv[2:]))
+    
+    if len(sys.argv) > 1 and sys.argv[1] == '--batch':
+        print_banner()
+        sys.exit(batch_main(sys.argv[2:]))
+
+    if len(sys.argv) > 2 and sys.argv[1] == '--formats':
+        try:
+            explain_formats(sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else 'best')
+        except (DownloadError, ExtractorError) as e:
+            print(f'❌ {e}')
+            sys.exit(1)
+        sys.exit(0)
+
     try:
         print_banner()
         
@@ -189,7 +1006,10 @@ if __name__ == '__main__':
                 print("Error: No URL provided")
                 sys.exit(1)
             
-            download_video(url, output_path, quality)
+            try:
+                download_video(url, output_path, quality)
+            except DownloadFailed:
+                sys.exit(1)
         
         else:
             # Interactive mode
@@ -216,7 +1036,10 @@ if __name__ == '__main__':
                     quality = quality_map.get(quality_choice, 'best')
                     
                     output_path = str(Path.home() / "Videos")
-                    download_video(link, output_path, quality)
+                    try:
+                        download_video(link, output_path, quality)
+                    except DownloadFailed:
+                        pass  # Error details were already printed
                     
                     again = input("\n🔄 Download another video? (y/n): ").strip().lower()
                     if again not in ['y', 'yes']:
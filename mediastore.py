@@ -0,0 +1,261 @@
+"""Local store of downloaded media, shared by every output folder.
+
+The download archive only knows that a video was downloaded; asked for the
+same video in another folder, the full file would be fetched again. The
+MediaStore keeps one copy of every finished file, addressed by what it is:
+extractor, video ID, format ID and the post-processing recipe that made it
+(e.g. 'merge:mp4' or 'transcode:mp3:192'). Before download_video fetches
+anything it asks the store for that artifact and, on a hit, places it into
+the output folder instead:
+
+    hardlink  the same file under a second name; costs no space at all
+    reflink   a copy-on-write clone (btrfs, XFS, APFS) where hardlinks fail
+    copy      across filesystems
+
+Files only enter the store by hardlink or reflink, so the store never takes
+extra space or time: a file on another filesystem than the store, where
+only a full copy would do, is not stored. The store is kept under
+L1GHT_STORE_MAX_GB (default 20) by evicting the least recently used files,
+and files not used for L1GHT_STORE_MAX_DAYS (default 30) are dropped.
+Evicting only removes the store's name for a file; copies in output folders
+stay. L1GHT_STORE_MAX_GB=0 turns the store off.
+"""
+
+import errno
+import hashlib
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+
+from paths import data_path
+
+DEFAULT_MAX_BYTES = int(float(os.environ.get('L1GHT_STORE_MAX_GB', 20)) * 1024 ** 3)
+DEFAULT_MAX_AGE = float(os.environ.get('L1GHT_STORE_MAX_DAYS', 30)) * 24 * 60 * 60
+
+FICLONE = 0x40049409  # ioctl(2) on Linux
+
+
+def media_key(extractor, video_id, format_id, recipe):
+    """Store key of one artifact"""
+    name = '/'.join([(extractor or 'generic').lower(), str(video_id), str(format_id), recipe])
+    return hashlib.sha256(name.encode('utf-8')).hexdigest()[:32]
+
+
+def reflink(source, destination):
+    """Clone `source` to `destination` sharing its blocks; OSError where unsupported"""
+    if sys.platform.startswith('linux'):
+        import fcntl
+        with open(source, 'rb') as src, open(destination, 'wb') as dst:
+            try:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+                return
+            except OSError:
+                pass
+        os.remove(destination)
+    elif sys.platform == 'darwin':
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        if libc.clonefile(os.fsencode(source), os.fsencode(destination), 0) == 0:
+            return
+    raise OSError(errno.EOPNOTSUPP, 'reflink not supported', destination)
+
+
+def destination_for(source, directory, name):
+    """Where `source` goes in `directory` as `name`
+
+    That is the path it already has there, or the first free one of
+    'name.ext', 'name (1).ext', ...; an unrelated file is never replaced.
+    """
+    stem, ext = os.path.splitext(name)
+    destination, number = os.path.join(directory, name), 0
+    while os.path.exists(destination) and not os.path.samefile(source, destination):
+        number += 1
+        destination = os.path.join(directory, f"{stem} ({number}){ext}")
+    return destination
+
+
+def link_file(source, destination, copy=True):
+    """Place `source` at `destination` as cheaply as possible
+
+    The file appears at `destination` complete or not at all. Returns how
+    it was placed: 'hardlink', 'reflink' or 'copy'. With copy=False, a file
+    that can be neither linked nor cloned raises OSError instead.
+    """
+    directory, name = os.path.split(destination)
+    temporary = os.path.join(directory, f".{name}.{os.getpid()}.{threading.get_ident()}.linking")
+    try:
+        try:
+            os.link(source, temporary)
+            method = 'hardlink'
+        except OSError:
+            try:
+                reflink(source, temporary)
+                method = 'reflink'
+            except OSError:
+                if not copy:
+                    raise
+                shutil.copy2(source, temporary)
+                method = 'copy'
+        os.replace(temporary, destination)
+    except BaseException:
+        if os.path.lexists(temporary):
+            os.remove(temporary)
+        raise
+    return method
+
+
+class MediaStore:
+    """SQLite-indexed store of finished files with size and age eviction"""
+
+    def __init__(self, path=None, max_bytes=DEFAULT_MAX_BYTES, max_age=DEFAULT_MAX_AGE):
+        self.root = str(path or data_path('store', 'objects'))
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(os.path.dirname(self.root), 'store.sqlite3'),
+                                  timeout=30, check_same_thread=False)
+        with self.db:
+            self.db.execute(
+                'CREATE TABLE IF NOT EXISTS objects ('
+                ' key TEXT PRIMARY KEY, name TEXT NOT NULL, size INTEGER NOT NULL,'
+                ' extractor TEXT, video_id TEXT, format_id TEXT, recipe TEXT,'
+                ' added REAL NOT NULL, accessed REAL NOT NULL)')
+            self.db.execute('CREATE INDEX IF NOT EXISTS objects_accessed ON objects (accessed)')
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def object_path(self, key, name):
+        return os.path.join(self.root, key[:2], key + os.path.splitext(name)[1])
+
+    def lookup(self, key):
+        """(path in the store, original file name) of an artifact, or None"""
+        with self.lock, self.db:
+            row = self.db.execute('SELECT name, size FROM objects WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            path = self.object_path(key, row[0])
+            try:
+                intact = os.path.getsize(path) == row[1]
+            except OSError:
+                intact = False
+            if not intact:
+                # Deleted or changed behind our back (e.g. through a hardlink)
+                self.db.execute('DELETE FROM objects WHERE key = ?', (key,))
+                self.misses += 1
+                return None
+            self.db.execute('UPDATE objects SET accessed = ? WHERE key = ?', (time.time(), key))
+            self.hits += 1
+        return path, row[0]
+
+    def place(self, key, directory):
+        """Put the stored artifact into `directory`; (its path there, method) or None"""
+        found = self.lookup(key)
+        if found is None:
+            return None
+        path, name = found
+        destination = destination_for(path, directory, name)
+        if os.path.exists(destination):
+            return destination, 'present'
+        os.makedirs(directory, exist_ok=True)
+        return destination, link_file(path, destination)
+
+    def put(self, key, filepath, extractor=None, video_id=None, format_id=None, recipe=None):
+        """Add a finished file under `key`; returns how it was stored, or None
+
+        A file that could only be copied into the store is left out.
+        """
+        if not self.enabled or not filepath or not os.path.isfile(filepath):
+            return None
+        size = os.path.getsize(filepath)
+        if size > self.max_bytes:
+            return None
+        name = os.path.basename(filepath)
+        path = self.object_path(key, name)
+        with self.lock:
+            row = self.db.execute('SELECT size FROM objects WHERE key = ?', (key,)).fetchone()
+            if row is not None and os.path.exists(path):
+                return 'present'
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            method = link_file(filepath, path, copy=False)
+        except OSError:
+            return None
+        now = time.time()
+        with self.lock, self.db:
+            self.db.execute(
+                'INSERT OR REPLACE INTO objects VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (key, name, size, extractor, video_id, format_id, recipe, now, now))
+            self.evict(now)
+        return method
+
+    def evict(self, now=None):
+        """Drop files unused for max_age, then least recently used ones over the cap"""
+        now = now or time.time()
+        rows = self.db.execute('SELECT key, name, size, accessed FROM objects ORDER BY accessed').fetchall()
+        total = sum(row[2] for row in rows)
+        removed = 0
+        for key, name, size, accessed in rows:
+            if accessed >= now - self.max_age and total <= self.max_bytes:
+                break
+            self.db.execute('DELETE FROM objects WHERE key = ?', (key,))
+            try:
+                os.remove(self.object_path(key, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        return removed
+
+    def prune(self):
+        """Apply the eviction policy and forget files that are gone; returns entries removed"""
+        with self.lock, self.db:
+            removed = self.evict()
+            rows = self.db.execute('SELECT key, name FROM objects').fetchall()
+            gone = [(key,) for key, name in rows if not os.path.exists(self.object_path(key, name))]
+            self.db.executemany('DELETE FROM objects WHERE key = ?', gone)
+        return removed + len(gone)
+
+    def stats(self):
+        with self.lock:
+            entries, size = self.db.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM objects').fetchone()
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': entries,
+            'bytes': size,
+            'max_bytes': self.max_bytes,
+            'max_age': self.max_age,
+        }
+
+    def clear(self):
+        with self.lock, self.db:
+            self.db.execute('DELETE FROM objects')
+            shutil.rmtree(self.root, ignore_errors=True)
+            os.makedirs(self.root, exist_ok=True)
+
+    def close(self):
+        self.db.close()
+
+
+_shared_store = None
+_shared_lock = threading.Lock()
+
+
+def shared_store():
+    """Process-wide MediaStore at the default location and limits"""
+    global _shared_store
+    with _shared_lock:
+        if _shared_store is None:
+            _shared_store = MediaStore()
+        return _shared_store
@@ -0,0 +1,278 @@
+"""Persistent cache of extracted video metadata.
+
+Extraction is the slowest step before any byte is downloaded, and the same
+URL is often requested again: retries, another quality, a double click in
+the GUI. MetadataCache keeps the raw info dict from extract_info in SQLite,
+keyed by extractor and video ID.
+
+An entry expires after the configured TTL, or earlier when the stream URLs
+it contains expire (YouTube signs them with an ``expire=`` timestamp). The
+cache has a size cap and evicts the least recently used entries first.
+
+Some URLs are handled by an extractor that only points on to another one
+(a short link, an embed page). The entry is stored under the key of the
+extractor that produced the video, and the URL's own key is recorded as an
+alias of it, so the next lookup of that URL finds it (see canonical()).
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+from yt_dlp.extractor import gen_extractor_classes
+
+from paths import data_path
+
+DEFAULT_TTL = int(os.environ.get('L1GHT_CACHE_TTL', 6 * 60 * 60))
+DEFAULT_MAX_BYTES = int(float(os.environ.get('L1GHT_CACHE_MAX_MB', 64)) * 1024 * 1024)
+
+# Stream URLs are treated as expired this long before their real deadline
+EXPIRY_MARGIN = 5 * 60
+
+
+def lookup_key(url):
+    """(extractor key, video id) for a URL without any network access
+
+    Returns None when no extractor can derive an ID from the URL alone
+    (e.g. the generic extractor).
+    """
+    for ie in gen_extractor_classes():
+        if ie.ie_key() == 'Generic' or not ie.suitable(url):
+            continue
+        video_id = ie.get_temp_id(url)
+        return (ie.ie_key(), video_id) if video_id else None
+    return None
+
+
+def resolve_url_result(ydl, info):
+    """Follow url/url_transparent results to the unprocessed info they point to"""
+    while info.get('_type') in ('url', 'url_transparent'):
+        resolved = ydl.extract_info(info['url'], download=False, ie_key=info.get('ie_key'), process=False)
+        if info['_type'] == 'url_transparent':
+            # As yt-dlp does: what the referring page knew takes precedence
+            resolved.update({k: v for k, v in info.items() if v is not None and k not in (
+                '_type', 'url', 'id', 'extractor', 'extractor_key', 'ie_key')})
+        info = resolved
+    return info
+
+
+def fetch_info(ydl, url, use_cache=True, key=None):
+    """Unprocessed info of `url` through the cache: (info, hit)
+
+    The cache is asked under the canonical key of the URL (or `key`, its
+    lookup_key() if already known); on a miss the URL is extracted, url
+    results are resolved to their video, and the video is stored with the
+    URL's key as its alias. `hit` is None when the cache was not asked.
+    """
+    key = key or lookup_key(url)
+    if key and not all(key):
+        key = None
+    cache = shared_cache()
+    hit = None
+    if use_cache and key:
+        info = cache.get(*cache.canonical(*key))
+        if info is not None:
+            return info, True
+        hit = False
+    info = resolve_url_result(ydl, ydl.extract_info(url, download=False, process=False))
+    if info.get('_type', 'video') == 'video':
+        if use_cache:
+            cache.put(info.get('extractor_key'), info.get('id'), info)
+        cache.alias(key, (info.get('extractor_key'), info.get('id')))
+    return info, hit
+
+
+def stream_expiry(info):
+    """Earliest ``expire=`` timestamp among the info's media URLs, or None"""
+    expiry = None
+    for fmt in info.get('formats') or [info]:
+        url = fmt.get('url') or ''
+        values = parse_qs(urlparse(url).query).get('expire')
+        if not values:
+            # Some signed URLs carry it as a path segment: /expire/<ts>/
+            parts = urlparse(url).path.split('/')
+            if 'expire' in parts and parts.index('expire') + 1 < len(parts):
+                values = [parts[parts.index('expire') + 1]]
+        if values and values[0].isdigit():
+            expiry = min(expiry or float('inf'), int(values[0]))
+    return expiry
+
+
+def cacheable(info):
+    """Copy of info that is safe to store as JSON, or None if it is not a
+    plain single video (playlists hold lazy generators, some extractors
+    keep callables in private keys)"""
+    if info.get('_type', 'video') != 'video':
+        return None
+
+    def plain(obj):
+        if isinstance(obj, dict):
+            return {k: plain(v) for k, v in obj.items() if not str(k).startswith('__')}
+        if isinstance(obj, (list, tuple)):
+            return [plain(v) for v in obj]
+        if obj is None or isinstance(obj, (str, int, float, bool)):
+            return obj
+        raise TypeError(type(obj).__name__)
+
+    try:
+        return plain(info)
+    except TypeError:
+        return None
+
+
+class MetadataCache:
+    """SQLite-backed info dict cache with TTL and LRU eviction"""
+
+    def __init__(self, path=None, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = str(path or data_path('metadata.sqlite3'))
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        with self.db:
+            self.db.execute(
+                'CREATE TABLE IF NOT EXISTS metadata ('
+                ' extractor TEXT NOT NULL, video_id TEXT NOT NULL,'
+                ' info TEXT NOT NULL, size INTEGER NOT NULL,'
+                ' created REAL NOT NULL, expires REAL NOT NULL, accessed REAL NOT NULL,'
+                ' PRIMARY KEY (extractor, video_id))')
+            self.db.execute('CREATE INDEX IF NOT EXISTS metadata_accessed ON metadata (accessed)')
+            self.db.execute(
+                'CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+            self.db.execute(
+                'CREATE TABLE IF NOT EXISTS aliases ('
+                ' extractor TEXT NOT NULL, video_id TEXT NOT NULL,'
+                ' target_extractor TEXT NOT NULL, target_id TEXT NOT NULL,'
+                ' PRIMARY KEY (extractor, video_id))')
+
+    def count(self, name):
+        self.db.execute(
+            'INSERT INTO counters VALUES (?, 1) ON CONFLICT(name) DO UPDATE SET value = value + 1',
+            (name,))
+
+    def get(self, extractor, video_id):
+        """Cached info dict, or None on a miss or an expired entry"""
+        now = time.time()
+        with self.lock, self.db:
+            row = self.db.execute(
+                'SELECT info, expires FROM metadata WHERE extractor = ? AND video_id = ?',
+                (extractor, video_id)).fetchone()
+            if row is None or row[1] <= now:
+                if row is not None:
+                    self.db.execute(
+                        'DELETE FROM metadata WHERE extractor = ? AND video_id = ?',
+                        (extractor, video_id))
+                self.misses += 1
+                self.count('misses')
+                return None
+
+            self.db.execute(
+                'UPDATE metadata SET accessed = ? WHERE extractor = ? AND video_id = ?',
+                (now, extractor, video_id))
+            self.hits += 1
+            self.count('hits')
+        return json.loads(row[0])
+
+    def put(self, extractor, video_id, info):
+        """Store info; returns False if it is not cacheable or already stale"""
+        info = cacheable(info)
+        if info is None:
+            return False
+
+        now = time.time()
+        expires = now + self.ttl
+        deadline = stream_expiry(info)
+        if deadline is not None:
+            expires = min(expires, deadline - EXPIRY_MARGIN)
+        if expires <= now:
+            return False
+
+        data = json.dumps(info, separators=(',', ':'))
+        if len(data) > self.max_bytes:
+            return False
+
+        with self.lock, self.db:
+            self.db.execute(
+                'INSERT OR REPLACE INTO metadata VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (extractor, video_id, data, len(data), now, expires, now))
+            self.evict(now)
+        return True
+
+    def evict(self, now=None):
+        """Drop expired entries, then least recently used ones over the cap"""
+        self.db.execute('DELETE FROM metadata WHERE expires <= ?', (now or time.time(),))
+        total = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM metadata').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        rows = self.db.execute(
+            'SELECT extractor, video_id, size FROM metadata ORDER BY accessed').fetchall()
+        for extractor, video_id, size in rows:
+            if total <= self.max_bytes:
+                break
+            self.db.execute(
+                'DELETE FROM metadata WHERE extractor = ? AND video_id = ?', (extractor, video_id))
+            total -= size
+
+    def stats(self):
+        """Hit/miss counters (this process and all time) and current usage"""
+        with self.lock:
+            entries, size = self.db.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM metadata').fetchone()
+            totals = dict(self.db.execute('SELECT name, value FROM counters').fetchall())
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'total_hits': totals.get('hits', 0),
+            'total_misses': totals.get('misses', 0),
+            'entries': entries,
+            'bytes': size,
+            'max_bytes': self.max_bytes,
+            'ttl': self.ttl,
+        }
+
+    def alias(self, key, target):
+        """Remember that the video of `key` is stored under `target`"""
+        if not key or not target or not all(target) or tuple(key) == tuple(target):
+            return
+        with self.lock, self.db:
+            self.db.execute('INSERT OR REPLACE INTO aliases VALUES (?, ?, ?, ?)', (*key, *target))
+
+    def canonical(self, extractor, video_id):
+        """The key entries for (extractor, video_id) are stored under"""
+        with self.lock:
+            row = self.db.execute(
+                'SELECT target_extractor, target_id FROM aliases WHERE extractor = ? AND video_id = ?',
+                (extractor, video_id)).fetchone()
+        return tuple(row) if row else (extractor, video_id)
+
+    def invalidate(self, extractor, video_id):
+        with self.lock, self.db:
+            self.db.execute(
+                'DELETE FROM metadata WHERE extractor = ? AND video_id = ?', (extractor, video_id))
+
+    def clear(self):
+        with self.lock, self.db:
+            self.db.execute('DELETE FROM metadata')
+            self.db.execute('DELETE FROM counters')
+
+    def close(self):
+        self.db.close()
+
+
+_shared_cache = None
+_shared_lock = threading.Lock()
+
+
+def shared_cache():
+    """Process-wide MetadataCache using the default location and limits"""
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = MetadataCache()
+        return _shared_cache
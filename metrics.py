@@ -0,0 +1,327 @@
+"""Per-job instrumentation and metrics export.
+
+Every download keeps a JobMetrics record of where its time went: the
+pipeline stages (extract, download, queued, postprocess; see
+pipeline.StageTimer) and each postprocessor run (Merger, ExtractAudio,
+...). It also records the bytes transferred, the transfer retries yt-dlp
+made, and whether the metadata cache answered. Finished jobs go to a
+process-wide MetricsRegistry, which keeps running totals and the most
+recent job records. They can be exported as:
+
+    JSON        MetricsRegistry.report(): the run, its jobs and the totals
+    Prometheus  MetricsRegistry.prometheus(): text exposition format, for a
+                textfile collector or the /metrics endpoint of serve_metrics()
+
+profiled() runs a single job under cProfile and/or tracemalloc.
+"""
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import monotonic
+
+from pipeline import StageTimer
+
+# Finished jobs kept for the JSON report
+MAX_JOBS = 1000
+PREFIX = 'l1ght_'
+
+_startup = None
+
+
+def process_age():
+    """Seconds since this process started, or None where that is unknown"""
+    try:
+        if sys.platform == 'win32':
+            import ctypes
+            from ctypes import wintypes
+            kernel32 = ctypes.windll.kernel32
+            created, exited, kernel, user, now = (wintypes.FILETIME() for _ in range(5))
+            if not kernel32.GetProcessTimes(kernel32.GetCurrentProcess(), ctypes.byref(created),
+                                            ctypes.byref(exited), ctypes.byref(kernel), ctypes.byref(user)):
+                return None
+            kernel32.GetSystemTimeAsFileTime(ctypes.byref(now))
+            ticks = [(t.dwHighDateTime << 32) | t.dwLowDateTime for t in (created, now)]
+            return (ticks[1] - ticks[0]) / 1e7  # 100ns units
+        with open('/proc/self/stat') as f:
+            # Field 22, the start time in clock ticks after boot; counting
+            # starts after the parenthesised command name (field 2)
+            started = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        return uptime - started / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def mark_startup():
+    """Record how long the interpreter took to start and import everything"""
+    global _startup
+    _startup = process_age()
+    return _startup
+
+
+class JobMetrics:
+    """Where one download spent its time, bytes and retries"""
+
+    def __init__(self, url, quality, timer=None):
+        self.url = url
+        self.quality = quality
+        self.timer = timer or StageTimer()
+        self.started = time.time()
+        self.finished = None
+        self.status = None
+        self.error = None
+        self.cache = None  # 'hit' or 'miss' when the metadata cache was asked
+        self.retries = 0
+        self.files = {}
+        self.postprocessors = {}
+        self.running = {}
+        self.lock = threading.Lock()
+
+    @property
+    def bytes(self):
+        return sum(self.files.values())
+
+    def progress_hook(self, d):
+        """yt-dlp progress hook: bytes written per file"""
+        if d['status'] in ('downloading', 'finished'):
+            downloaded = d.get('downloaded_bytes') or d.get('total_bytes')
+            if downloaded:
+                with self.lock:
+                    self.files[d.get('filename')] = downloaded
+
+    def postprocessor_hook(self, d):
+        """yt-dlp postprocessor hook: time per postprocessor"""
+        name = d.get('postprocessor') or 'unknown'
+        with self.lock:
+            if d['status'] == 'started':
+                self.running[name] = monotonic()
+            elif d['status'] == 'finished' and name in self.running:
+                self.postprocessors[name] = (self.postprocessors.get(name, 0.0)
+                                             + monotonic() - self.running.pop(name))
+
+    def count_retries(self, ydl):
+        """Count the retries ydl reports (transfer, fragment and extractor)"""
+        def counting(report):
+            def wrapper(message, *args, **kwargs):
+                # yt-dlp's RetryManager reports "<error>. Retrying (n/m)..."
+                if 'Retrying' in str(message):
+                    with self.lock:
+                        self.retries += 1
+                return report(message, *args, **kwargs)
+            return wrapper
+
+        ydl.to_screen = counting(ydl.to_screen)
+        ydl.report_warning = counting(ydl.report_warning)
+
+    def finish(self, status, error=None):
+        self.status = status
+        self.error = error
+        self.finished = time.time()
+
+    def as_dict(self):
+        with self.lock:
+            return {
+                'url': self.url,
+                'quality': self.quality,
+                'status': self.status,
+                'error': self.error,
+                'started': self.started,
+                'elapsed': round((self.finished or time.time()) - self.started, 3),
+                'phases': {name: round(seconds, 3) for name, seconds in self.timer.stages.items()},
+                'postprocessors': {name: round(seconds, 3) for name, seconds in self.postprocessors.items()},
+                'bytes': self.bytes,
+                'retries': self.retries,
+                'cache': self.cache,
+            }
+
+
+class MetricsRegistry:
+    """Running totals over finished jobs, exportable as JSON or Prometheus text"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Uptime counts from the process start where it is known
+        self.started = time.time() - (process_age() or 0.0)
+        self.jobs = deque(maxlen=MAX_JOBS)
+        self.counters = {}  # (name, labels) -> value
+        self.summaries = {}  # (name, labels) -> [sum, count]
+        self.on_record = []
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            total = self.summaries.setdefault(key, [0.0, 0])
+            total[0] += value
+            total[1] += 1
+
+    def record(self, job):
+        """Add a finished JobMetrics to the totals"""
+        self.inc('downloads_total', status=job.status)
+        self.inc('downloaded_bytes_total', job.bytes)
+        if job.retries:
+            self.inc('retries_total', job.retries, kind='transfer')
+        if job.cache:
+            self.inc('cache_lookups_total', result=job.cache)
+        for name, seconds in list(job.timer.stages.items()):
+            self.observe('phase_seconds', seconds, phase=name)
+        for name, seconds in list(job.postprocessors.items()):
+            self.observe('postprocessor_seconds', seconds, postprocessor=name)
+        self.observe('job_seconds', (job.finished or time.time()) - job.started, status=job.status)
+        with self.lock:
+            self.jobs.append(job.as_dict())
+            callbacks = list(self.on_record)
+        for callback in callbacks:
+            callback(self)
+
+    def totals(self):
+        with self.lock:
+            totals = {}
+            for (name, labels), value in self.counters.items():
+                totals.setdefault(name, {})[','.join(f"{k}={v}" for k, v in labels) or 'all'] = value
+            for (name, labels), (total, count) in self.summaries.items():
+                totals.setdefault(name, {})[','.join(f"{k}={v}" for k, v in labels) or 'all'] = {
+                    'sum': round(total, 3), 'count': count}
+            return totals
+
+    def report(self):
+        """JSON-ready report of this run: startup, every recorded job and the totals"""
+        with self.lock:
+            jobs = list(self.jobs)
+        return {
+            'started': self.started,
+            'elapsed': round(time.time() - self.started, 3),
+            'startup_seconds': round(_startup, 3) if _startup is not None else None,
+            'jobs': jobs,
+            'totals': self.totals(),
+        }
+
+    def prometheus(self):
+        """Totals in the Prometheus text exposition format"""
+        def series(name, labels, value):
+            text = ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+                            for k, v in labels)
+            return f"{PREFIX}{name}{{{text}}} {value}" if text else f"{PREFIX}{name} {value}"
+
+        lines = []
+        with self.lock:
+            counters = sorted(self.counters.items())
+            summaries = sorted(self.summaries.items())
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {PREFIX}{name} counter")
+            lines.append(series(name, labels, value))
+        for (name, labels), (total, count) in summaries:
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {PREFIX}{name} summary")
+            lines.append(series(f"{name}_sum", labels, round(total, 6)))
+            lines.append(series(f"{name}_count", labels, count))
+        if _startup is not None:
+            lines += [f"# TYPE {PREFIX}startup_seconds gauge", series('startup_seconds', (), round(_startup, 6))]
+        lines += [f"# TYPE {PREFIX}uptime_seconds gauge",
+                  series('uptime_seconds', (), round(time.time() - self.started, 3))]
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path):
+        """Write the Prometheus text atomically, e.g. for node_exporter's textfile collector"""
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(self.prometheus())
+        os.replace(temp_path, path)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """GET /metrics (Prometheus text) and /metrics.json"""
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        registry = self.server.registry
+        if self.path == '/metrics':
+            body, content_type = registry.prometheus(), 'text/plain; version=0.0.4'
+        elif self.path == '/metrics.json':
+            body, content_type = json.dumps(registry.report()), 'application/json'
+        else:
+            return self.send_error(404)
+        body = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve_metrics(registry, port, host='127.0.0.1'):
+    """Serve the registry on http://host:port/metrics from a background thread"""
+    httpd = ThreadingHTTPServer((host, port), MetricsHandler)
+    httpd.daemon_threads = True
+    httpd.registry = registry
+    threading.Thread(target=httpd.serve_forever, name='metrics', daemon=True).start()
+    return httpd
+
+
+@contextmanager
+def profiled(modes, path=None):
+    """Profile the enclosed job with cProfile ('cpu') and/or tracemalloc ('memory')
+
+    Prints the top entries when done; with `path` the cProfile stats are
+    also saved there for snakeviz/pstats. cProfile only sees the calling
+    thread, which runs extraction, plain downloads and inline
+    post-processing.
+    """
+    modes = set(modes)
+    profiler = cProfile.Profile() if 'cpu' in modes else None
+    if 'memory' in modes:
+        tracemalloc.start()
+    if profiler:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler:
+            profiler.disable()
+            output = io.StringIO()
+            pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(20)
+            print(f"🔬 CPU profile (top 20 by cumulative time):\n{output.getvalue()}")
+            if path:
+                profiler.dump_stats(path)
+                print(f"🔬 Profile saved to {path}")
+        if 'memory' in modes:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"🔬 Memory: {current/1024/1024:.1f}MiB still allocated, peak {peak/1024/1024:.1f}MiB")
+            for stat in snapshot.statistics('lineno')[:10]:
+                print(f"  {stat}")
+
+
+_shared_metrics = None
+_shared_lock = threading.Lock()
+
+
+def shared_metrics():
+    """Process-wide MetricsRegistry"""
+    global _shared_metrics
+    with _shared_lock:
+        if _shared_metrics is None:
+            _shared_metrics = MetricsRegistry()
+        return _shared_metrics
@@ -0,0 +1,14 @@
+"""Locations of the downloader's own data files (caches, indexes, journals)"""
+
+import os
+from pathlib import Path
+
+# Override with L1GHT_VIDEO_HOME, e.g. to keep caches on a faster disk
+DATA_DIR = Path(os.environ.get('L1GHT_VIDEO_HOME') or Path.home() / '.l1ght_video')
+
+
+def data_path(*parts):
+    """Path inside DATA_DIR, creating its parent folders"""
+    path = DATA_DIR.joinpath(*parts)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    return path
@@ -0,0 +1,173 @@
+"""Download and post-processing as separate pipeline stages.
+
+yt-dlp merges formats and extracts audio right after the download, on the
+same thread, so a batch worker leaves the network idle while ffmpeg runs.
+With a PostProcessPool the ffmpeg step of a job is handed to a bounded pool
+of post-processing workers (one per CPU core by default), and the download
+worker moves on to its next URL: downloading job N+1 overlaps muxing or
+transcoding job N.
+
+The ffmpeg work happens in ffmpeg processes, so the pool's workers are
+threads that only wait for them; the ydl and info dicts never have to be
+pickled. When more jobs are waiting for post-processing than the backlog
+allows, handing over the next one blocks the download worker. Downloads
+then pause until ffmpeg catches up, instead of filling the disk with
+unmerged files.
+
+StageTimer records how long each job spent in each stage (extract,
+download, queued, postprocess); the batch summary reports them.
+"""
+
+import os
+import sys
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from time import monotonic
+
+# Post-processing workers (0 runs post-processing inline) and how many jobs
+# may wait for one before downloads pause
+DEFAULT_PP_WORKERS = int(os.environ.get('L1GHT_PP_WORKERS', os.cpu_count() or 1))
+DEFAULT_PP_BACKLOG = int(os.environ.get('L1GHT_PP_BACKLOG', 0)) or None
+
+STAGES = ('extract', 'download', 'queued', 'postprocess')
+
+
+def format_stages(stages):
+    """'download 8.0s, postprocess 3.1s' in pipeline order"""
+    names = [name for name in STAGES if name in stages] + [name for name in stages if name not in STAGES]
+    return ", ".join(f"{name} {stages[name]:.1f}s" for name in names)
+
+
+class StageTimer:
+    """Wall time a job spent in each stage
+
+    Stages may nest: time spent in the inner stage is not counted for the
+    outer one, so post-processing that runs inside the download call is
+    reported separately.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.stack = []
+
+    def charge(self, entry, now):
+        name, started = entry
+        self.stages[name] = self.stages.get(name, 0.0) + now - started
+
+    @contextmanager
+    def stage(self, name):
+        now = monotonic()
+        if self.stack:
+            self.charge(self.stack[-1], now)
+        self.stack.append([name, now])
+        try:
+            yield
+        finally:
+            now = monotonic()
+            self.charge(self.stack.pop(), now)
+            if self.stack:
+                self.stack[-1][1] = now
+
+    def __str__(self):
+        return format_stages(self.stages)
+
+
+def capture_post_process(ydl, timer, defer=False):
+    """Time ydl's post-processing and, with `defer`, hold back its ffmpeg work
+
+    yt-dlp calls ydl.post_process() once per downloaded file. Calls that
+    have ffmpeg work (a merge, or post_process postprocessors such as
+    FFmpegExtractAudio) are recorded in the returned list instead of run
+    when `defer` is set; run_deferred() runs them later.
+    """
+    deferred = []
+    run = ydl.post_process
+
+    def post_process(filename, info, files_to_move=None):
+        if defer and (info.get('__postprocessors') or ydl._pps.get('post_process')):
+            deferred.append((run, filename, info, files_to_move))
+            return info
+        with timer.stage('postprocess'):
+            return run(filename, info, files_to_move)
+
+    ydl.post_process = post_process
+    return deferred
+
+
+def run_deferred(deferred):
+    """Run post-processing captured by capture_post_process()"""
+    for run, filename, info, files_to_move in deferred:
+        processed = run(filename, info, files_to_move)
+        # The info dict is shared with the result's requested_downloads
+        if processed is not info:
+            info.clear()
+            info.update(processed)
+
+
+class PostProcessPool:
+    """Bounded pool that runs the post-processing stage of download jobs"""
+
+    def __init__(self, workers=None, backlog=None):
+        self.workers = max(1, workers or DEFAULT_PP_WORKERS)
+        self.backlog = max(1, backlog or DEFAULT_PP_BACKLOG or self.workers * 2)
+        self.slots = threading.BoundedSemaphore(self.backlog)
+        self.executor = ThreadPoolExecutor(self.workers, thread_name_prefix='postprocess')
+        self.lock = threading.Lock()
+        self.jobs = 0
+        self.stalls = 0
+        self.stalled = 0.0
+
+    def submit(self, fn, timer):
+        """Run fn() on the pool and return its Future
+
+        Blocks while the backlog is full. The Future carries the job's
+        stage times as `.timings`.
+        """
+        queued = monotonic()
+        if not self.slots.acquire(blocking=False):
+            print(f"⏸️ Post-processing backlog full ({self.backlog} jobs), pausing downloads")
+            self.slots.acquire()
+            with self.lock:
+                self.stalls += 1
+                self.stalled += monotonic() - queued
+
+        # Keep the job's output where the download's went (a batch routes
+        # each worker thread's prints to that job's prefixed stream)
+        router = sys.stdout
+        output = router.stream if hasattr(router, 'route') else None
+
+        def run():
+            if output is not None:
+                router.route(output)
+            timer.stages['queued'] = monotonic() - queued
+            try:
+                with timer.stage('postprocess'):
+                    return fn()
+            finally:
+                self.slots.release()
+                if output is not None:
+                    router.route(None)
+
+        with self.lock:
+            self.jobs += 1
+        future = self.executor.submit(run)
+        future.timings = timer.stages
+        return future
+
+    def completed(self, result, timer):
+        """An already finished Future, for jobs with nothing to post-process"""
+        future = Future()
+        future.timings = timer.stages
+        future.set_result(result)
+        return future
+
+    def summary(self):
+        with self.lock:
+            text = f"{self.jobs} job(s) on {self.workers} worker(s)"
+            if self.stalls:
+                text += f", downloads paused {self.stalls}x for {self.stalled:.1f}s (backlog {self.backlog})"
+            return text
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,59 @@
+"""Playlist and channel expansion.
+
+Playlists are extracted flat: yt-dlp returns the entry list lazily, one
+page at a time, and each entry is little more than a URL. The entries are
+fed to the batch worker pool as they are read. Each worker resolves its
+entry's full metadata and downloads it right away, so the first video
+starts while later pages of a long channel are still being listed.
+"""
+
+from time import monotonic
+
+from batch import print_summary, run_batch
+from progress import shared_progress
+
+PLAYLIST_TYPES = ('playlist', 'multi_video')
+
+
+def is_playlist(info):
+    return info.get('_type') in PLAYLIST_TYPES
+
+
+def is_resolved(entry):
+    """True if the entry already carries full video metadata"""
+    return entry.get('_type', 'video') == 'video'
+
+
+def entry_url(entry):
+    """Page URL of a playlist entry, flat or resolved"""
+    if not is_resolved(entry):
+        return entry.get('url')
+    return entry.get('webpage_url') or entry.get('original_url') or entry.get('url')
+
+
+def iter_entries(info):
+    """Yield a playlist's entries lazily, flattening nested playlists"""
+    for entry in info.get('entries') or []:
+        if not entry:
+            continue
+        if is_playlist(entry):
+            yield from iter_entries(entry)
+        else:
+            yield entry
+
+
+def download_playlist(info, download_entry, workers):
+    """Download every entry of a playlist on a pool of `workers` threads
+
+    download_entry(entry) gets either a flat entry (only a URL) or an
+    already-resolved video dict. Returns the finished BatchJob list.
+    """
+    title = info.get('title') or info.get('id') or 'Untitled playlist'
+    total = info.get('playlist_count')
+
+    print(f"📃 Playlist: {title}" + (f" ({total} entries)" if total else ""))
+    started = monotonic()
+    jobs = run_batch(iter_entries(info), download_entry, workers, total=total, describe=entry_url,
+                     progress=shared_progress())
+    print_summary(jobs, monotonic() - started)
+    return jobs
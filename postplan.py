@@ -0,0 +1,112 @@
+"""Codec-aware post-processing plans.
+
+Re-encoding is by far the most CPU-hungry step of a download; copying
+streams into another container costs next to nothing. The planner looks at
+the codecs of the selected formats and picks the cheapest step that
+produces an acceptable file:
+
+    keep       the downloaded file is already acceptable as is
+    remux      copy the stream into the accepted container (no re-encode)
+    merge      copy separate video and audio streams into one container
+    transcode  re-encode, only when no accepted codec is available
+
+For audio the user lists the formats they accept, e.g. 'm4a,opus,mp3':
+an AAC or Opus source is then kept or remuxed, and only other codecs are
+re-encoded to the first format in the list. The selector also prefers
+sources that are already in an accepted codec. The default, 'mp3', keeps
+the old behaviour of always producing an MP3.
+"""
+
+import os
+
+DEFAULT_AUDIO_FORMAT = os.environ.get('L1GHT_AUDIO_FORMAT', 'mp3')
+
+# Accepted audio format -> (codecs it holds without re-encoding, file
+# extension, format selector filter for such sources)
+AUDIO_TARGETS = {
+    'mp3': (('mp3',), 'mp3', '[acodec=mp3]'),
+    'm4a': (('mp4a', 'aac', 'alac'), 'm4a', '[acodec^=mp4a]'),
+    'opus': (('opus',), 'opus', '[acodec=opus]'),
+    'vorbis': (('vorbis',), 'ogg', '[acodec=vorbis]'),
+    'flac': (('flac',), 'flac', '[acodec=flac]'),
+}
+
+# Containers for merged video, most preferred first: (video codecs, audio
+# codecs) each can hold by stream copy; None means anything goes
+VIDEO_CONTAINERS = [
+    ('mp4', ('avc1', 'h264', 'hevc', 'hev1', 'hvc1', 'av01', 'vp9'),
+     ('mp4a', 'aac', 'mp3', 'opus', 'ac-3', 'ec-3', 'flac')),
+    ('webm', ('vp8', 'vp9', 'av01'), ('opus', 'vorbis')),
+    ('mkv', None, None),
+]
+
+# Codec implied by the extension when the extractor does not say
+EXT_CODECS = {'mp3': 'mp3', 'm4a': 'mp4a', 'aac': 'mp4a', 'opus': 'opus', 'ogg': 'vorbis', 'flac': 'flac'}
+
+
+def codec_family(codec):
+    """'mp4a.40.2' -> 'mp4a', 'vp09.00.40.08' -> 'vp9', 'none'/None -> None"""
+    if not codec or codec == 'none':
+        return None
+    family = codec.split('.')[0].lower()
+    return {'vp09': 'vp9', 'vp08': 'vp8', 'avc3': 'avc1'}.get(family, family)
+
+
+def parse_audio_formats(text):
+    """['m4a', 'opus'] from 'm4a,opus'; raises ValueError on unknown names"""
+    formats = [name.strip().lower() for name in (text or DEFAULT_AUDIO_FORMAT).split(',') if name.strip()]
+    unknown = [name for name in formats if name not in AUDIO_TARGETS]
+    if unknown or not formats:
+        raise ValueError(f"Unknown audio format(s): {', '.join(unknown) or text!r}"
+                         f" (choose from {', '.join(AUDIO_TARGETS)})")
+    return formats
+
+
+def audio_selector(accepted):
+    """bestaudio spec that prefers sources already in an accepted codec"""
+    specs = [f"bestaudio{AUDIO_TARGETS[name][2]}" for name in accepted]
+    return '/'.join(specs + ['bestaudio'])
+
+
+class Plan:
+    """What to do with a download after it finished"""
+
+    def __init__(self, action, target, reason):
+        self.action = action
+        self.target = target
+        self.reason = reason
+
+    @property
+    def reencodes(self):
+        return self.action == 'transcode'
+
+    def __str__(self):
+        return f"{self.action} → {self.target} ({self.reason})"
+
+
+def plan_audio(fmt, accepted):
+    """Plan for a selected audio format given the accepted audio formats"""
+    ext = fmt.get('ext')
+    codec = codec_family(fmt.get('acodec')) or EXT_CODECS.get(ext)
+    for name in accepted:
+        codecs, target_ext, _ = AUDIO_TARGETS[name]
+        if codec in codecs:
+            if ext == target_ext:
+                return Plan('keep', name, f"{codec} in .{ext} already")
+            return Plan('remux', name, f"copy {codec} from .{ext} into .{target_ext}")
+    return Plan('transcode', accepted[0], f"{codec or 'unknown codec'} is not in {', '.join(accepted)}")
+
+
+def plan_video(selected):
+    """Plan for a selected video: the container its streams fit unchanged"""
+    formats = selected.get('requested_formats')
+    if not formats:
+        return Plan('keep', selected.get('ext'), "single file with video and audio")
+
+    vcodec = next((codec_family(f.get('vcodec')) for f in formats if codec_family(f.get('vcodec'))), None)
+    acodec = next((codec_family(f.get('acodec')) for f in formats if codec_family(f.get('acodec'))), None)
+    for container, video_codecs, audio_codecs in VIDEO_CONTAINERS:
+        if ((video_codecs is None or vcodec is None or vcodec in video_codecs)
+                and (audio_codecs is None or acodec is None or acodec in audio_codecs)):
+            # mkv, the last entry, holds anything, so this always returns
+            return Plan('merge', container, f"copy {vcodec or '?'} + {acodec or '?'} into .{container}")
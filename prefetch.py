@@ -0,0 +1,127 @@
+"""Metadata prefetch.
+
+Extraction is most of the wait between clicking Download and the first
+byte. A frontend knows the URL earlier, as soon as it is pasted, and the
+Prefetcher extracts it in the background while the user is still choosing
+options: through the metadata cache, exactly as download_video would, so
+the download then starts from a cache hit. The result is also summarised
+for display: title, duration, thumbnail, and for every quality profile the
+format it would download with its estimated size.
+
+A download that arrives while the prefetch of its URL is still running
+waits for it instead of extracting a second time (see claim()).
+"""
+
+import copy
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from formats import QUALITY_FORMATS, FormatResolver, format_chain
+from metacache import fetch_info, lookup_key
+from playlist import is_playlist
+from postplan import audio_selector, parse_audio_formats
+from scheduler import estimate_size
+from session import checkout
+
+# Quality profiles summarised for the GUI
+PREFETCH_QUALITIES = ('best', '720p', '480p', 'audio')
+
+# Prefetched URLs remembered at once; the oldest finished ones are dropped
+MAX_PREFETCHES = 16
+
+
+def quality_selector(quality, audio_format=None):
+    if quality == 'audio':
+        return audio_selector(parse_audio_formats(audio_format))
+    return QUALITY_FORMATS.get(quality, 'best[ext=mp4]/best')
+
+
+def describe_qualities(ydl, info, qualities=PREFETCH_QUALITIES, audio_format=None):
+    """{quality: {format_id, ext, height, size} or None if nothing matches}"""
+    summary = {}
+    for quality in qualities:
+        ydl.format_selector = FormatResolver(ydl, format_chain(quality_selector(quality, audio_format)),
+                                             verbose=False)
+        try:
+            # Format selection annotates the info dict; keep the original clean
+            selected = ydl.process_ie_result(copy.deepcopy(info), download=False)
+        except Exception:
+            summary[quality] = None
+            continue
+        summary[quality] = {
+            'format_id': selected.get('format_id'),
+            'ext': selected.get('ext'),
+            'height': selected.get('height'),
+            'size': estimate_size(selected, info.get('duration')),
+        }
+    return summary
+
+
+class Prefetcher:
+    """Extracts URLs in the background ahead of their downloads"""
+
+    def __init__(self, sessions=None, workers=2, use_cache=True, qualities=PREFETCH_QUALITIES):
+        self.sessions = sessions
+        self.use_cache = use_cache
+        self.qualities = qualities
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='prefetch')
+        self.prefetches = OrderedDict()  # url -> Future of (info, summary)
+        self.lock = threading.Lock()
+
+    def start(self, url, callback=None):
+        """Prefetch `url` unless already done; callback(summary, error) runs when it is ready"""
+        with self.lock:
+            future = self.prefetches.get(url)
+            if future is None or (future.done() and future.exception() is not None):
+                future = self.prefetches[url] = self.executor.submit(self.fetch, url)
+            self.prefetches.move_to_end(url)
+            for old in list(self.prefetches)[:-MAX_PREFETCHES]:
+                if self.prefetches[old].done():
+                    del self.prefetches[old]
+        if callback is not None:
+            def done(future):
+                error = future.exception()
+                callback(None if error else future.result()[1], error)
+            future.add_done_callback(done)
+        return future
+
+    def fetch(self, url):
+        """Worker thread: (info, summary) of `url`, extracted through the metadata cache"""
+        with checkout({'quiet': True, 'no_warnings': True}, self.sessions) as lease:
+            ydl = lease.ydl
+            info, _ = fetch_info(ydl, url, self.use_cache)
+            if is_playlist(info):
+                # Entries are listed lazily by the download itself
+                return None, {'title': info.get('title'), 'playlist': True}
+            summary = {
+                'title': info.get('title'),
+                'duration': info.get('duration'),
+                'thumbnail': info.get('thumbnail'),
+                'uploader': info.get('uploader'),
+                'playlist': False,
+                'qualities': describe_qualities(ydl, info, self.qualities),
+            }
+        return info, summary
+
+    def claim(self, url, timeout=None):
+        """Wait for a running prefetch of `url` before its download starts
+
+        Returns the prefetched info dict when the download could not find
+        it in the metadata cache by itself (e.g. the generic extractor),
+        otherwise None.
+        """
+        with self.lock:
+            future = self.prefetches.pop(url, None)
+        if future is None:
+            return None
+        try:
+            info = future.result(timeout)[0]
+        except Exception:
+            return None  # the download extracts again and reports the error
+        if info is not None and (not self.use_cache or lookup_key(url) is None):
+            return info
+        return None
+
+    def close(self):
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,239 @@
+"""Throttled, smoothed download progress.
+
+yt-dlp calls its progress hooks for every chunk it writes, which on a fast
+link is thousands of times a second. Formatting and flushing a line (or a
+JSON event) for each call costs more than the download itself, and every
+line is another redraw in the GUI.
+
+ProgressAggregator keeps the running state of every job instead: bytes per
+stream, an exponentially weighted moving average (EWMA) of the speed and
+the ETA derived from it. An update is only passed on when at least
+`interval` seconds have passed since the last one and the job moved by at
+least `min_delta` percent (or `heartbeat` seconds went by, so speed and ETA
+stay fresh on slow links). Finished streams are always passed on. While
+several jobs run at once it also reports a combined rollup of all of them.
+"""
+
+import math
+import os
+import threading
+from time import monotonic
+
+# Fastest rate at which one job reports progress (seconds between updates)
+DEFAULT_INTERVAL = float(os.environ.get('L1GHT_PROGRESS_INTERVAL', 0.5))
+# Smallest change in percent worth reporting before the heartbeat
+DEFAULT_MIN_DELTA = float(os.environ.get('L1GHT_PROGRESS_DELTA', 1.0))
+# Report at least this often even when the percentage barely moves
+DEFAULT_HEARTBEAT = 2.0
+# Time constant of the speed EWMA: older samples fade out over a few seconds
+DEFAULT_SMOOTHING = 3.0
+# Chunks closer together than this are folded into one speed sample
+MIN_SAMPLE = 0.1
+
+
+class JobProgress:
+    """Running totals and smoothed speed of one job across its streams"""
+
+    def __init__(self, smoothing=DEFAULT_SMOOTHING):
+        self.smoothing = smoothing
+        self.streams = {}  # filename -> [downloaded, total]
+        self.speed = None
+        self.sample_bytes = 0
+        self.sample_time = None
+        self.reported_at = None
+        self.reported_percent = None
+
+    @property
+    def downloaded(self):
+        return sum(stream[0] for stream in self.streams.values())
+
+    @property
+    def total(self):
+        totals = [stream[1] for stream in self.streams.values()]
+        if not totals or None in totals:
+            return None
+        return sum(totals)
+
+    @property
+    def percent(self):
+        total = self.total
+        if not total:
+            return None
+        return min(100.0, self.downloaded / total * 100)
+
+    @property
+    def eta(self):
+        total = self.total
+        if not total or not self.speed:
+            return None
+        return max(0.0, (total - self.downloaded) / self.speed)
+
+    def update(self, d, now):
+        downloaded = d.get('downloaded_bytes') or 0
+        total = d.get('total_bytes') or d.get('total_bytes_estimate')
+        self.streams[d.get('filename')] = [downloaded, total]
+
+        downloaded = self.downloaded
+        if self.sample_time is None:
+            self.sample_time, self.sample_bytes = now, downloaded
+            return
+        elapsed = now - self.sample_time
+        if elapsed < MIN_SAMPLE:
+            return
+
+        speed = max(0, downloaded - self.sample_bytes) / elapsed
+        if self.speed is None:
+            self.speed = speed
+        else:
+            # Weight by elapsed time so irregular callback rates don't skew it
+            weight = 1 - math.exp(-elapsed / self.smoothing)
+            self.speed += weight * (speed - self.speed)
+        self.sample_time, self.sample_bytes = now, downloaded
+
+    def snapshot(self):
+        percent = self.percent
+        eta = self.eta
+        return {
+            'downloaded_bytes': self.downloaded,
+            'total_bytes': self.total,
+            'percent': round(percent, 1) if percent is not None else None,
+            'speed': round(self.speed) if self.speed is not None else None,
+            'eta': round(eta) if eta is not None else None,
+        }
+
+
+class ProgressAggregator:
+    """Progress state of every running job, with throttled reporting
+
+    Jobs are identified by any hashable key. `on_rollup(rollup)` is called
+    with the combined figures (see rollup()) at most every
+    `rollup_interval` seconds while more than one job is running. `clock`
+    returns the current time in seconds.
+    """
+
+    def __init__(self, interval=DEFAULT_INTERVAL, min_delta=DEFAULT_MIN_DELTA,
+                 heartbeat=DEFAULT_HEARTBEAT, smoothing=DEFAULT_SMOOTHING,
+                 on_rollup=None, rollup_interval=None, clock=monotonic):
+        self.clock = clock
+        self.interval = interval
+        self.min_delta = min_delta
+        self.heartbeat = max(heartbeat, interval)
+        self.smoothing = smoothing
+        self.on_rollup = on_rollup
+        self.rollup_interval = rollup_interval if rollup_interval is not None else self.heartbeat
+        self.jobs = {}
+        self.rolled_up_at = None
+        self.lock = threading.Lock()
+
+    def update(self, key, d):
+        """Feed one yt-dlp progress dict for job `key`
+
+        Returns a snapshot dict (downloaded_bytes, total_bytes, percent,
+        speed, eta) when the update is worth reporting, else None.
+        """
+        if d['status'] not in ('downloading', 'finished'):
+            return None
+
+        now = self.clock()
+        rollup = None
+        with self.lock:
+            job = self.jobs.get(key)
+            if job is None:
+                job = self.jobs[key] = JobProgress(self.smoothing)
+            job.update(d, now)
+
+            snapshot = None
+            if d['status'] == 'finished' or self.due(job, now):
+                snapshot = job.snapshot()
+                job.reported_at = now
+                job.reported_percent = snapshot['percent']
+
+            if (self.on_rollup and len(self.jobs) > 1
+                    and (self.rolled_up_at is None or now - self.rolled_up_at >= self.rollup_interval)):
+                self.rolled_up_at = now
+                rollup = self.combine()
+
+        if rollup:
+            self.on_rollup(rollup)
+        return snapshot
+
+    def due(self, job, now):
+        # Called with the lock held
+        if job.reported_at is None:
+            return True
+        since = now - job.reported_at
+        if since < self.interval:
+            return False
+        if since >= self.heartbeat:
+            return True
+        percent = job.percent
+        if percent is None or job.reported_percent is None:
+            return False
+        return abs(percent - job.reported_percent) >= self.min_delta
+
+    def job(self, key):
+        """Current snapshot of one job, or None if it is not running"""
+        with self.lock:
+            job = self.jobs.get(key)
+            return job.snapshot() if job else None
+
+    def finish(self, key):
+        """Forget a job once it has finished or failed"""
+        with self.lock:
+            job = self.jobs.pop(key, None)
+            return job.snapshot() if job else None
+
+    def rollup(self):
+        """Combined progress of every running job"""
+        with self.lock:
+            return self.combine()
+
+    def combine(self):
+        # Called with the lock held
+        jobs = list(self.jobs.values())
+        downloaded = sum(job.downloaded for job in jobs)
+        totals = [job.total for job in jobs]
+        total = sum(totals) if totals and None not in totals else None
+        speed = sum(job.speed or 0 for job in jobs)
+        return {
+            'jobs': len(jobs),
+            'downloaded_bytes': downloaded,
+            'total_bytes': total,
+            'percent': round(min(100.0, downloaded / total * 100), 1) if total else None,
+            'speed': round(speed),
+            'eta': round(max(0, total - downloaded) / speed) if total and speed else None,
+        }
+
+
+def format_eta(seconds):
+    mins, secs = divmod(int(seconds), 60)
+    hours, mins = divmod(mins, 60)
+    return f"{hours}:{mins:02d}:{secs:02d}" if hours else f"{mins:02d}:{secs:02d}"
+
+
+def format_progress(snapshot):
+    """Human-readable progress line for a snapshot or rollup"""
+    total = snapshot.get('total_bytes')
+    downloaded = snapshot.get('downloaded_bytes') or 0
+    if snapshot.get('percent') is not None:
+        text = f"{snapshot['percent']:.1f}% of {total/1024/1024:.2f}MiB"
+    else:
+        text = f"{downloaded/1024/1024:.2f}MiB"
+    if snapshot.get('speed'):
+        text += f" at {snapshot['speed']/1024/1024:.2f}MiB/s"
+    if snapshot.get('eta') is not None:
+        text += f", ETA {format_eta(snapshot['eta'])}"
+    return text
+
+
+_shared_progress = None
+_shared_lock = threading.Lock()
+
+
+def shared_progress():
+    """Process-wide ProgressAggregator, so concurrent jobs can be rolled up"""
+    global _shared_progress
+    with _shared_lock:
+        if _shared_progress is None:
+            _shared_progress = ProgressAggregator()
+        return _shared_progress
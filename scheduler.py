@@ -0,0 +1,235 @@
+"""Size-aware ordering of batch jobs.
+
+Batch jobs normally run in the order they were given, and a download only
+learns its size once it starts, so one 8GB video at the front holds up
+every short clip behind it. The Scheduler preflights the queued URLs
+first: it extracts each one's metadata (through the metadata cache, so the
+download does not extract again), selects the format the quality profile
+would download, and estimates its size from `filesize`, `filesize_approx`
+or bitrate times duration. The jobs are then ordered:
+
+    fifo      as given
+    sjf       shortest job first; unknown sizes last
+    deadline  earliest deadline first, then the rest shortest first
+
+A URL line may carry a deadline after a space: `URL 18:30` (today, or
+tomorrow once past) or `URL 2024-05-01T18:30`, and clips of the video in
+yt-dlp's --download-sections form: `URL *1:00-1:30 *5:00-5:20` (see
+clips.py). A clip's estimate is its share of the video's.
+
+Before a job starts, its estimate is checked against the free space on
+the output volume, less what running jobs still need and a safety margin.
+A merge or an audio conversion needs room for the parts and the output at
+the same time. A job that does not fit is deferred: later jobs that fit
+go ahead, and it waits for running jobs to finish. If it still does not
+fit once nothing else runs, it is rejected.
+"""
+
+import os
+import shutil
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from clips import clip_fraction, parse_clips
+from formats import QUALITY_FORMATS, FormatResolver, format_chain
+from metacache import fetch_info
+from playlist import is_playlist
+from postplan import audio_selector, parse_audio_formats
+from session import checkout
+
+ORDERS = ('fifo', 'sjf', 'deadline')
+
+# Kept free on the output volume
+DISK_MARGIN = int(os.environ.get('L1GHT_DISK_MARGIN_MB', '256')) * 1024 * 1024
+
+
+class InsufficientSpace(Exception):
+    """A job's estimated size does not fit on the output volume"""
+
+
+def format_size(size):
+    return f"{size/1024/1024:.1f}MiB" if size is not None else "?"
+
+
+def parse_deadline(text, now=None):
+    """Epoch seconds for 'HH:MM' (the next one) or an ISO date and time"""
+    now = now or datetime.now()
+    try:
+        at = datetime.strptime(text, '%H:%M')
+    except ValueError:
+        return datetime.fromisoformat(text).timestamp()
+    at = now.replace(hour=at.hour, minute=at.minute, second=0, microsecond=0)
+    if at <= now:
+        at += timedelta(days=1)
+    return at.timestamp()
+
+
+def estimate_size(selected, duration=None):
+    """Estimated bytes of a selected (possibly merged) format, or None"""
+    total = 0
+    for fmt in selected.get('requested_formats') or [selected]:
+        size = fmt.get('filesize') or fmt.get('filesize_approx')
+        if not size and fmt.get('tbr') and duration:
+            size = fmt['tbr'] * 1000 / 8 * duration
+        if not size:
+            return None
+        total += size
+    return int(total)
+
+
+class PlannedJob:
+    """A queued URL with its preflight estimate"""
+
+    def __init__(self, url, deadline=None, clips=None):
+        self.url = url
+        self.deadline = deadline
+        self.clips = clips
+        self.title = None
+        self.size = None  # estimated bytes, None if unknown
+        self.reserve = 0  # bytes needed on disk while it runs
+        self.error = None  # why preflight failed; the download reports it properly
+        self.rejected = None
+        self.journal_id = None  # its row in the job journal, once queued there
+        self.info = None  # preflight metadata to download with when there is no cache
+
+    def __str__(self):
+        return self.url
+
+
+class Scheduler:
+    """Preflights, orders and admits batch jobs by size and free disk space"""
+
+    def __init__(self, output_path, quality='best', order='sjf', audio_format=None,
+                 use_cache=True, sessions=None, margin=DISK_MARGIN, clips=None):
+        self.output_path = output_path
+        self.clips = clips  # for jobs without clips of their own
+        self.quality = quality
+        self.order = order
+        self.accepted_audio = parse_audio_formats(audio_format)
+        self.use_cache = use_cache
+        self.sessions = sessions
+        self.margin = margin
+        self.running = {}  # PlannedJob -> bytes reserved
+        self.condition = threading.Condition()
+
+    @staticmethod
+    def parse(lines):
+        """PlannedJobs from 'URL [deadline] [*START-END ...]' lines"""
+        jobs = []
+        for line in lines:
+            url, *fields = line.split()
+            clips = [clip for field in fields if field.startswith('*') for clip in parse_clips(field)]
+            deadlines = [parse_deadline(field) for field in fields if not field.startswith('*')]
+            jobs.append(PlannedJob(url, deadlines[0] if deadlines else None, clips or None))
+        return jobs
+
+    def format_selector(self):
+        if self.quality == 'audio':
+            return audio_selector(self.accepted_audio)
+        return QUALITY_FORMATS.get(self.quality, 'best[ext=mp4]/best')
+
+    def preflight(self, job):
+        """Fill in the job's title and estimated size from its metadata"""
+        params = {'quiet': True, 'no_warnings': True}
+        try:
+            with checkout(params, self.sessions) as lease:
+                ydl = lease.ydl
+                ydl.format_selector = FormatResolver(ydl, format_chain(self.format_selector()), verbose=False)
+                info = fetch_info(ydl, job.url, self.use_cache)[0]
+                job.title = info.get('title')
+                if is_playlist(info):
+                    return job
+                if not self.use_cache:
+                    # Nothing to find it again in; the download starts from this
+                    job.info = info
+                selected = ydl.process_ie_result(dict(info), download=False)
+        except Exception as e:
+            job.error = str(e)
+            return job
+        job.size = estimate_size(selected, info.get('duration'))
+        clips = job.clips or self.clips
+        if job.size is not None and clips:
+            fraction = clip_fraction(clips, info.get('duration'))
+            job.size = int(job.size * fraction) if fraction is not None else job.size
+        if job.size is not None:
+            # The parts and the merged or converted output sit side by side
+            converts = selected.get('requested_formats') or self.quality == 'audio'
+            job.reserve = job.size * 2 if converts else job.size
+        return job
+
+    def plan(self, jobs, workers=4):
+        """Preflight every job concurrently and return them in run order"""
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='preflight') as pool:
+            list(pool.map(self.preflight, jobs))
+        unknown = float('inf')
+        if self.order == 'sjf':
+            jobs = sorted(jobs, key=lambda job: job.size if job.size is not None else unknown)
+        elif self.order == 'deadline':
+            jobs = sorted(jobs, key=lambda job: (job.deadline or unknown,
+                                                 job.size if job.size is not None else unknown))
+        return jobs
+
+    def free_space(self):
+        os.makedirs(self.output_path, exist_ok=True)
+        return shutil.disk_usage(self.output_path).free
+
+    def admit(self, job):
+        """Reserve room for the job; False if it does not fit right now"""
+        with self.condition:
+            needed = sum(self.running.values()) + job.reserve + self.margin
+            if job.reserve and needed > self.free_space():
+                return False
+            self.running[job] = job.reserve
+            return True
+
+    def release(self, job):
+        with self.condition:
+            self.running.pop(job, None)
+            self.condition.notify_all()
+
+    def dispatch(self, jobs):
+        """Yield the jobs in order as there is room; ones that never fit come out rejected"""
+        queue = list(jobs)
+        while queue:
+            with self.condition:
+                # Later jobs that fit go ahead of one that does not
+                admitted = next((job for job in queue if self.admit(job)), None)
+                if admitted is None and self.running:
+                    running = len(self.running)
+                    self.condition.wait_for(lambda: len(self.running) < running)
+                    continue
+            if admitted is not None:
+                queue.remove(admitted)
+                yield admitted
+                continue
+            job = queue.pop(0)
+            job.rejected = (f"needs {format_size(job.reserve)} but only "
+                            f"{format_size(max(0, self.free_space() - self.margin))} is free")
+            yield job
+
+    def run(self, job, download):
+        """Run download(job) for a dispatched job, releasing its room when it is done"""
+        if job.rejected:
+            raise InsufficientSpace(job.rejected)
+        try:
+            result = download(job)
+        except BaseException:
+            self.release(job)
+            raise
+        if isinstance(result, Future):
+            result.add_done_callback(lambda _: self.release(job))
+        else:
+            self.release(job)
+        return result
+
+    def print_plan(self, jobs, limit=10):
+        known = [job.size for job in jobs if job.size is not None]
+        print(f"🗂️ Schedule ({self.order}): {len(jobs)} job(s), {format_size(sum(known))} estimated"
+              f" ({len(jobs) - len(known)} unknown), {format_size(self.free_space())} free")
+        for number, job in enumerate(jobs[:limit], 1):
+            deadline = (f" by {datetime.fromtimestamp(job.deadline):%Y-%m-%d %H:%M}"
+                        if job.deadline else "")
+            print(f"  {number}. {format_size(job.size):>10}{deadline} {job.title or job.url}")
+        if len(jobs) > limit:
+            print(f"  ... and {len(jobs) - limit} more")
@@ -0,0 +1,156 @@
+"""Reusable YoutubeDL sessions.
+
+A YoutubeDL built for every download throws away its HTTP connections
+(keep-alive pools and TLS sessions), its cookie jar and its initialised
+extractors (YouTube's player cache, for one), so every job starts cold.
+SessionPool keeps finished YoutubeDL instances and hands them to the next
+job with only the per-job state reset: params, hooks, postprocessors, the
+format selector and the output streams. Connections, cookies and extractor
+instances carry over.
+
+Each running job has a session to itself, so the pool grows to the peak
+number of concurrent jobs. Connection settings (proxy, timeouts, cookies)
+come from the params the session was first built with; the per-job params
+this program passes never change them.
+"""
+
+import sys
+import threading
+from contextlib import contextmanager
+
+import yt_dlp
+from yt_dlp.utils import Namespace
+
+# Sessions kept for reuse; more concurrent jobs than this close theirs
+DEFAULT_MAX_IDLE = 8
+
+# Attributes a job sets on its YoutubeDL instance (see pipeline, metrics and diskio)
+JOB_OVERRIDES = ('post_process', 'to_screen', 'report_warning', 'dl', 'disk_io')
+
+# Params YoutubeDL.__init__ normalises and extractors or the networking
+# layer read later; they keep the values the session was built with
+SESSION_PARAMS = ('compat_opts', 'http_headers', 'js_runtimes', 'remote_components', 'color')
+
+
+def reset(ydl, params):
+    """Prepare a used YoutubeDL for a new job with `params`"""
+    for name in JOB_OVERRIDES:
+        ydl.__dict__.pop(name, None)
+
+    params = dict(params)
+    for key in SESSION_PARAMS:
+        if key in ydl.params:
+            params[key] = ydl.params[key]
+    params.setdefault('forceprint', {})
+    params.setdefault('print_to_file', {})
+    ydl.params = params
+    ydl._parse_outtmpl()
+    # As YoutubeDL.__init__ does; download_video replaces it with its resolver
+    ydl.format_selector = (
+        params.get('format') if params.get('format') in (None, '-')
+        else params['format'] if callable(params['format'])
+        else ydl.build_format_selector(params['format']))
+
+    ydl._pps = {when: [] for when in ydl._pps}
+    ydl._post_hooks = []
+    ydl._progress_hooks = []
+    ydl._postprocessor_hooks = []
+    for hook in params.get('post_hooks', []):
+        ydl.add_post_hook(hook)
+    for hook in params.get('progress_hooks', []):
+        ydl.add_progress_hook(hook)
+    for hook in params.get('postprocessor_hooks', []):
+        ydl.add_postprocessor_hook(hook)
+
+    ydl._download_retcode = 0
+    ydl._num_downloads = 0
+    ydl._num_videos = 0
+    ydl._playlist_level = 0
+    ydl._playlist_urls = set()
+
+    # Write to whatever stdout is now: a worker may route each job's output
+    out = sys.stderr if params.get('logtostderr') else sys.stdout
+    ydl._out_files = Namespace(
+        out=out, error=sys.stderr, screen=sys.stderr if params.get('quiet') else out,
+        console=ydl._out_files.console)
+
+
+class Lease:
+    """One job's use of a YoutubeDL
+
+    Released when the job's `with checkout(...)` block ends, unless hold()
+    was called: post-processing that runs later still needs the instance,
+    and releases it when done.
+    """
+
+    def __init__(self, ydl, pool=None):
+        self.ydl = ydl
+        self.pool = pool
+        self.held = False
+        self.released = False
+
+    def hold(self):
+        self.held = True
+
+    def release(self):
+        if self.released:
+            return
+        self.released = True
+        if self.pool is not None:
+            self.pool.release(self.ydl)
+        else:
+            self.ydl.__exit__(None, None, None)
+
+
+class SessionPool:
+    """Idle YoutubeDL instances, reused by the next job"""
+
+    def __init__(self, max_idle=DEFAULT_MAX_IDLE):
+        self.max_idle = max_idle
+        self.idle = []
+        self.created = 0
+        self.reused = 0
+        self.lock = threading.Lock()
+
+    def acquire(self, params):
+        with self.lock:
+            ydl = self.idle.pop() if self.idle else None
+            if ydl is None:
+                self.created += 1
+            else:
+                self.reused += 1
+        if ydl is None:
+            return yt_dlp.YoutubeDL(params)
+        reset(ydl, params)
+        return ydl
+
+    def release(self, ydl):
+        with self.lock:
+            if len(self.idle) < self.max_idle:
+                self.idle.append(ydl)
+                return
+        ydl.close()
+
+    def close(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for ydl in idle:
+            ydl.close()
+
+    def summary(self):
+        with self.lock:
+            return f"{self.created} session(s) for {self.created + self.reused} job(s)"
+
+
+@contextmanager
+def checkout(params, sessions=None):
+    """Lease a YoutubeDL for one job, from `sessions` (a SessionPool) or built fresh"""
+    if sessions is not None:
+        lease = Lease(sessions.acquire(params), sessions)
+    else:
+        lease = Lease(yt_dlp.YoutubeDL(params).__enter__())
+    try:
+        yield lease
+    finally:
+        if not lease.held:
+            lease.release()
@@ -0,0 +1,858 @@
+import asyncio
+import errno
+import io
+import json
+import math
+import os
+import subprocess
+import sys
+import threading
+import types
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import yt_dlp
+from yt_dlp.downloader.common import FileDownloader
+from yt_dlp.downloader.external import FFmpegFD
+from yt_dlp.extractor.common import InfoExtractor
+from yt_dlp.postprocessor.common import PostProcessor
+from yt_dlp.utils import PostProcessingError
+
+import aio
+import archive
+import audiostream
+import bandwidth
+import benchmark
+import clips
+import diskio
+import downloader
+import formats
+import fragments
+import journal
+import main
+import mediastore
+import metacache
+import metrics
+import paths
+import pipeline
+import progress
+import scheduler
+
+
+class StubIE(InfoExtractor):
+    """Offline extractor that counts how often it is asked to extract"""
+
+    _VALID_URL = r'stub://(?P<id>\w+)'
+    extractions = 0
+    formats = []
+    downloaded = []
+    sizes = {}  # video id -> filesize of every format
+    playlists = {}  # playlist id -> ids of its entries
+    titles = {}  # video id -> title, 'Stub video' by default
+
+    def _real_extract(self, url):
+        StubIE.extractions += 1
+        video_id = self._match_id(url)
+        if video_id in StubIE.playlists:
+            entries = [self.url_result(f'stub://{entry}', StubIE) for entry in StubIE.playlists[video_id]]
+            return self.playlist_result(entries, video_id, 'Stub playlist')
+        formats = [dict(f) for f in StubIE.formats]
+        if video_id in StubIE.sizes:
+            for f in formats:
+                f['filesize'] = StubIE.sizes[video_id]
+        return {
+            'id': video_id,
+            'title': StubIE.titles.get(video_id, 'Stub video'),
+            'duration': 42,
+            'formats': formats,
+        }
+
+
+class StubShortIE(InfoExtractor):
+    """Short links that only point on to the stub extractor's videos"""
+
+    _VALID_URL = r'stubshort://(?P<id>\w+)'
+
+    def _real_extract(self, url):
+        return self.url_result(f'stub://{self._match_id(url)}', StubIE)
+
+
+def stub_lookup_key(url):
+    """metacache.lookup_key for the stub extractors"""
+    for ie in (StubIE, StubShortIE):
+        if ie.suitable(url):
+            return ie.ie_key(), ie.get_temp_id(url)
+    return None
+
+
+class StubYoutubeDL(yt_dlp.YoutubeDL):
+    """YoutubeDL that only knows the stub extractors and fakes the transfer"""
+
+    def __init__(self, params=None, auto_init=True):
+        super().__init__(params, auto_init=False)
+        self.add_info_extractor(StubIE())
+        self.add_info_extractor(StubShortIE())
+
+    def dl(self, name, info, subtitle=False, test=False):
+        StubIE.downloaded.append(info.get('format_id'))
+        with open(name, 'wb') as f:
+            f.write(b'stub media')
+        return True, True  # (success, real_download)
+
+
+@pytest.fixture(autouse=True)
+def isolated_data_dir(monkeypatch, tmp_path):
+    # Keep caches and indexes out of the real home directory
+    monkeypatch.setattr(paths, 'DATA_DIR', tmp_path / 'data')
+    monkeypatch.setattr(metacache, '_shared_cache', None)
+    monkeypatch.setattr(archive, '_shared_archive', None)
+    monkeypatch.setattr(journal, '_shared_journal', None)
+    monkeypatch.setattr(mediastore, '_shared_store', None)
+    monkeypatch.setattr(metrics, '_shared_metrics', None)
+
+
+def setup_stub(monkeypatch, formats):
+    StubIE.extractions = 0
+    StubIE.formats = formats
+    StubIE.downloaded = []
+    StubIE.sizes = {}
+    StubIE.playlists = {}
+    StubIE.titles = {}
+    monkeypatch.setattr(main.yt_dlp, 'YoutubeDL', StubYoutubeDL)
+
+
+def test_download_extracts_once(monkeypatch, tmp_path):
+    setup_stub(monkeypatch, [
+        {'format_id': '18', 'url': 'http://127.0.0.1/18.mp4', 'ext': 'mp4',
+         'vcodec': 'avc1', 'acodec': 'mp4a', 'height': 360},
+    ])
+
+    main.download_video('stub://abc', str(tmp_path), 'best')
+
+    assert StubIE.extractions == 1
+    assert (tmp_path / 'Stub video.mp4').exists()
+
+
+def test_fallback_formats_reuse_extraction(monkeypatch, tmp_path):
+    # Only a 1080p webm exists, so the 720p chain fails and fallbacks kick in
+    setup_stub(monkeypatch, [
+        {'format_id': '248', 'url': 'http://127.0.0.1/248.webm', 'ext': 'webm',
+         'vcodec': 'vp9', 'acodec': 'opus', 'height': 1080},
+    ])
+
+    main.download_video('stub://abc', str(tmp_path), '720p')
+
+    assert StubIE.extractions == 1
+    assert (tmp_path / 'Stub video.webm').exists()
+
+
+def test_interrupted_job_resumes_with_same_format(monkeypatch, tmp_path):
+    setup_stub(monkeypatch, [
+        {'format_id': '18', 'url': 'http://127.0.0.1/18.mp4', 'ext': 'mp4',
+         'vcodec': 'avc1', 'acodec': 'mp4a', 'height': 360},
+        {'format_id': '22', 'url': 'http://127.0.0.1/22.mp4', 'ext': 'mp4',
+         'vcodec': 'avc1', 'acodec': 'mp4a', 'height': 720},
+    ])
+    # A killed process left format 18 half downloaded
+    jobs = journal.shared_journal()
+    job_id = jobs.add('stub://abc', str(tmp_path), 'best')
+    jobs.update(job_id, 'downloading', format_id='18', downloaded_bytes=5)
+    monkeypatch.setattr(journal, 'pid_alive', lambda pid: False)
+
+    main.download_video('stub://abc', str(tmp_path), 'best')
+
+    assert StubIE.downloaded == ['18']
+    assert jobs.get(job_id)['state'] == 'done'
+    assert jobs.unfinished() == []
+
+
+def test_find_interrupted_matches_only_the_same_dead_download(monkeypatch, tmp_path):
+    jobs = journal.shared_journal()
+    older = jobs.add('stub://abc', str(tmp_path), 'best')
+    newer = jobs.add('stub://abc', str(tmp_path), 'best')
+    running = jobs.add('stub://abc', str(tmp_path), 'best')
+    finished = jobs.add('stub://abc', str(tmp_path), 'best')
+    jobs.add('stub://abc', str(tmp_path), '720p')
+    jobs.add('stub://other', str(tmp_path), 'best')
+    jobs.update(finished, 'done')
+    for job_id, created in ((older, 1), (newer, 2), (running, 3), (finished, 4)):
+        jobs.update(job_id, pid=1 if job_id == running else 2)
+        jobs.db.execute('UPDATE jobs SET created = ? WHERE id = ?', (created, job_id))
+    checked = []
+    monkeypatch.setattr(journal, 'pid_alive', lambda pid: checked.append(pid) or pid == 1)
+
+    assert jobs.find_interrupted('stub://abc', 'best', str(tmp_path))['id'] == newer
+    # Only rows of the same download are looked at, newest first
+    assert checked == [1, 2]
+    assert jobs.find_interrupted('stub://abc', 'best', None) is None
+
+
+def test_accepted_audio_codec_is_kept_without_reencoding(monkeypatch, tmp_path):
+    setup_stub(monkeypatch, [
+        {'format_id': '251', 'url': 'http://127.0.0.1/251.webm', 'ext': 'webm',
+         'vcodec': 'none', 'acodec': 'opus', 'abr': 160},
+        {'format_id': '140', 'url': 'http://127.0.0.1/140.m4a', 'ext': 'm4a',
+         'vcodec': 'none', 'acodec': 'mp4a.40.2', 'abr': 128},
+    ])
+
+    filepath = main.download_video('stub://abc', str(tmp_path), 'audio', audio_format='m4a,mp3')
+
+    # The AAC source is preferred over the better Opus one and kept as is
+    assert StubIE.downloaded == ['140']
+    assert filepath == str(tmp_path / 'Stub video.m4a')
+
+
+def test_stale_cache_retry_keeps_the_job_metrics(monkeypatch, tmp_path):
+    setup_stub(monkeypatch, [
+        {'format_id': '18', 'url': 'http://127.0.0.1/18.mp4', 'ext': 'mp4',
+         'vcodec': 'avc1', 'acodec': 'mp4a', 'height': 360},
+    ])
+    monkeypatch.setattr(main, 'lookup_key', stub_lookup_key)
+    main.download_video('stub://abc', str(tmp_path / 'a'), 'best', use_store=False)
+
+    revoked = []
+    dl = StubYoutubeDL.dl
+
+    def dl_once_revoked(self, name, info, *args, **kwargs):
+        if not revoked:
+            revoked.append(info.get('format_id'))
+            raise yt_dlp.utils.DownloadError('HTTP Error 403: Forbidden')
+        return dl(self, name, info, *args, **kwargs)
+    monkeypatch.setattr(StubYoutubeDL, 'dl', dl_once_revoked)
+    job = metrics.JobMetrics('stub://abc', 'best')
+
+    main.download_video('stub://abc', str(tmp_path / 'b'), 'best', use_archive=False,
+                        use_store=False, job_metrics=job)
+
+    assert revoked and StubIE.extractions == 2
+    assert job.status == 'done' and job.cache == 'hit'
+    assert len(metrics.shared_metrics().jobs) == 2
+
+
+def test_download_records_phase_metrics(monkeypatch, tmp_path):
+    setup_stub(monkeypatch, [
+        {'format_id': '18', 'url': 'http://127.0.0.1/18.mp4', 'ext': 'mp4',
+         'vcodec': 'avc1', 'acodec': 'mp4a', 'height': 360},
+    ])
+
+    main.download_video('stub://abc', str(tmp_path), 'best')
+
+    registry = metrics.shared_metrics()
+    job, = registry.report()['jobs']
+    assert job['status'] == 'done'
+    assert {'extract', 'download', 'postprocess'} <= set(job['phases'])
+    assert 'l1ght_downloads_total{status="done"} 1' in registry.prometheus()
+
+
+def test_metadata_cache_expires_and_evicts_least_recently_used(monkeypatch, tmp_path):
+    now = [1000.0]
+    monkeypatch.setattr(metacache, 'time', types.SimpleNamespace(time=lambda: now[0]))
+    cache = metacache.MetadataCache(tmp_path / 'metadata.sqlite3', ttl=60, max_bytes=300)
+
+    cache.put('Stub', 'a', {'id': 'a'})
+    now[0] += 59
+    assert cache.get('Stub', 'a') == {'id': 'a'}
+    now[0] += 2
+    assert cache.get('Stub', 'a') is None
+
+    # Signed stream URLs end an entry early, and one already expired is not stored
+    expire = int(now[0]) + metacache.EXPIRY_MARGIN + 30
+    assert cache.put('Stub', 'b', {'id': 'b', 'formats': [{'url': f'https://cdn/v?expire={expire}'}]})
+    assert not cache.put('Stub', 'c', {'id': 'c', 'url': f'https://cdn/expire/{int(now[0])}/v'})
+    now[0] += 31
+    assert cache.get('Stub', 'b') is None
+
+    # Three entries of ~120 bytes do not fit; the least recently used goes
+    for number in range(3):
+        now[0] += 1
+        cache.put('Stub', f'd{number}', {'id': f'd{number}', 'title': 'x' * 100})
+        if number == 1:
+            now[0] += 1
+            cache.get('Stub', 'd0')
+    assert cache.get('Stub', 'd1') is None
+    assert cache.get('Stub', 'd0') and cache.get('Stub', 'd2')
+
+
+def test_short_link_is_planned_and_cached_under_its_video(monkeypatch, tmp_path):
+    setup_stub(monkeypatch, [
+        {'format_id': '18', 'url': 'http://127.0.0.1/18.mp4', 'ext': 'mp4',
+         'vcodec': 'avc1', 'acodec': 'mp4a', 'height': 360},
+    ])
+    monkeypatch.setattr(main, 'lookup_key', stub_lookup_key)
+
+    first = main.download_video('stubshort://abc', str(tmp_path / 'a'), 'best', use_archive=False)
+    main.download_video('stubshort://abc', str(tmp_path / 'b'), '720p', use_archive=False)
+
+    # Resolved before planning, so the first download was planned and
+    # stored; the second found its metadata through the short link's alias
+    assert StubIE.extractions == 1
+    assert metacache.shared_cache().canonical('StubShort', 'abc') == ('Stub', 'abc')
+    assert StubIE.downloaded == ['18']
+    assert os.path.samefile(first, tmp_path / 'b' / 'Stub video.mp4')
+
+
+def test_archive_skips_short_links_and_round_trips_through_the_cli(monkeypatch, tmp_path, capsys):
+    setup_stub(monkeypatch, [
+        {'format_id': '18', 'url': 'http://127.0.0.1/18.mp4', 'ext': 'mp4',
+         'vcodec': 'avc1', 'acodec': 'mp4a', 'height': 360},
+    ])
+    monkeypatch.setattr(main, 'lookup_key', stub_lookup_key)
+    imported = tmp_path / 'yt-dlp-archive.txt'
+    imported.write_text('stub xyz\nnot an entry line\n')
+
+    assert main.archive_main(['import', str(imported)]) == 0
+    # The short link's key only becomes known by extracting it
+    main.download_video('stubshort://xyz', str(tmp_path), 'best')
+    main.download_video('stubshort://xyz', str(tmp_path), 'best')
+    assert StubIE.extractions == 1
+    assert StubIE.downloaded == []
+
+    main.download_video('stub://abc', str(tmp_path), 'best')
+    exported = tmp_path / 'export.txt'
+    assert main.archive_main(['export', str(exported)]) == 0
+    assert exported.read_text() == 'stub xyz\nstub abc\n'
+
+    os.remove(tmp_path / 'Stub video.mp4')
+    with pytest.raises(SystemExit):
+        main.archive_main(['prune'])
+    main.archive_main(['prune', '--missing'])
+    assert len(archive.shared_archive()) == 1
+    main.archive_main(['prune', '--older-than', '0'])
+    assert len(archive.shared_archive()) == 0
+    assert 'Removed 1 entries' in capsys.readouterr().out
+
+
+def test_media_store_links_repeat_downloads_and_evicts(monkeypatch, tmp_path):
+    setup_stub(monkeypatch, [
+        {'format_id': '18', 'url': 'http://127.0.0.1/18.mp4', 'ext': 'mp4',
+         'vcodec': 'avc1', 'acodec': 'mp4a', 'height': 360},
+    ])
+
+    first = main.download_video('stub://abc', str(tmp_path / 'a'), 'best', use_archive=False)
+    second = main.download_video('stub://abc', str(tmp_path / 'b'), '720p', use_archive=False)
+
+    assert StubIE.downloaded == ['18']
+    assert second == str(tmp_path / 'b' / 'Stub video.mp4')
+    assert os.path.samefile(first, second)
+    # An unrelated file of the same size under that name is left alone
+    (tmp_path / 'c').mkdir()
+    (tmp_path / 'c' / 'Stub video.mp4').write_bytes(b'other file')
+    third = main.download_video('stub://abc', str(tmp_path / 'c'), 'best', use_archive=False)
+    assert third == str(tmp_path / 'c' / 'Stub video (1).mp4')
+    assert os.path.samefile(first, third)
+    assert (tmp_path / 'c' / 'Stub video.mp4').read_bytes() == b'other file'
+
+    store = mediastore.MediaStore(tmp_path / 'store' / 'objects', max_bytes=25)
+    for number in range(3):
+        path = tmp_path / f"{number}.mp4"
+        path.write_bytes(b'x' * 10)
+        store.put(str(number), str(path))
+        if number == 1:
+            store.lookup('0')
+    # Over the size cap the least recently used entry goes
+    assert store.lookup('1') is None
+    assert store.lookup('0') and store.lookup('2')
+    store.max_age = 0
+    assert store.prune() == 2
+
+    # Only a full copy would get a file on another filesystem into the store
+    def cross_device(*args):
+        raise OSError(errno.EXDEV, 'cross-device link')
+    monkeypatch.setattr(mediastore.os, 'link', cross_device)
+    monkeypatch.setattr(mediastore, 'reflink', cross_device)
+    store.max_age = 3600
+    assert store.put('3', str(tmp_path / '0.mp4')) is None
+    assert store.lookup('3') is None
+
+
+def test_archive_skip_links_the_file_without_the_store(monkeypatch, tmp_path):
+    setup_stub(monkeypatch, [
+        {'format_id': '18', 'url': 'http://127.0.0.1/18.mp4', 'ext': 'mp4',
+         'vcodec': 'avc1', 'acodec': 'mp4a', 'height': 360},
+    ])
+    monkeypatch.setattr(main, 'lookup_key', stub_lookup_key)
+
+    first = main.download_video('stub://abc', str(tmp_path / 'a'), 'best', use_store=False)
+    second = main.download_video('stub://abc', str(tmp_path / 'b'), 'best', use_store=False)
+
+    assert StubIE.extractions == 1
+    assert os.path.samefile(first, second)
+
+
+def run_worker(jobs):
+    """Events main.serve() answers to `jobs` (dicts, or raw lines as strings)"""
+    lines = ''.join((job if isinstance(job, str) else json.dumps(job)) + '\n' for job in jobs)
+    output = io.StringIO()
+    main.serve(io.StringIO(lines), output)
+    return [json.loads(line) for line in output.getvalue().splitlines()]
+
+
+def test_event_mode_rejects_a_missing_url(tmp_path):
+    result = subprocess.run([sys.executable, main.__file__, '--events', 'json'], capture_output=True,
+                            text=True, env=dict(os.environ, L1GHT_VIDEO_HOME=str(tmp_path)))
+
+    assert result.returncode == 2
+    assert result.stdout == ''
+    assert 'Usage: main.py --events json <url>' in result.stderr
+
+
+def test_worker_survives_broken_jobs(monkeypatch, tmp_path):
+    setup_stub(monkeypatch, [
+        {'format_id': '18', 'url': 'http://127.0.0.1/18.mp4', 'ext': 'mp4',
+         'vcodec': 'avc1', 'acodec': 'mp4a', 'height': 360},
+    ])
+    download_video = main.download_video
+
+    def flaky_download(url, *args, **kwargs):
+        if url == 'stub://boom':
+            raise RuntimeError('boom')
+        return download_video(url, *args, **kwargs)
+
+    monkeypatch.setattr(main, 'download_video', flaky_download)
+    events = run_worker(['[1, 2]', {'id': '1'}, {'id': '2', 'url': ''},
+                         {'id': '3', 'url': 'stub://boom'},
+                         {'id': '5', 'url': 'stub://abc', 'quality': 'audio', 'audio_format': 'wav'},
+                         {'id': '4', 'url': 'stub://abc', 'output_path': str(tmp_path)}])
+
+    errors = [(event['id'], event['message']) for event in events if event['event'] == 'error']
+    assert errors == [(None, 'Invalid job: not a JSON object'), ('1', 'Invalid job: no url'),
+                      ('2', 'Invalid job: no url'), ('3', 'Unexpected error: boom'),
+                      ('5', "Unknown audio format(s): 'wav' (choose from mp3, m4a, opus, vorbis, flac)")]
+    assert events[-1]['event'] == 'done' and events[-1]['id'] == '4'
+
+
+def test_worker_prefetch_summarises_qualities_and_download_skips_extraction(monkeypatch, tmp_path):
+    setup_stub(monkeypatch, [
+        {'format_id': '18', 'url': 'http://127.0.0.1/18.mp4', 'ext': 'mp4',
+         'vcodec': 'avc1', 'acodec': 'mp4a', 'height': 360},
+    ])
+    StubIE.sizes = {'abc': 5 * 1024 * 1024}
+    events = run_worker([{'cmd': 'prefetch', 'id': 'p1', 'url': 'stub://abc'},
+                         {'id': '1', 'url': 'stub://abc', 'output_path': str(tmp_path)}])
+
+    prefetched = next(event for event in events if event['event'] == 'prefetch')
+    assert (prefetched['title'], prefetched['duration']) == ('Stub video', 42)
+    assert prefetched['qualities']['720p'] == {'format_id': '18', 'ext': 'mp4', 'height': 360,
+                                               'size': 5 * 1024 * 1024}
+    assert [event['event'] for event in events if event.get('id') == '1'][-1] == 'done'
+    assert StubIE.extractions == 1
+
+
+def test_downloader_reuses_session_and_returns_failures(monkeypatch, tmp_path):
+    setup_stub(monkeypatch, [
+        {'format_id': '18', 'url': 'http://127.0.0.1/18.mp4', 'ext': 'mp4',
+         'vcodec': 'avc1', 'acodec': 'mp4a', 'height': 360},
+    ])
+
+    with downloader.Downloader(str(tmp_path), use_archive=False) as client:
+        first = client.download('stub://abc')
+        second = client.download('stub://def', output_path=str(tmp_path / 'other'))
+        failed = client.download('nothing://here')
+
+    assert first.ok and first.filepath == str(tmp_path / 'Stub video.mp4')
+    assert second.ok and second.filepath == str(tmp_path / 'other' / 'Stub video.mp4')
+    assert not failed.ok and failed.error
+    assert client.sessions.created == 1
+
+
+def test_async_api_streams_events_and_limits_concurrency(monkeypatch, tmp_path):
+    setup_stub(monkeypatch, [
+        {'format_id': '18', 'url': 'http://127.0.0.1/18.mp4', 'ext': 'mp4',
+         'vcodec': 'avc1', 'acodec': 'mp4a', 'height': 360},
+    ])
+
+    async def run(client):
+        events = [event async for event in client.stream('stub://abc')]
+        results = await asyncio.gather(*(client.download(f'stub://v{i}', output_path=str(tmp_path / str(i)))
+                                         for i in range(4)))
+        return events, results
+
+    client = aio.AsyncDownloader(limit=2, output_path=str(tmp_path), use_archive=False)
+    try:
+        events, results = asyncio.run(run(client))
+    finally:
+        client.close()
+
+    assert events[-1]['event'] == 'done'
+    assert events[-1]['filepath'] == str(tmp_path / 'Stub video.mp4')
+    assert 'metadata' in [event['event'] for event in events]
+    assert all(result.ok for result in results)
+    assert client.downloader.sessions.created <= 2
+
+
+def test_batch_runs_shortest_first_and_rejects_what_does_not_fit(monkeypatch, tmp_path, capsys):
+    setup_stub(monkeypatch, [
+        {'format_id': '18', 'url': 'http://127.0.0.1/18.mp4', 'ext': 'mp4',
+         'vcodec': 'avc1', 'acodec': 'mp4a', 'height': 360},
+    ])
+    StubIE.sizes = {'big': 8 * 1024 ** 3, 'small': 1024 ** 2, 'mid': 100 * 1024 ** 2}
+    monkeypatch.setattr(scheduler.shutil, 'disk_usage', lambda path: types.SimpleNamespace(free=1024 ** 3))
+
+    status = main.batch_main(['--order', 'sjf', '-j', '1', '--pp-workers', '0', '--no-archive',
+                              '-o', str(tmp_path), 'stub://big', 'stub://small', 'stub://mid'])
+
+    out = capsys.readouterr().out
+    started = [line.rsplit(' ', 1)[-1] for line in out.splitlines() if line.startswith('▶️')]
+    assert started == ['stub://small', 'stub://mid', 'stub://big']
+    assert status == 1
+    assert 'stub://big (needs 8192.0MiB but only' in out
+
+
+def test_batch_preflight_resolves_short_links_and_extracts_each_url_once(monkeypatch, tmp_path, capsys):
+    setup_stub(monkeypatch, [
+        {'format_id': '18', 'url': 'http://127.0.0.1/18.mp4', 'ext': 'mp4',
+         'vcodec': 'avc1', 'acodec': 'mp4a', 'height': 360},
+    ])
+    StubIE.sizes = {'big': 100 * 1024 ** 2, 'small': 1024 ** 2}
+    monkeypatch.setattr(main, 'lookup_key', stub_lookup_key)
+    monkeypatch.setattr(metacache, 'lookup_key', stub_lookup_key)
+    urls = ['stubshort://big', 'stubshort://small']
+
+    # Without the cache, the download starts from the preflight's metadata
+    main.batch_main(['--order', 'sjf', '-j', '1', '--pp-workers', '0', '--no-archive', '--no-cache',
+                     '--no-store', '-o', str(tmp_path / 'a')] + urls)
+    assert StubIE.extractions == 2
+    # With it, the download finds what the preflight stored
+    main.batch_main(['--order', 'sjf', '-j', '1', '--pp-workers', '0', '--no-archive',
+                     '--no-store', '-o', str(tmp_path / 'b')] + urls)
+    assert StubIE.extractions == 4
+
+    out = capsys.readouterr().out
+    started = [line.rsplit(' ', 1)[-1] for line in out.splitlines() if line.startswith('▶️')]
+    assert started == ['stubshort://small', 'stubshort://big'] * 2
+
+
+def test_batch_journals_every_url_before_the_first_starts(monkeypatch, tmp_path):
+    setup_stub(monkeypatch, [
+        {'format_id': '18', 'url': 'http://127.0.0.1/18.mp4', 'ext': 'mp4',
+         'vcodec': 'avc1', 'acodec': 'mp4a', 'height': 360},
+    ])
+    states = []
+    dl = StubYoutubeDL.dl
+
+    def recording_dl(self, name, info, *args, **kwargs):
+        states.append(journal.shared_journal().counts())
+        return dl(self, name, info, *args, **kwargs)
+
+    monkeypatch.setattr(StubYoutubeDL, 'dl', recording_dl)
+    status = main.batch_main(['-j', '1', '--pp-workers', '0', '--no-archive', '--no-store',
+                              '-o', str(tmp_path), 'stub://a', 'stub://b', 'stub://c'])
+
+    assert status == 0
+    # A batch killed here leaves two queued jobs for --journal resume
+    assert states[0] == {'queued': 2, 'extracting': 1}
+    assert journal.shared_journal().counts() == {'done': 3}
+    with pytest.raises(main.DownloadFailed):
+        main.download_video(None, str(tmp_path))
+
+
+def test_fragment_tuner_climbs_settles_and_backs_off():
+    tuner = fragments.FragmentTuner(start=2, maximum=16)
+
+    # Doubles while throughput improves by more than the gain threshold
+    assert tuner.record(2, 1000.0) == 4
+    assert tuner.record(4, 2000.0) == 8
+    # A small audio stream is not compared with the video streams
+    assert tuner.record(8, 100.0, stream='audio') == 8
+    # 5% faster at twice the level is a plateau: settle on the best level
+    assert tuner.record(8, 2100.0) == 4
+    assert tuner.settled
+    assert tuner.record(4, 1900.0) == 4
+
+    # Much slower at the settled level is throttling: halve and search again
+    assert tuner.record(4, 1000.0) == 2
+    assert not tuner.settled
+    assert tuner.failed() == 1
+    assert tuner.record(1, 500.0) == 2
+
+
+def test_fragment_tuner_compares_streams_by_bitrate():
+    tuner = fragments.FragmentTuner(start=2, maximum=16)
+
+    assert tuner.record(2, 1000.0, bitrate=500.0) == 4
+    # Half the bytes per second, but of a stream with a quarter the bitrate
+    assert tuner.record(4, 500.0, bitrate=125.0) == 8
+    assert tuner.record(8, 1050.0, bitrate=250.0) == 4
+
+
+def test_bandwidth_water_fills_by_weight_and_hands_on_finished_shares(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(bandwidth, 'monotonic', lambda: now[0])
+    mib = 1024 * 1024
+    manager = bandwidth.BandwidthManager(6 * mib)
+    heavy = manager.register('heavy', bandwidth.PRIORITIES['high'])
+    normal = manager.register('normal')
+    slow = manager.register('slow')
+    assert [heavy.rate, normal.rate, slow.rate] == [3 * mib, 1.5 * mib, 1.5 * mib]
+
+    def window(seconds, **used):
+        now[0] += seconds
+        for share in (heavy, normal, slow):
+            share.window_bytes = used.get(share.name, share.rate) * seconds
+
+    # The slow job only used a third of its share: it keeps what it needs
+    # plus headroom, and the rest is split 2:1 between the others
+    window(1, slow=0.5 * mib)
+    manager.rebalance(now[0])
+    assert slow.rate == pytest.approx(0.5 * mib * bandwidth.HEADROOM)
+    rest = 6 * mib - slow.rate
+    assert heavy.rate == pytest.approx(rest * 2 / 3)
+    assert normal.rate == pytest.approx(rest / 3)
+
+    # A finished job's share goes to the jobs that can use it
+    window(1, slow=0.5 * mib)
+    manager.unregister(heavy)
+    assert manager.jobs == [normal, slow]
+    assert slow.rate == pytest.approx(0.5 * mib * bandwidth.HEADROOM)
+    assert normal.rate == pytest.approx(rest)
+
+
+def test_progress_is_throttled_and_eta_follows_the_smoothed_speed():
+    now = [0.0]
+    rollups = []
+    tracker = progress.ProgressAggregator(interval=0.5, min_delta=1.0, heartbeat=2.0, smoothing=3.0,
+                                          on_rollup=rollups.append, rollup_interval=1.0,
+                                          clock=lambda: now[0])
+
+    def update(at, downloaded, status='downloading', key='a', total=1000000):
+        now[0] = at
+        return tracker.update(key, {'status': status, 'filename': f'{key}.mp4',
+                                    'downloaded_bytes': downloaded, 'total_bytes': total})
+
+    assert update(0.0, 0) == {'downloaded_bytes': 0, 'total_bytes': 1000000, 'percent': 0.0,
+                              'speed': None, 'eta': None}
+    # Within the interval nothing is reported, but the speed is sampled
+    assert update(0.2, 100000) is None
+    snapshot = update(0.6, 200000)
+    speed = 500000 + (1 - math.exp(-0.4 / 3.0)) * (250000 - 500000)
+    assert snapshot['speed'] == round(speed)
+    assert snapshot['eta'] == round(800000 / speed)
+    # Past the interval but less than min_delta percent further: held back
+    # until the heartbeat
+    assert update(1.2, 200500) is None
+    assert update(2.5, 201000) is None
+    assert update(2.7, 201500)['percent'] == 20.2
+    assert update(2.75, 1000000, 'finished')['percent'] == 100.0
+
+    # A second job brings rollups, at most once per rollup interval
+    update(2.8, 0, key='b')
+    update(3.0, 1000, key='b')
+    update(3.9, 2000, key='b')
+    assert [rollup['jobs'] for rollup in rollups] == [2, 2]
+
+
+def test_clip_ranges_parse_from_options_and_url_lines():
+    assert clips.clip_options('1:30', '2:00') == [(90.0, 120.0)]
+    assert clips.clip_options(clips='0:10-0:20,1:02:03.5-') == [(10.0, 20.0), (3723.5, clips.END)]
+    assert clips.describe_clips([(90.0, 120.0), (3723.5, clips.END)]) == '1:30-2:00, 1:02:03.5-end'
+    with pytest.raises(ValueError):
+        clips.parse_clips('2:00-1:00')
+
+    job, = scheduler.Scheduler.parse(['https://example.com/v *1:00-1:05 *2:00- 18:30'])
+    assert job.url == 'https://example.com/v'
+    assert job.clips == [(60.0, 65.0), (120.0, clips.END)]
+    assert job.deadline is not None
+
+
+class ProbeHandler(BaseHTTPRequestHandler):
+    """Streams that answer (/ok), refuse (/dead) or hang (/slow)"""
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.startswith('/slow'):
+            threading.Event().wait(2)
+        self.send_response(403 if self.path.startswith('/dead') else 206)
+        self.send_header('Content-Length', '1')
+        self.end_headers()
+        self.wfile.write(b'x')
+
+
+def test_clip_downloads_find_ffmpeg_without_touching_path(monkeypatch, tmp_path):
+    location = tmp_path / 'bin'
+    location.mkdir()
+    fake_ffmpeg = location / 'ffmpeg'
+    fake_ffmpeg.write_text(f'#!{sys.executable}\nprint("ffmpeg version 6.0 Copyright (c) 2000-2023")\n')
+    fake_ffmpeg.chmod(0o755)
+    monkeypatch.setenv('PATH', str(tmp_path / 'empty'))
+
+    params = clips.ydl_clip_params([(1.0, 2.0)], ffmpeg_location=str(location))
+    assert params['ffmpeg_location'] == str(location)
+    assert os.environ['PATH'] == str(tmp_path / 'empty')
+
+    ydl = yt_dlp.YoutubeDL(dict(params, quiet=True))
+    info = {'url': 'http://127.0.0.1/v.mp4', 'protocol': 'http'}
+    original = FFmpegFD.__dict__['available']
+    with clips.ffmpeg_from_location(ydl):
+        assert FFmpegFD.can_download(info)
+    # Elsewhere only PATH counts, as before, and yt-dlp is left as it was
+    assert not FFmpegFD.can_download(info)
+    assert FFmpegFD.__dict__['available'] is original
+
+
+def test_hedged_selection_skips_dead_and_slow_streams(monkeypatch, tmp_path):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ProbeHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f'http://127.0.0.1:{server.server_address[1]}'
+    setup_stub(monkeypatch, [
+        {'format_id': '18', 'url': f'{base}/ok', 'ext': 'mp4', 'vcodec': 'avc1', 'acodec': 'mp4a', 'height': 360},
+        {'format_id': '43', 'url': f'{base}/dead', 'ext': 'webm', 'vcodec': 'vp8', 'acodec': 'vorbis', 'height': 480},
+        {'format_id': '37', 'url': f'{base}/slow', 'ext': 'mp4', 'vcodec': 'avc1', 'acodec': 'mp4a', 'height': 1080},
+    ])
+    monkeypatch.setattr(formats, 'HEDGE_TIMEOUT', 0.5)
+    races = []
+    race = formats.FormatResolver.race
+
+    def counted_race(self, candidates):
+        races.append(len(candidates))
+        return race(self, candidates)
+    monkeypatch.setattr(formats.FormatResolver, 'race', counted_race)
+
+    try:
+        main.download_video('stub://abc', str(tmp_path), 'best', hedge=True)
+    finally:
+        server.shutdown()
+
+    # 37 hangs past the timeout and 43 is refused, so the best live one wins;
+    # the download's second format selection reuses the planned decision
+    assert StubIE.downloaded == ['18']
+    assert races == [3]
+
+
+class StubExtractAudioPP(PostProcessor):
+    """Stands in for FFmpegExtractAudio and records where it ran"""
+
+    threads = []
+
+    def __init__(self, downloader=None, preferredcodec=None, preferredquality=None):
+        super().__init__(downloader)
+
+    def run(self, info):
+        StubExtractAudioPP.threads.append(threading.current_thread().name)
+        return [], info
+
+
+def test_postprocessing_runs_on_pool(monkeypatch, tmp_path):
+    setup_stub(monkeypatch, [
+        {'format_id': '251', 'url': 'http://127.0.0.1/251.webm', 'ext': 'webm',
+         'vcodec': 'none', 'acodec': 'opus', 'abr': 160},
+    ])
+    StubExtractAudioPP.threads = []
+    monkeypatch.setattr(main, 'FFmpegExtractAudioPP', StubExtractAudioPP)
+    pool = pipeline.PostProcessPool(1)
+
+    future = main.download_video('stub://abc', str(tmp_path), 'audio', stream_audio=False,
+                                 postprocess=pool)
+    filepath = future.result(timeout=10)
+    pool.shutdown()
+
+    # The transcode ran on the pool, not on the downloading thread
+    assert StubExtractAudioPP.threads and StubExtractAudioPP.threads[0].startswith('postprocess')
+    assert filepath == str(tmp_path / 'Stub video.webm')
+    assert {'extract', 'download', 'queued', 'postprocess'} <= set(future.timings)
+
+
+def test_streamed_transcode_requests_ranged_chunks(monkeypatch, tmp_path):
+    # ffmpeg stand-in: copies the piped input to its output file
+    fake_ffmpeg = tmp_path / 'ffmpeg'
+    fake_ffmpeg.write_text(f'#!{sys.executable}\n'
+                           'import shutil, sys\n'
+                           'shutil.copyfileobj(sys.stdin.buffer, open(sys.argv[-1], "wb"))\n')
+    fake_ffmpeg.chmod(0o755)
+    monkeypatch.setattr(audiostream, 'ffmpeg_executable', lambda ydl: str(fake_ffmpeg))
+    media = tmp_path / 'media'
+    media.mkdir()
+    data = os.urandom(250 * 1024)
+    (media / 'audio.webm').write_bytes(data)
+
+    with benchmark.MediaServer(media_dir=str(media)) as server:
+        ydl = yt_dlp.YoutubeDL({'quiet': True})
+        info = {'url': f'http://{server.host}/media/audio.webm', 'ext': 'webm', 'protocol': 'http',
+                'downloader_options': {'http_chunk_size': 100 * 1024}}
+        audiostream.stream_transcode(ydl, info, str(tmp_path / 'chunked.mp3'))
+        chunked = server.requests
+        del info['downloader_options']
+        audiostream.stream_transcode(ydl, info, str(tmp_path / 'whole.mp3'))
+
+    assert chunked == 3 and server.requests == 4
+    assert (tmp_path / 'chunked.mp3').read_bytes() == data
+    assert (tmp_path / 'whole.mp3').read_bytes() == data
+
+
+def test_playlist_downloads_every_entry_of_nested_playlists(monkeypatch, tmp_path):
+    setup_stub(monkeypatch, [
+        {'format_id': '18', 'url': 'http://127.0.0.1/18.mp4', 'ext': 'mp4',
+         'vcodec': 'avc1', 'acodec': 'mp4a', 'height': 360},
+    ])
+    StubIE.playlists = {'channel': ['a', 'season'], 'season': ['b', 'c']}
+    StubIE.titles = {'a': 'A', 'b': 'B', 'c': 'C'}
+
+    main.download_video('stub://channel', str(tmp_path / 'out'), 'best', workers=2)
+
+    assert sorted(f.name for f in (tmp_path / 'out').iterdir()) == ['A.mp4', 'B.mp4', 'C.mp4']
+    assert StubIE.extractions == 5
+    rows = journal.shared_journal().db.execute('SELECT id, url, parent, state FROM jobs').fetchall()
+    ids = {url: job_id for job_id, url, parent, state in rows}
+    parents = {url: parent for job_id, url, parent, state in rows}
+    # Each entry is recorded under the playlist it was listed in
+    assert parents['stub://a'] == ids['stub://channel']
+    assert parents['stub://b'] == parents['stub://c'] == ids['stub://season']
+    assert {state for job_id, url, parent, state in rows} == {'done'}
+
+
+class FailingExtractAudioPP(StubExtractAudioPP):
+    def run(self, info):
+        raise PostProcessingError('transcode failed')
+
+
+def test_playlist_counts_failed_deferred_postprocessing(monkeypatch, tmp_path):
+    setup_stub(monkeypatch, [
+        {'format_id': '251', 'url': 'http://127.0.0.1/251.webm', 'ext': 'webm',
+         'vcodec': 'none', 'acodec': 'opus', 'abr': 160},
+    ])
+    StubIE.playlists = {'list': ['a', 'b']}
+    monkeypatch.setattr(main, 'FFmpegExtractAudioPP', FailingExtractAudioPP)
+    pool = pipeline.PostProcessPool(1)
+
+    with pytest.raises(main.DownloadFailed, match='2 of 2 playlist entries failed'):
+        main.download_video('stub://list', str(tmp_path), 'audio', stream_audio=False,
+                            postprocess=pool, workers=2)
+    pool.shutdown()
+
+    assert StubIE.extractions == 3
+    assert journal.shared_journal().counts() == {'failed': 3}
+
+
+def test_disk_io_writes_aligned_pieces_and_delivers_from_scratch(tmp_path):
+    scratch = tmp_path / 'scratch'
+    output = tmp_path / 'out'
+    disk_io = benchmark.counting_disk_io(write_buffer=256 * 1024, preallocate=True, http_chunk='auto',
+                                         scratch_dir=str(scratch))
+    original = FileDownloader.__dict__['sanitize_open']
+    assert original is not diskio.sanitize_open
+    with benchmark.MediaServer(size=1024 * 1024 + 123) as server, benchmark.bench_downloader():
+        suite = benchmark.BenchSuite(server, tmp_path)
+        with benchmark.silenced():
+            filepath = suite.download(server.url('progressive', 'v1'), str(output), disk_io=disk_io)
+
+    assert filepath == str(output / 'progressive-v1.mp4')
+    assert (output / 'progressive-v1.mp4').stat().st_size == server.size
+    assert not [f for f in scratch.rglob('*') if f.is_file()]
+    # Every write but the last ends on an alignment boundary of the file
+    ends = [sum(disk_io.counts[:i + 1]) for i in range(len(disk_io.counts))]
+    assert all(end % diskio.WRITE_ALIGNMENT == 0 for end in ends[:-1])
+    assert server.host in disk_io.chunks.rates
+    # yt-dlp's own method is only wrapped while a tuned job downloads
+    assert FileDownloader.__dict__['sanitize_open'] is original
+
+
+def test_benchmark_runs_offline(tmp_path):
+    with benchmark.MediaServer(size=256 * 1024, segment_size=64 * 1024) as server:
+        suite = benchmark.BenchSuite(server, tmp_path, runs=1, concurrency=[2], batch_jobs=2)
+        results = suite.run(['throughput', 'batch'])
+
+    metrics = benchmark.flatten(results)
+    assert all(metrics[f'throughput.{kind}_mib_s'] > 0 for kind in benchmark.KINDS)
+    assert results['batch'][0]['failed'] == 0
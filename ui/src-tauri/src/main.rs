@@ -1,12 +1,33 @@
 // Prevents additional console window on Windows in release, DO NOT REMOVE!!
 #![cfg_attr(not(debug_assertions), windows_subsystem = "windows")]
 
-use std::process::Command;
+use std::collections::HashMap;
+use std::io::{BufRead, BufReader, Write};
+use std::path::PathBuf;
+use std::process::{Child, ChildStdin, ChildStdout, Command, Stdio};
+use std::sync::atomic::{AtomicU64, Ordering};
+use std::sync::mpsc::{channel, Receiver, Sender};
+use std::sync::{Arc, Mutex};
+use std::thread;
 
-#[tauri::command]
-async fn download_video(url: String, output_path: String, quality: String) -> Result<String, String> {
-    use std::path::PathBuf;
-    
+/// Job id -> where that job's events go
+type JobEvents = Arc<Mutex<HashMap<String, Sender<serde_json::Value>>>>;
+
+/// Long-lived `main.py --serve` process that keeps yt-dlp warm between downloads.
+/// A reader thread owns its stdout and hands every event to the job it belongs
+/// to, so the worker lock is only held while a job is sent.
+struct ServeWorker {
+    child: Child,
+    stdin: ChildStdin,
+    jobs: JobEvents,
+}
+
+#[derive(Default)]
+struct WorkerState(Mutex<Option<ServeWorker>>);
+
+static NEXT_JOB_ID: AtomicU64 = AtomicU64::new(1);
+
+fn find_main_script() -> Result<PathBuf, String> {
     // Get the project root directory
     // In development, we need to go up from ui/src-tauri/target/debug
     // In production, the script should be bundled or in a known location
@@ -35,41 +56,169 @@ async fn download_video(url: String, output_path: String, quality: String) -> Re
     // Absolute fallback
     potential_paths.push(PathBuf::from("D:/projects/youtube_download/main.py"));
     
-    let mut script_path = None;
-    for path in &potential_paths {
-        if path.exists() {
-            script_path = Some(path.clone());
-            break;
+    potential_paths
+        .iter()
+        .find(|path| path.exists())
+        .cloned()
+        .ok_or_else(|| format!("Could not find main.py. Searched in: {:?}", potential_paths))
+}
+
+fn spawn_worker() -> Result<ServeWorker, String> {
+    let script_path = find_main_script()?;
+    println!("Starting download worker: {:?} --serve", script_path);
+
+    let mut child = Command::new("python")
+        .arg(&script_path)
+        .arg("--serve")
+        .stdin(Stdio::piped())
+        .stdout(Stdio::piped())
+        .spawn()
+        .map_err(|e| format!("Failed to execute Python command: {}. Make sure Python is installed and in PATH.", e))?;
+
+    let stdin = child.stdin.take().ok_or("Failed to open worker stdin")?;
+    let stdout = child.stdout.take().ok_or("Failed to open worker stdout")?;
+
+    let jobs: JobEvents = Arc::default();
+    let reader_jobs = Arc::clone(&jobs);
+    thread::spawn(move || read_events(BufReader::new(stdout), reader_jobs));
+
+    Ok(ServeWorker { child, stdin, jobs })
+}
+
+/// Forward each event the worker prints to the job waiting for it. A job stops
+/// listening after its `done` or `error`; when the worker exits, the channels of
+/// all jobs still waiting are closed.
+fn read_events(stdout: BufReader<ChildStdout>, jobs: JobEvents) {
+    for line in stdout.lines() {
+        let line = match line {
+            Ok(line) => line,
+            Err(_) => break,
+        };
+        let event: serde_json::Value = match serde_json::from_str(line.trim()) {
+            Ok(event) => event,
+            Err(_) => continue,
+        };
+        let job_id = match event["id"].as_str() {
+            Some(job_id) => job_id.to_string(),
+            None => continue,
+        };
+        let finished = matches!(event["event"].as_str(), Some("done") | Some("error"));
+
+        let mut jobs = match jobs.lock() {
+            Ok(jobs) => jobs,
+            Err(_) => break,
+        };
+        if let Some(events) = jobs.get(&job_id) {
+            let _ = events.send(event);
+        }
+        if finished {
+            jobs.remove(&job_id);
         }
     }
-    
-    let script_path = script_path
-        .ok_or_else(|| format!("Could not find main.py. Searched in: {:?}", potential_paths))?;
+    if let Ok(mut jobs) = jobs.lock() {
+        jobs.clear();
+    }
+}
 
-    println!("Using Python script at: {:?}", script_path);
+/// Wait for the events of one job until its `done` or `error` event.
+/// Every event except `log` is forwarded to the window as `download-event` so the
+/// UI can show live progress.
+fn run_job(window: &tauri::Window, events: Receiver<serde_json::Value>) -> Result<String, String> {
+    let mut output = String::new();
+    loop {
+        let event = match events.recv() {
+            Ok(event) => event,
+            Err(_) => return Err(format!("Download worker exited unexpectedly. Output: {}", output)),
+        };
+
+        if event["event"].as_str() == Some("log") {
+            let message = event["message"].as_str().unwrap_or_default();
+            println!("Python: {}", message);
+            output.push_str(message);
+            output.push('\n');
+            continue;
+        }
+
+        let _ = window.emit("download-event", event.clone());
+        match event["event"].as_str() {
+            Some("done") => return Ok(output),
+            Some("error") => {
+                return Err(event["message"].as_str().unwrap_or("unknown error").to_string());
+            }
+            _ => {}
+        }
+    }
+}
+
+/// Start a job on the worker, (re)starting the worker if it has never run or
+/// has exited, and return the receiver of the job's events
+fn send_job(state: &WorkerState, job_id: &str, job: &serde_json::Value) -> Result<Receiver<serde_json::Value>, String> {
+    let mut guard = state.0.lock().map_err(|_| "Download worker lock poisoned".to_string())?;
+
+    let alive = guard
+        .as_mut()
+        .map_or(false, |worker| matches!(worker.child.try_wait(), Ok(None)));
+    if !alive {
+        *guard = Some(spawn_worker()?);
+    }
+    let worker = guard.as_mut().ok_or("Download worker is not running")?;
+
+    // Listen before sending, so no event of the job can be missed
+    let (sender, events) = channel();
+    worker.jobs.lock()
+        .map_err(|_| "Download worker lock poisoned".to_string())?
+        .insert(job_id.to_string(), sender);
+
+    let sent = writeln!(worker.stdin, "{}", job).and_then(|_| worker.stdin.flush());
+    if let Err(e) = sent {
+        if let Ok(mut jobs) = worker.jobs.lock() {
+            jobs.remove(job_id);
+        }
+        return Err(format!("Failed to send job to download worker: {}", e));
+    }
+    Ok(events)
+}
+
+#[tauri::command]
+async fn download_video(
+    window: tauri::Window,
+    state: tauri::State<'_, WorkerState>,
+    url: String,
+    output_path: String,
+    quality: String,
+) -> Result<String, String> {
     println!("Downloading: {} to {} with quality: {}", url, output_path, quality);
 
-    // Execute Python script
-    let output = Command::new("python")
-        .arg(&script_path)
-        .arg(&url)
-        .arg(&output_path)
-        .arg(&quality)
-        .output()
-        .map_err(|e| format!("Failed to execute Python command: {}. Make sure Python is installed and in PATH.", e))?;
+    let job_id = NEXT_JOB_ID.fetch_add(1, Ordering::SeqCst).to_string();
+    let job = serde_json::json!({
+        "id": job_id,
+        "url": url,
+        "output_path": output_path,
+        "quality": quality,
+    });
 
-    let stdout = String::from_utf8_lossy(&output.stdout);
-    let stderr = String::from_utf8_lossy(&output.stderr);
-    
-    println!("Python stdout: {}", stdout);
-    if !stderr.is_empty() {
-        println!("Python stderr: {}", stderr);
+    let result = match send_job(&state, &job_id, &job) {
+        // Blocking reads run on tauri's blocking pool, not on an async worker
+        // thread, and without the worker lock, so other commands go ahead
+        Ok(events) => tauri::async_runtime::spawn_blocking(move || run_job(&window, events))
+            .await
+            .unwrap_or_else(|e| Err(format!("Download task failed: {}", e))),
+        Err(error) => Err(error),
+    };
+
+    // Drop a dead worker so the next download starts a fresh one
+    if let Ok(mut guard) = state.0.lock() {
+        let dead = guard
+            .as_mut()
+            .map_or(false, |worker| !matches!(worker.child.try_wait(), Ok(None)));
+        if dead {
+            *guard = None;
+        }
     }
 
-    if output.status.success() {
-        Ok(format!("Download completed! Output: {}", stdout))
-    } else {
-        Err(format!("Download failed: {}", stderr))
+    match result {
+        Ok(output) => Ok(format!("Download completed! Output: {}", output)),
+        Err(error) => Err(format!("Download failed: {}", error)),
     }
 }
 
@@ -139,6 +288,7 @@ async fn open_file_location(file_path: String) -> Result<String, String> {
 
 fn main() {
     tauri::Builder::default()
+        .manage(WorkerState::default())
         .invoke_handler(tauri::generate_handler![download_video, open_folder, open_file_location])
         .run(tauri::generate_context!())
         .expect("error while running tauri application");
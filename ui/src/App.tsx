@@ -19,12 +19,39 @@ import {
   Square
 } from 'lucide-react'
 import { invoke } from '@tauri-apps/api/tauri'
+import { listen } from '@tauri-apps/api/event'
 import { open } from '@tauri-apps/api/dialog'
 import { homeDir } from '@tauri-apps/api/path'
 import { getCurrent } from '@tauri-apps/api/window'
 
 const appWindow = getCurrent()
 
+// JSON event from the Python worker (see events.py)
+interface DownloadEvent {
+  event: 'metadata' | 'phase' | 'progress' | 'postprocess' | 'done' | 'error'
+  id: string
+  title?: string
+  phase?: string
+  percent?: number | null
+  speed?: number | null
+  eta?: number | null
+  postprocessor?: string
+  status?: string
+  message?: string
+}
+
+const PHASE_MESSAGES: Record<string, string> = {
+  extracting: 'Fetching video info...',
+  downloading: 'Downloading video...',
+  postprocessing: 'Processing and merging...',
+}
+
+const formatEta = (seconds: number) => {
+  const mins = Math.floor(seconds / 60)
+  const secs = Math.floor(seconds % 60)
+  return mins > 0 ? `${mins}m ${secs}s` : `${secs}s`
+}
+
 interface DownloadStatus {
   status: 'idle' | 'downloading' | 'success' | 'error'
   progress: number
@@ -134,31 +161,34 @@ function App() {
       message: 'Starting download...'
     })
 
-    try {
-      const progressInterval = setInterval(() => {
-        setDownloadStatus(prev => {
-          if (prev.progress < 90) {
-            return {
-              ...prev,
-              progress: prev.progress + 5,
-              message: prev.progress < 50 ? 'Downloading video...' : 'Processing and merging...'
-            }
-          }
-          return prev
-        })
-        // Simulate speed
-        setDownloadSpeed(`${(Math.random() * 5 + 2).toFixed(1)} MB/s`)
-        setEta(`${Math.floor(Math.random() * 60)}s`)
-      }, 500)
+    // Live progress straight from the worker's events
+    const unlisten = await listen<DownloadEvent>('download-event', ({ payload }) => {
+      if (payload.event === 'metadata' && payload.title) {
+        setDownloadStatus(prev => ({ ...prev, message: payload.title! }))
+      } else if (payload.event === 'phase' && payload.phase && PHASE_MESSAGES[payload.phase]) {
+        setDownloadStatus(prev => ({ ...prev, message: PHASE_MESSAGES[payload.phase!] }))
+      } else if (payload.event === 'progress') {
+        if (payload.percent != null) {
+          setDownloadStatus(prev => ({ ...prev, progress: Math.round(payload.percent!) }))
+        }
+        if (payload.speed) {
+          setDownloadSpeed(`${(payload.speed / 1024 / 1024).toFixed(1)} MB/s`)
+        }
+        if (payload.eta != null) {
+          setEta(formatEta(payload.eta))
+        }
+      } else if (payload.event === 'postprocess' && payload.status === 'started') {
+        setDownloadStatus(prev => ({ ...prev, message: `${payload.postprocessor}...` }))
+      }
+    })
 
+    try {
       await invoke('download_video', { 
         url: url.trim(), 
         outputPath: outputPath, 
         quality: quality 
       })
 
-      clearInterval(progressInterval)
-
       setDownloadStatus({
         status: 'success',
         progress: 100,
@@ -197,6 +227,8 @@ function App() {
         progress: 0,
         message: `Error: ${error}`
       })
+    } finally {
+      unlisten()
     }
   }
 